@@ -0,0 +1,3 @@
+"""
+Serving infrastructure shared by the NILM and PV Flask APIs
+"""
@@ -0,0 +1,214 @@
+"""
+Load-testing and microbenchmark helpers shared by the service benchmarks
+
+A client posts to the Flask app either in-process (Flask test client, one per
+thread) or over HTTP against a running server. run_load() drives a request
+factory from `concurrency` threads and reports throughput and latency
+percentiles; microbench() times a plain function call. Results are written
+as JSON and can be compared against an earlier run to spot regressions.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class InProcessClient:
+    """Posts through Flask test clients (one per thread) without a server"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def post(self, path, json=None, data=None, headers=None, query=None):
+        response = self._client().post(path, json=json, data=data, headers=headers,
+                                       query_string=query)
+        response.get_data()
+        return response.status_code
+
+    def post_json(self, path, json=None, query=None):
+        """(status code, decoded JSON body)"""
+        response = self._client().post(path, json=json, query_string=query)
+        return response.status_code, response.get_json(silent=True)
+
+    def get(self, path):
+        return self._client().get(path).status_code
+
+
+class HttpClient:
+    """Posts to a running server (one keep-alive session per thread)"""
+
+    def __init__(self, base_url):
+        import requests
+        self._requests = requests
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session
+
+    def post(self, path, json=None, data=None, headers=None, query=None):
+        response = self._session().post(self.base_url + path, json=json, data=data,
+                                        headers=headers, params=query)
+        return response.status_code
+
+    def post_json(self, path, json=None, query=None):
+        """(status code, decoded JSON body)"""
+        response = self._session().post(self.base_url + path, json=json, params=query)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def get(self, path):
+        return self._session().get(self.base_url + path).status_code
+
+
+def latency_summary(latencies):
+    """Mean and p50/p95/p99/max of latencies in seconds, reported in ms"""
+    if len(latencies) == 0:
+        return {'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    ms = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(ms.max())
+    }
+
+
+def run_load(send, concurrency=1, requests=100, warmup=5):
+    """
+    Call send(i) -> status code `requests` times from `concurrency` threads.
+    Returns throughput, latency percentiles and status counts.
+    """
+    for i in range(warmup):
+        send(i)
+
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+
+    def worker(w):
+        for i in range(w, requests, concurrency):
+            start = time.perf_counter()
+            try:
+                status = send(i)
+            except Exception:
+                status = 'exception'
+            latencies[w].append(time.perf_counter() - start)
+            statuses[w][status] = statuses[w].get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    status_counts = {}
+    for counts in statuses:
+        for status, n in counts.items():
+            status_counts[str(status)] = status_counts.get(str(status), 0) + n
+    all_latencies = [t for worker_latencies in latencies for t in worker_latencies]
+    errors = sum(n for status, n in status_counts.items() if status != '200')
+    return dict(latency_summary(all_latencies),
+                concurrency=concurrency,
+                requests=requests,
+                elapsed_s=elapsed,
+                throughput_rps=requests / elapsed if elapsed > 0 else None,
+                errors=errors,
+                status_counts=status_counts)
+
+
+def microbench(fn, number=100, repeat=5, warmup=3):
+    """Time fn() `number` times per repeat; per-call latency summary over repeats"""
+    for _ in range(warmup):
+        fn()
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number)
+    return dict(latency_summary(per_call), number=number, repeat=repeat,
+                calls_per_s=1.0 / min(per_call) if min(per_call) > 0 else None)
+
+
+def environment():
+    """Machine and library details recorded next to every result set"""
+    info = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['torch_threads'] = torch.get_num_threads()
+    except Exception:
+        pass
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                            capture_output=True, text=True,
+                                            timeout=5).stdout.strip() or None
+    except Exception:
+        info['git_commit'] = None
+    return info
+
+
+def write_results(path, results, config):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'config': config, 'results': results},
+                  f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+def compare_results(baseline_path, results, metric='p50_ms', threshold=0.10):
+    """Print scenarios whose `metric` moved by more than threshold vs a baseline file"""
+    with open(baseline_path) as f:
+        baseline = {r['name']: r for r in json.load(f)['results']}
+
+    print(f"\nComparison against {baseline_path} ({metric}, threshold {threshold:.0%}):")
+    regressions = 0
+    for result in results:
+        old = baseline.get(result['name'], {}).get(metric)
+        new = result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = ''
+        if change > threshold:
+            flag = '  <-- slower'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"  {result['name']:<60} {old:10.3f} -> {new:10.3f} ({change:+.1%}){flag}")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+def print_result(result):
+    if 'throughput_rps' in result:
+        print(f"  {result['name']:<60} {result['throughput_rps']:9.1f} req/s  "
+              f"p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+              f"p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}")
+    else:
+        print(f"  {result['name']:<60} {result['calls_per_s']:11.1f} calls/s  "
+              f"p50 {result['p50_ms']:8.3f} ms")
@@ -0,0 +1,185 @@
+"""
+Lightweight request/stage latency metrics in Prometheus text format
+
+Collection is off until /metrics is scraped for the first time (or the
+service starts with collection forced on), so an unscraped service only pays
+for a flag check per stage. Recorded series:
+    <prefix>_requests_total{endpoint,status}
+    <prefix>_request_latency_seconds{endpoint}          histogram
+    <prefix>_stage_latency_seconds{endpoint,model,stage} histogram
+    <prefix>_request_bytes{endpoint}                     histogram
+    <prefix>_batch_size{endpoint,model}                  histogram
+    <prefix>_errors_total{endpoint}
+"""
+
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 8, 64, 288, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    """Escape backslashes, double quotes and newlines in a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTimer:
+    """Stand-in used while collection is off"""
+    model = None
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def batch_size(self, size):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+NULL_TIMER = _NullTimer()
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.metrics.observe_stage(self.timer.endpoint, self.timer.model or '',
+                                         self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RequestTimer:
+    """Times the stages of one request; set .model once it is known"""
+
+    def __init__(self, metrics, endpoint):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.model = None
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def batch_size(self, size):
+        self.metrics.observe_batch(self.endpoint, self.model or '', size)
+
+
+class Metrics:
+
+    def __init__(self, prefix, enabled=False):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._errors = {}
+        self._request_latency = {}
+        self._stage_latency = {}
+        self._request_bytes = {}
+        self._batch_sizes = {}
+
+    def timer(self, endpoint):
+        return RequestTimer(self, endpoint) if self.enabled else NULL_TIMER
+
+    def _observe(self, series, labels, buckets, value):
+        with self._lock:
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(buckets)
+            hist.observe(value)
+
+    def observe_request(self, endpoint, status, seconds, request_bytes):
+        if not self.enabled:
+            return
+        self._observe(self._request_latency, (endpoint,), LATENCY_BUCKETS, seconds)
+        self._observe(self._request_bytes, (endpoint,), SIZE_BUCKETS, request_bytes)
+        with self._lock:
+            key = (endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if status >= 400:
+                self._errors[(endpoint,)] = self._errors.get((endpoint,), 0) + 1
+
+    def observe_stage(self, endpoint, model, stage, seconds):
+        self._observe(self._stage_latency, (endpoint, model, stage), LATENCY_BUCKETS, seconds)
+
+    def observe_batch(self, endpoint, model, size):
+        self._observe(self._batch_sizes, (endpoint, model), SIZE_BUCKETS, size)
+
+    def render(self):
+        """Prometheus text exposition of everything recorded so far"""
+        lines = []
+        with self._lock:
+            self._render_counter(lines, 'requests_total', 'Requests by endpoint and status',
+                                 ('endpoint', 'status'), self._requests)
+            self._render_counter(lines, 'errors_total', 'Requests answered with status >= 400',
+                                 ('endpoint',), self._errors)
+            self._render_histograms(lines, 'request_latency_seconds', 'End-to-end request latency',
+                                    ('endpoint',), self._request_latency)
+            self._render_histograms(lines, 'stage_latency_seconds',
+                                    'Latency per request stage (parse, features, forward, serialize, ...)',
+                                    ('endpoint', 'model', 'stage'), self._stage_latency)
+            self._render_histograms(lines, 'request_bytes', 'Request body size',
+                                    ('endpoint',), self._request_bytes)
+            self._render_histograms(lines, 'batch_size', 'Windows or rows per model call',
+                                    ('endpoint', 'model'), self._batch_sizes)
+        return '\n'.join(lines) + '\n'
+
+    def _name(self, name):
+        return f'{self.prefix}_{name}'
+
+    @staticmethod
+    def _labels(names, values, extra=None):
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}'
+
+    def _render_counter(self, lines, name, help_text, label_names, series):
+        full = self._name(name)
+        lines.append(f'# HELP {full} {help_text}')
+        lines.append(f'# TYPE {full} counter')
+        for labels, value in sorted(series.items()):
+            lines.append(f'{full}{self._labels(label_names, labels)} {value}')
+
+    def _render_histograms(self, lines, name, help_text, label_names, series):
+        full = self._name(name)
+        lines.append(f'# HELP {full} {help_text}')
+        lines.append(f'# TYPE {full} histogram')
+        for labels, hist in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                le = self._labels(label_names, labels, f'le="{bound}"')
+                lines.append(f'{full}_bucket{le} {cumulative}')
+            le = self._labels(label_names, labels, 'le="+Inf"')
+            lines.append(f'{full}_bucket{le} {hist.count}')
+            lines.append(f'{full}_sum{self._labels(label_names, labels)} {hist.sum}')
+            lines.append(f'{full}_count{self._labels(label_names, labels)} {hist.count}')
@@ -0,0 +1,97 @@
+"""
+Dynamic micro-batching for concurrent prediction requests
+
+Request threads submit single items to a MicroBatcher and block on a future.
+A background worker drains the queue into a batch once it holds
+`max_batch_size` items or the oldest item has waited `max_wait_ms`, runs one
+batched call and hands every caller its own result.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces single-item calls into batched calls of batch_fn.
+    batch_fn(items) must return a sequence of results, one per item.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0, name='batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._max_seen = 0
+        self._size_counts = {}
+        self._errors = 0
+        self._worker = threading.Thread(target=self._run, name=f'{name}-worker', daemon=True)
+        self._worker.start()
+
+    def submit(self, item, timeout=None):
+        """
+        Queue item and block until its result is available; raises
+        TimeoutError after timeout seconds (None waits forever)
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        # Block for the first item, then fill the batch until size or deadline
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _future in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(batch):
+                    raise RuntimeError(f'{self.name}: batch_fn returned {len(results)} results '
+                                       f'for {len(batch)} items')
+                for (_item, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _item, future in batch:
+                    future.set_exception(e)
+            self._record(len(batch))
+
+    def _record(self, size):
+        with self._stats_lock:
+            self._requests += size
+            self._batches += 1
+            self._max_seen = max(self._max_seen, size)
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'max_batch_size_seen': self._max_seen,
+                'batch_size_counts': {str(k): v for k, v in sorted(self._size_counts.items())},
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0
+            }
@@ -0,0 +1,182 @@
+"""
+Lazy model registry with an LRU memory budget
+
+Models are registered with a loader and only deserialized on first use (or
+by an explicit warmup). Resident models are kept in LRU order and the least
+recently used ones are unloaded once their estimated size exceeds max_bytes.
+The registry behaves like a read-only dict of name -> model for the rest of
+the app: `name in models` tests availability, `models[name]` loads on demand.
+Objects derived from a resident model (e.g. a quantized or compiled variant)
+can be attached to it: they count toward its size and are dropped with it.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(model, path=None):
+    """Resident size estimate in bytes (tensor storage, else file size)"""
+    if hasattr(model, 'parameters') and hasattr(model, 'buffers'):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.nelement() * t.element_size() for t in tensors)
+    if path is not None and path.exists():
+        return path.stat().st_size
+    return 0
+
+
+class ModelRegistry:
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._specs = {}
+        self._resident = OrderedDict()
+        self._attached = {}
+        self._info = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._evict_callbacks = []
+
+    def register(self, name, loader, path=None):
+        """Register loader() -> model under name; path is used for size estimates"""
+        with self._lock:
+            self._specs[name] = (loader, path)
+            self._load_locks.setdefault(name, threading.Lock())
+            self._info.setdefault(name, {'loads': 0, 'hits': 0, 'evictions': 0,
+                                         'load_time_ms': None, 'resident_bytes': 0})
+
+    def __setitem__(self, name, model):
+        """Register an already constructed model (its loader keeps it referenced)"""
+        self.register(name, lambda: model)
+        self.get(name)
+
+    def attach(self, name, key, obj, size=0):
+        """
+        Keep obj with the resident model name under key, counting size bytes
+        toward the budget; False (nothing kept) if name is not resident
+        """
+        with self._lock:
+            if name not in self._resident:
+                return False
+            attached = self._attached.setdefault(name, {})
+            _old, old_size = attached.get(key, (None, 0))
+            attached[key] = (obj, size)
+            self._info[name]['resident_bytes'] += size - old_size
+            evicted = self._evict_locked(keep=name)
+        self._notify(evicted)
+        return True
+
+    def attached(self, name, key):
+        """The object attached to name under key, or None"""
+        with self._lock:
+            obj, _size = self._attached.get(name, {}).get(key, (None, 0))
+            return obj
+
+    def on_evict(self, callback):
+        """callback(name) is called after a model is unloaded"""
+        self._evict_callbacks.append(callback)
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __len__(self):
+        return len(self._specs)
+
+    def __iter__(self):
+        return iter(list(self._specs))
+
+    def keys(self):
+        return list(self._specs)
+
+    def version(self, name):
+        """Version tag of a model: modification time and size of its file"""
+        _loader, path = self._specs[name]
+        if path is None or not path.exists():
+            return 'static'
+        stat = path.stat()
+        return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+    def loaded(self):
+        with self._lock:
+            return list(self._resident)
+
+    def get(self, name):
+        if name not in self._specs:
+            raise KeyError(name)
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                self._info[name]['hits'] += 1
+                return self._resident[name]
+
+        # Load outside the registry lock so other models stay available
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._resident:
+                    self._info[name]['hits'] += 1
+                    return self._resident[name]
+                loader, path = self._specs[name]
+            start = time.perf_counter()
+            model = loader()
+            load_time_ms = (time.perf_counter() - start) * 1000.0
+            size = estimate_size(model, path)
+            with self._lock:
+                self._resident[name] = model
+                info = self._info[name]
+                info['loads'] += 1
+                info['load_time_ms'] = load_time_ms
+                info['resident_bytes'] = size
+                evicted = self._evict_locked(keep=name)
+        self._notify(evicted)
+        return model
+
+    def _notify(self, evicted):
+        for evicted_name in evicted:
+            for callback in self._evict_callbacks:
+                callback(evicted_name)
+
+    def warmup(self, names):
+        """Load the given models now; unknown names are ignored"""
+        for name in names:
+            if name in self._specs:
+                self.get(name)
+
+    def unload(self, name):
+        with self._lock:
+            if self._resident.pop(name, None) is None:
+                return False
+            self._attached.pop(name, None)
+            self._info[name]['resident_bytes'] = 0
+        self._notify([name])
+        return True
+
+    def resident_bytes(self):
+        return sum(self._info[name]['resident_bytes'] for name in self._resident)
+
+    def _evict_locked(self, keep):
+        evicted = []
+        while self.resident_bytes() > self.max_bytes and len(self._resident) > 1:
+            name = next(iter(self._resident))
+            if name == keep:
+                break
+            del self._resident[name]
+            self._attached.pop(name, None)
+            self._info[name]['resident_bytes'] = 0
+            self._info[name]['evictions'] += 1
+            evicted.append(name)
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_bytes': self.max_bytes,
+                'resident_bytes': self.resident_bytes(),
+                'models': {
+                    name: dict(self._info[name], loaded=name in self._resident,
+                               attached=sorted(self._attached.get(name, {})))
+                    for name in self._specs
+                }
+            }
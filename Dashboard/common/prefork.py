@@ -0,0 +1,257 @@
+"""
+Pre-fork multi-process WSGI server
+
+The master process loads the models once (prepare()), freezes the garbage
+collector so the loaded objects stay on shared copy-on-write pages, opens the
+listening socket and forks N workers that all accept on it. Each worker is
+pinned to its own slice of the CPUs and sets torch.set_num_threads to the
+size of that slice, so workers do not oversubscribe cores.
+
+Workers are recycled after max_requests (+ random jitter) requests, or all
+of them one at a time on SIGHUP. A recycled worker stops accepting, finishes
+its in-flight requests (up to graceful_timeout) and is replaced by a fresh
+fork of the master. SIGTERM / SIGINT shut everything down the same way.
+
+State kept in worker memory (result cache, /ingest meter buffers,
+/stream/readings inverter states, metrics) is per worker; use a shared cache
+URL and route a meter or inverter to one worker, or run a single worker,
+where that matters. Cancelling a streamed job works
+from any worker (see streaming.py).
+"""
+
+import gc
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except Exception:
+    TORCH_AVAILABLE = False
+
+
+def cpu_partitions(workers):
+    """Split the CPUs this process may use into `workers` disjoint slices"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    if workers > len(cpus):
+        # More workers than cores: share cores round-robin, one thread each
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    per_worker = len(cpus) // workers
+    return [cpus[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+
+
+class _RequestLimiter:
+    """WSGI middleware counting served and in-flight requests of a worker"""
+
+    def __init__(self, app, limit, on_limit):
+        self.app = app
+        self.limit = limit
+        self.on_limit = on_limit
+        self.served = 0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            self.active += 1
+            reached = self.limit > 0 and self.served == self.limit
+        if reached:
+            self.on_limit()
+        try:
+            app_iter = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        # Streamed responses count as in flight until the server closes them
+        return ClosingIterator(app_iter, self._done)
+
+    def _done(self):
+        with self._lock:
+            self.active -= 1
+
+    def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.active > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+def _run_worker(app, sock, index, cpus, options):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master handles Ctrl-C
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    if options['pin'] and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    threads = options['threads_per_worker'] or len(cpus)
+    if TORCH_AVAILABLE:
+        torch.set_num_threads(threads)
+
+    limit = options['max_requests']
+    if limit and options['max_requests_jitter']:
+        limit += random.randint(0, options['max_requests_jitter'])
+
+    server = None
+
+    def stop():
+        # shutdown() blocks until serve_forever returns, so call it off-thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    limiter = _RequestLimiter(app, limit, stop)
+    server = make_server(options['host'], options['port'], limiter,
+                         threaded=options['threaded'], fd=sock.fileno())
+    signal.signal(signal.SIGTERM, lambda *_: stop())
+
+    print(f"[worker {index}] pid {os.getpid()} cpus {cpus} torch threads {threads}")
+    server.serve_forever()
+    limiter.drain(options['graceful_timeout'])
+    print(f"[worker {index}] pid {os.getpid()} exiting after {limiter.served} requests")
+
+
+class PreforkServer:
+
+    def __init__(self, app, host, port, workers, max_requests=0, max_requests_jitter=0,
+                 threads_per_worker=None, threaded=True, pin=True, graceful_timeout=30.0,
+                 backlog=2048, cleanup=None):
+        self.app = app
+        self.cleanup = cleanup
+        self.workers = workers
+        self.backlog = backlog
+        self.partitions = cpu_partitions(workers)
+        self.options = {
+            'host': host,
+            'port': port,
+            'max_requests': max_requests,
+            'max_requests_jitter': max_requests_jitter,
+            'threads_per_worker': threads_per_worker,
+            'threaded': threaded,
+            'pin': pin,
+            'graceful_timeout': graceful_timeout
+        }
+        self.children = {}  # pid -> (worker index, start time)
+        self.sock = None
+        self._stopping = False
+        self._recycle = []
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, index, self.partitions[index], self.options)
+            except BaseException as e:
+                print(f"[worker {index}] crashed: {e}")
+                code = 1
+            finally:
+                try:
+                    if self.cleanup is not None:
+                        self.cleanup()
+                finally:
+                    os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+
+    def _on_stop(self, *_):
+        self._stopping = True
+
+    def _on_reload(self, *_):
+        # Rolling recycle: replace the workers one at a time
+        self._recycle = list(self.children)
+
+    def _reap(self):
+        """Collect exited workers; returns [(index, lifetime_s)]"""
+        exited = []
+        while self.children:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            index, started = self.children.pop(pid, (None, None))
+            if index is not None:
+                exited.append((index, time.monotonic() - started))
+        return exited
+
+    def run(self):
+        host, port = self.options['host'], self.options['port']
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(self.backlog)
+        self.sock.set_inheritable(True)
+
+        # Keep loaded models out of later GC passes so their pages stay shared
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        print(f"Master pid {os.getpid()} serving on {host}:{port} with {self.workers} workers")
+        for index in range(self.workers):
+            self._spawn(index)
+
+        recycling = None
+        while not self._stopping:
+            time.sleep(0.2)
+            if recycling is None and self._recycle:
+                recycling = self._recycle.pop(0)
+                if recycling in self.children:
+                    os.kill(recycling, signal.SIGTERM)
+                else:
+                    recycling = None
+            for index, lifetime in self._reap():
+                if self._stopping:
+                    break
+                if lifetime < 1.0:
+                    # Avoid a tight crash loop
+                    time.sleep(1.0)
+                self._spawn(index)
+            if recycling is not None and recycling not in self.children:
+                recycling = None
+
+        self.shutdown()
+
+    def shutdown(self):
+        print("Stopping workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.options['graceful_timeout'] + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            os.kill(pid, signal.SIGKILL)
+        self._reap()
+        self.sock.close()
+
+
+def serve(app, host, port, workers, prepare=None, cleanup=None, **options):
+    """
+    Run app under PreforkServer. prepare() is called in the master before
+    forking, typically to load every model once; cleanup() in each worker as
+    it exits (workers leave through os._exit, which skips atexit handlers).
+    """
+    if not hasattr(os, 'fork'):
+        print("! fork() is not available on this platform; serving single-process")
+        if prepare is not None:
+            prepare()
+        app.run(host=host, port=port, threaded=True)
+        return
+    if prepare is not None:
+        prepare()
+    PreforkServer(app, host, port, workers, cleanup=cleanup, **options).run()
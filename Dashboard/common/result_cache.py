@@ -0,0 +1,131 @@
+"""
+In-process prediction result cache with optional shared backend
+
+Results are keyed by model name, model version and a fast hash of the input
+array, bounded by max_entries (LRU) and expire after ttl seconds. For
+multi-worker deployments a Redis URL can be given; the local LRU then acts as
+a first-level cache in front of it.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except Exception:
+    REDIS_AVAILABLE = False
+
+
+def make_key(model_name, version, array, *extra):
+    """Cache key from model identity and the raw bytes of the input array"""
+    array = np.ascontiguousarray(array, dtype=np.float64)
+    digest = hashlib.blake2b(array.tobytes(), digest_size=16)
+    digest.update(repr(array.shape).encode())
+    for item in extra:
+        digest.update(repr(item).encode())
+    return f'{model_name}:{version}:{digest.hexdigest()}'
+
+
+class ResultCache:
+
+    def __init__(self, max_entries=10000, ttl=60.0, redis_url=None, prefix='pred'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self.shared = None
+        if redis_url:
+            if not REDIS_AVAILABLE:
+                print("! redis package not installed; using the local result cache only")
+            else:
+                self.shared = redis.Redis.from_url(redis_url)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(f'{self.prefix}:{key}')
+            except Exception as e:
+                print(f"! Shared result cache unavailable: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._put_local(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Store a JSON-serializable value under key"""
+        if not self.enabled:
+            return
+        self._put_local(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(f'{self.prefix}:{key}', json.dumps(value), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                print(f"! Shared result cache unavailable: {e}")
+
+    def _put_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'shared_backend': self.shared is not None,
+                'shared_hits': self.shared_hits
+            }
@@ -0,0 +1,216 @@
+"""
+Streaming NDJSON responses for long batch jobs
+
+A streamed job sends one JSON object per line while its batches are still
+being computed: a header line with the job id, one line per result and a
+final {"done": true, ...} line (or {"error": ...} if the job failed).
+Results are produced chunk by chunk, so memory stays flat and the first
+lines arrive as soon as the first batch is done.
+
+The job stops before its next chunk when the client disconnects (the WSGI
+server closes the generator) or when it is cancelled through
+StreamJobs.cancel().
+
+Jobs run in the process that serves them. Job ids carry that process id, so
+under the pre-fork server (prefork.py) a cancel that lands on another worker
+leaves a marker file in a directory shared by all workers of the master,
+which the owning worker checks before each chunk. Markers are removed when
+their job ends, a worker's files when it exits (StreamJobs.close(), also
+run for workers that died when the next worker registers) and the directory
+when the master exits.
+"""
+
+import atexit
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+
+from flask import Response
+
+NDJSON_MIME = 'application/x-ndjson'
+
+
+def wants_stream(request, data=None):
+    """True if the client asked for a streamed response (flag or Accept header)"""
+    flag = (data or {}).get('stream', request.args.get('stream'))
+    if isinstance(flag, str):
+        flag = flag.lower() in ('1', 'true', 'yes')
+    if flag:
+        return True
+    best = request.accept_mimetypes.best
+    return best == NDJSON_MIME
+
+
+class StreamJobs:
+    """Registry of running streamed jobs, used for cancellation and stats"""
+
+    JOB_ID = re.compile(r'^(\d+)-[0-9a-f]{32}$')
+
+    def __init__(self, cancel_dir=None):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Named before forking, so every worker of one master shares it
+        self._owner_pid = os.getpid()
+        self._owns_dir = cancel_dir is None
+        self.cancel_dir = cancel_dir or os.path.join(tempfile.gettempdir(),
+                                                     f'stream-jobs-{self._owner_pid}')
+        self._registered_pid = None
+        atexit.register(self.close)
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.disconnected = 0
+        self.failed = 0
+
+    def start(self):
+        pid = os.getpid()
+        if self._registered_pid != pid:
+            # Lets other workers tell our job ids from arbitrary ones
+            os.makedirs(self.cancel_dir, exist_ok=True)
+            self._remove_files(lambda owner: owner != pid and not _alive(owner))
+            open(os.path.join(self.cancel_dir, f'worker-{pid}'), 'w').close()
+            self._registered_pid = pid
+        job_id = f'{pid}-{uuid.uuid4().hex}'
+        with self._lock:
+            self._jobs[job_id] = threading.Event()
+            self.started += 1
+        return job_id
+
+    def _marker(self, job_id):
+        return os.path.join(self.cancel_dir, job_id)
+
+    def cancel(self, job_id):
+        """
+        Ask a running job to stop before its next chunk. Jobs of another
+        live worker get a cancel marker; False if the job is unknown.
+        """
+        with self._lock:
+            event = self._jobs.get(job_id)
+        if event is not None:
+            event.set()
+            return True
+        match = self.JOB_ID.match(job_id)
+        owner = int(match.group(1)) if match else None
+        if (owner is None or owner == os.getpid() or not _alive(owner) or
+                not os.path.exists(os.path.join(self.cancel_dir, f'worker-{owner}'))):
+            return False
+        open(self._marker(job_id), 'w').close()
+        return True
+
+    def is_cancelled(self, job_id):
+        with self._lock:
+            event = self._jobs.get(job_id)
+        if event is not None and event.is_set():
+            return True
+        return os.path.exists(self._marker(job_id))
+
+    def finish(self, job_id, outcome):
+        """Record how a job ended; later calls for the same job are ignored"""
+        with self._lock:
+            if self._jobs.pop(job_id, None) is None:
+                return
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        try:
+            os.remove(self._marker(job_id))
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Remove this process's registration and cancel markers; the process
+        that created the StreamJobs also removes the directory
+        """
+        pid = os.getpid()
+        if pid == self._owner_pid and self._owns_dir:
+            shutil.rmtree(self.cancel_dir, ignore_errors=True)
+        else:
+            self._remove_files(lambda owner: owner == pid)
+        self._registered_pid = None
+
+    def _remove_files(self, owned):
+        """Remove worker files and markers whose owner pid passes owned(pid)"""
+        try:
+            names = os.listdir(self.cancel_dir)
+        except OSError:
+            return
+        for name in names:
+            match = re.match(r'^(?:worker-)?(\d+)', name)
+            if match and owned(int(match.group(1))):
+                try:
+                    os.remove(os.path.join(self.cancel_dir, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._jobs),
+                'started': self.started,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'disconnected': self.disconnected,
+                'failed': self.failed
+            }
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _line(obj):
+    return json.dumps(obj) + '\n'
+
+
+def ndjson_response(jobs, chunks, header=None):
+    """
+    Stream `chunks` (an iterable of lists of JSON-serializable records) as
+    NDJSON. The iterable is consumed lazily, one chunk per write.
+    """
+    job_id = jobs.start()
+
+    def generate():
+        count = 0
+        outcome = 'disconnected'
+        try:
+            yield _line(dict(header or {}, job_id=job_id))
+            records_iter = iter(chunks)
+            # Checked before each chunk, so a cancelled job computes no more
+            while not jobs.is_cancelled(job_id):
+                records = next(records_iter, None)
+                if records is None:
+                    outcome = 'completed'
+                    yield _line({'done': True, 'count': count})
+                    return
+                count += len(records)
+                yield ''.join(_line(record) for record in records)
+            outcome = 'cancelled'
+            yield _line({'done': False, 'cancelled': True, 'count': count})
+        except GeneratorExit:
+            # Client went away; stop computing further chunks
+            raise
+        except Exception as e:
+            outcome = 'failed'
+            yield _line({'error': str(e), 'count': count})
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            jobs.finish(job_id, outcome)
+
+    response = Response(generate(), mimetype=NDJSON_MIME)
+    # Covers clients that disconnect before the first line was produced
+    response.call_on_close(lambda: jobs.finish(job_id, 'disconnected'))
+    response.headers['X-Job-Id'] = job_id
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
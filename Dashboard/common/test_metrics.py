@@ -0,0 +1,66 @@
+"""Tests of the latency metrics and their Prometheus rendering (python -m pytest -q from Dashboard/common)"""
+
+import re
+
+from common.metrics import LATENCY_BUCKETS, NULL_TIMER, Metrics
+
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z]+="(\\.|[^"\\])*",?)*\})? \S+$')
+
+
+def samples(text):
+    """{line without value: value} of the sample lines; checks every line's syntax"""
+    result = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        assert SAMPLE.match(line), line
+        name, value = line.rsplit(' ', 1)
+        result[name] = float(value)
+    return result
+
+
+def test_collection_is_off_until_enabled():
+    metrics = Metrics('pv')
+    assert metrics.timer('predict') is NULL_TIMER
+    metrics.observe_request('predict', 200, 0.01, 100)
+    assert samples(metrics.render()) == {}
+
+
+def test_requests_stages_and_histograms():
+    metrics = Metrics('pv', enabled=True)
+    timer = metrics.timer('predict')
+    timer.model = 'gbm'
+    with timer.stage('forward'):
+        pass
+    timer.batch_size(64)
+    metrics.observe_request('predict', 200, 0.003, 512)
+    metrics.observe_request('predict', 400, 0.2, 10)
+
+    values = samples(metrics.render())
+    assert values['pv_requests_total{endpoint="predict",status="200"}'] == 1
+    assert values['pv_errors_total{endpoint="predict"}'] == 1
+    assert values['pv_request_latency_seconds_count{endpoint="predict"}'] == 2
+    assert values['pv_request_latency_seconds_bucket{endpoint="predict",le="0.005"}'] == 1
+    assert values['pv_request_latency_seconds_bucket{endpoint="predict",le="+Inf"}'] == 2
+    assert abs(values['pv_request_latency_seconds_sum{endpoint="predict"}'] - 0.203) < 1e-9
+    assert values['pv_stage_latency_seconds_count{endpoint="predict",model="gbm",stage="forward"}'] == 1
+    assert values['pv_batch_size_bucket{endpoint="predict",model="gbm",le="64"}'] == 1
+
+
+def test_buckets_are_cumulative():
+    metrics = Metrics('nilm', enabled=True)
+    for seconds in (0.0001, 0.02, 0.02, 30.0):
+        metrics.observe_stage('predict', 'tcn', 'forward', seconds)
+    values = samples(metrics.render())
+    counts = [values[f'nilm_stage_latency_seconds_bucket{{endpoint="predict",model="tcn",'
+                     f'stage="forward",le="{bound}"}}'] for bound in LATENCY_BUCKETS]
+    assert counts == sorted(counts)
+    assert counts[0] == 1 and counts[-1] == 3
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics('pv', enabled=True)
+    metrics.observe_stage('predict', 'my "model"\\v2\nnew', 'forward', 0.01)
+    text = metrics.render()
+    assert 'model="my \\"model\\"\\\\v2\\nnew"' in text
+    samples(text)
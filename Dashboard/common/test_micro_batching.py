@@ -0,0 +1,59 @@
+"""Tests of MicroBatcher (python -m pytest -q from Dashboard/common)"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common.micro_batching import MicroBatcher
+
+
+def test_concurrent_calls_share_a_batch():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=200)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(batcher.submit, range(8)))
+    assert results == [item * 2 for item in range(8)]
+    assert len(batches) < 8
+    assert max(len(batch) for batch in batches) <= 8
+    stats = batcher.stats()
+    assert stats['requests'] == 8 and stats['batches'] == len(batches)
+
+
+def test_short_result_fails_every_caller():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=200)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(batcher.submit, i) for i in range(4)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='results'):
+                future.result(timeout=5)
+    assert batcher.stats()['errors'] >= 1
+
+
+def test_batch_fn_error_reaches_callers():
+    def fail(items):
+        raise ValueError('bad batch')
+
+    batcher = MicroBatcher(fail, max_wait_ms=1)
+    with pytest.raises(ValueError, match='bad batch'):
+        batcher.submit(1, timeout=5)
+
+
+def test_submit_times_out():
+    release = threading.Event()
+
+    def blocked(items):
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(blocked, max_wait_ms=1)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.submit(1, timeout=0.05)
+    finally:
+        release.set()
@@ -0,0 +1,92 @@
+"""Tests of ModelRegistry (python -m pytest -q from Dashboard/common)"""
+
+import os
+
+import pytest
+
+from common.model_registry import ModelRegistry
+
+
+def model_file(tmp_path, name, size):
+    path = tmp_path / f'{name}.bin'
+    path.write_bytes(b'\0' * size)
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """Three models of 100 bytes each (by file size) under a 250-byte budget"""
+    registry = ModelRegistry(max_bytes=250)
+    registry.loads = []
+    for name in 'abc':
+        def loader(name=name):
+            registry.loads.append(name)
+            return object()
+        registry.register(name, loader, model_file(tmp_path, name, 100))
+    return registry
+
+
+def test_models_load_lazily_once(registry):
+    assert registry.loaded() == [] and 'a' in registry
+    model = registry['a']
+    assert registry['a'] is model
+    assert registry.loads == ['a']
+    info = registry.stats()['models']['a']
+    assert (info['loads'], info['hits'], info['resident_bytes']) == (1, 1, 100)
+    with pytest.raises(KeyError):
+        registry['missing']
+
+
+def test_least_recently_used_is_evicted_by_bytes(registry):
+    evicted = []
+    registry.on_evict(evicted.append)
+    registry.warmup(['a', 'b'])
+    registry['a']  # b is now least recently used
+    registry['c']
+    assert evicted == ['b']
+    assert registry.loaded() == ['a', 'c']
+    assert registry.resident_bytes() == 200
+    assert registry.stats()['models']['b']['evictions'] == 1
+
+    registry['b']
+    assert registry.loads == ['a', 'b', 'c', 'b']
+    assert evicted == ['b', 'a']
+
+
+def test_unload_calls_back(registry):
+    evicted = []
+    registry.on_evict(evicted.append)
+    registry['a']
+    assert registry.unload('a') and not registry.unload('a')
+    assert evicted == ['a'] and registry.loaded() == []
+
+
+def test_oversized_model_stays_resident(tmp_path):
+    registry = ModelRegistry(max_bytes=10)
+    registry.register('big', object, model_file(tmp_path, 'big', 100))
+    registry['big']
+    assert registry.loaded() == ['big']
+
+
+def test_version_follows_the_file(registry, tmp_path):
+    version = registry.version('a')
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'\0' * 101)
+    os.utime(path, ns=(1, 1))
+    assert registry.version('a') != version
+    registry['static'] = object()
+    assert registry.version('static') == 'static'
+
+
+def test_attachments_count_and_go_with_their_model(registry):
+    assert not registry.attach('a', 'int8', object(), 10)
+    registry['a']
+    variant = object()
+    assert registry.attach('a', 'int8', variant, 60)
+    assert registry.attached('a', 'int8') is variant
+    assert registry.stats()['models']['a']['resident_bytes'] == 160
+    registry['b']  # 260 bytes: a and its variant are evicted
+    assert registry.loaded() == ['b']
+    assert registry.attached('a', 'int8') is None
+    registry['a']
+    assert registry.stats()['models']['a']['resident_bytes'] == 100
@@ -0,0 +1,71 @@
+"""Tests of the pre-fork server helpers (python -m pytest -q from Dashboard/common)"""
+
+import os
+
+import pytest
+
+from common import prefork
+from common.prefork import _RequestLimiter, cpu_partitions
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    def use(n):
+        monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(n)), raising=False)
+    return use
+
+
+def test_partitions_are_disjoint(cpus):
+    cpus(8)
+    assert cpu_partitions(3) == [[0, 1], [2, 3], [4, 5]]
+    assert cpu_partitions(1) == [list(range(8))]
+
+
+def test_more_workers_than_cpus_share_round_robin(cpus):
+    cpus(2)
+    assert cpu_partitions(5) == [[0], [1], [0], [1], [0]]
+
+
+def test_limiter_counts_in_flight_until_closed():
+    reached = []
+
+    def app(environ, start_response):
+        return iter([b'a', b'b'])
+
+    limiter = _RequestLimiter(app, limit=2, on_limit=lambda: reached.append(True))
+    first = limiter({}, None)
+    assert (limiter.served, limiter.active, reached) == (1, 1, [])
+    second = limiter({}, None)
+    assert reached == [True]
+    assert b''.join(second) == b'ab'
+    second.close()
+    assert limiter.active == 1
+    first.close()
+    assert limiter.active == 0
+    limiter.drain(timeout=0.1)
+
+
+def test_limiter_releases_on_app_error():
+    def app(environ, start_response):
+        raise RuntimeError('boom')
+
+    limiter = _RequestLimiter(app, limit=0, on_limit=None)
+    with pytest.raises(RuntimeError):
+        limiter({}, None)
+    assert limiter.active == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_worker_cleanup_runs_on_exit(monkeypatch, tmp_path):
+    marker = tmp_path / 'cleaned'
+
+    def run_worker(*args):
+        raise SystemExit
+
+    monkeypatch.setattr(prefork, '_run_worker', run_worker)
+    server = prefork.PreforkServer(None, '127.0.0.1', 0, 1,
+                                   cleanup=lambda: marker.write_text('done'))
+    server._spawn(0)
+    (pid, _info), = server.children.items()
+    os.waitpid(pid, 0)
+    assert marker.read_text() == 'done'
@@ -0,0 +1,92 @@
+"""Tests of ResultCache and make_key (python -m pytest -q from Dashboard/common)"""
+
+import numpy as np
+import pytest
+
+from common import result_cache
+from common.result_cache import ResultCache, make_key
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache, 'time', clock)
+    return clock
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def test_key_is_stable_across_containers_and_dtypes():
+    key = make_key('tcn', 'v1', [1.0, 2.0, 3.0], True)
+    assert key == make_key('tcn', 'v1', np.array([1, 2, 3], dtype=np.float32), True)
+    assert key.startswith('tcn:v1:')
+
+
+@pytest.mark.parametrize('other', [
+    ('atcn', 'v1', [1.0, 2.0, 3.0], True),
+    ('tcn', 'v2', [1.0, 2.0, 3.0], True),
+    ('tcn', 'v1', [1.0, 2.0, 3.5], True),
+    ('tcn', 'v1', [[1.0, 2.0, 3.0]], True),
+    ('tcn', 'v1', [1.0, 2.0, 3.0], False),
+], ids=['model', 'version', 'values', 'shape', 'extra'])
+def test_key_changes_with_any_input(other):
+    assert make_key('tcn', 'v1', [1.0, 2.0, 3.0], True) != make_key(*other)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(max_entries=10, ttl=5.0)
+    cache.put('k', {'p': 1})
+    clock.now += 4.9
+    assert cache.get('k') == {'p': 1}
+    clock.now += 0.2
+    assert cache.get('k') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResultCache(max_entries=2, ttl=60.0)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(max_entries=0)
+    cache.put('k', 1)
+    assert cache.get('k') is None and cache.stats()['entries'] == 0
+
+
+def test_shared_backend_fills_the_local_cache(clock):
+    shared = FakeRedis()
+    writer, reader = ResultCache(prefix='nilm'), ResultCache(prefix='nilm')
+    writer.shared = reader.shared = shared
+    writer.put('k', [0.5, 0.25])
+    assert list(shared.data) == ['nilm:k']
+    assert reader.get('k') == [0.5, 0.25]
+    reader.shared = None
+    assert reader.get('k') == [0.5, 0.25]
+    assert reader.stats()['shared_hits'] == 1
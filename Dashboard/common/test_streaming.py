@@ -0,0 +1,127 @@
+"""Tests of streamed NDJSON jobs and their cancellation (python -m pytest -q from Dashboard/common)"""
+
+import json
+import os
+import time
+import uuid
+
+import pytest
+from flask import Flask, request
+
+from common.streaming import StreamJobs, ndjson_response, wants_stream
+
+app = Flask(__name__)
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = StreamJobs(cancel_dir=str(tmp_path / 'jobs'))
+    yield jobs
+    jobs.close()
+
+
+def stream(jobs, chunks, cancel_after=None):
+    """Decoded lines of one streamed response, cancelling it once
+    cancel_after lines were read"""
+    with app.test_request_context('/'):
+        response = ndjson_response(jobs, chunks, header={'model': 'm'})
+    lines = []
+    for part in response.response:
+        lines += [json.loads(line) for line in part.splitlines()]
+        if cancel_after is not None and len(lines) >= cancel_after:
+            assert jobs.cancel(lines[0]['job_id'])
+            cancel_after = None
+    response.close()
+    return lines
+
+
+def test_wants_stream():
+    with app.test_request_context('/?stream=true'):
+        assert wants_stream(request)
+    with app.test_request_context('/', headers={'Accept': 'application/x-ndjson'}):
+        assert wants_stream(request)
+    with app.test_request_context('/'):
+        assert not wants_stream(request) and wants_stream(request, {'stream': True})
+
+
+def test_complete_stream(jobs):
+    lines = stream(jobs, iter([[{'i': 0}, {'i': 1}], [{'i': 2}]]))
+    assert lines[0]['model'] == 'm' and jobs.JOB_ID.match(lines[0]['job_id'])
+    assert lines[1:] == [{'i': 0}, {'i': 1}, {'i': 2}, {'done': True, 'count': 3}]
+    assert jobs.stats()['completed'] == 1 and jobs.stats()['active'] == 0
+
+
+def test_cancel_stops_before_the_next_chunk(jobs):
+    computed = []
+
+    def chunks():
+        for i in range(5):
+            computed.append(i)
+            yield [{'i': i}]
+
+    lines = stream(jobs, chunks(), cancel_after=2)
+    assert lines[-1] == {'done': False, 'cancelled': True, 'count': 1}
+    assert computed == [0]
+    assert jobs.stats()['cancelled'] == 1
+
+
+def test_failure_is_reported(jobs):
+    def chunks():
+        yield [{'i': 0}]
+        raise ValueError('bad chunk')
+
+    assert stream(jobs, chunks())[-1] == {'error': 'bad chunk', 'count': 1}
+    assert jobs.stats()['failed'] == 1
+
+
+def test_unknown_jobs_are_not_cancelled(jobs):
+    jobs.start()
+    assert not jobs.cancel('not-a-job')
+    assert not jobs.cancel(f'{os.getpid()}-{uuid.uuid4().hex}')
+    # pid 1 is alive but not a registered worker
+    assert not jobs.cancel(f'1-{uuid.uuid4().hex}')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_cancel_from_another_worker(jobs):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            job_id = jobs.start()
+            os.write(write_fd, job_id.encode())
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if jobs.is_cancelled(job_id):
+                    jobs.finish(job_id, 'cancelled')
+                    code = 0
+                    break
+                time.sleep(0.01)
+            jobs.close()
+        finally:
+            os._exit(code)
+    job_id = os.read(read_fd, 100).decode()
+    assert jobs.cancel(job_id)
+    _pid, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    # the worker removed its registration and marker on the way out
+    assert os.listdir(jobs.cancel_dir) == []
+    assert not jobs.cancel(job_id)
+
+
+def test_stale_worker_files_are_pruned(jobs):
+    os.makedirs(jobs.cancel_dir)
+    dead = 2 ** 22 + 12345  # above the default pid_max
+    for name in (f'worker-{dead}', f'{dead}-{uuid.uuid4().hex}'):
+        open(os.path.join(jobs.cancel_dir, name), 'w').close()
+    jobs.start()
+    assert os.listdir(jobs.cancel_dir) == [f'worker-{os.getpid()}']
+
+
+def test_owner_removes_the_default_directory():
+    jobs = StreamJobs()
+    jobs.start()
+    assert os.path.isdir(jobs.cancel_dir)
+    jobs.close()
+    assert not os.path.exists(jobs.cancel_dir)
@@ -0,0 +1,125 @@
+"""Tests of the binary request / response formats (python -m pytest -q from Dashboard/common)"""
+
+import gzip
+import io
+import json
+
+import numpy as np
+import pytest
+from flask import Flask, request
+
+from common.wire_format import (ARROW_AVAILABLE, ARROW_MIME, JSON_MIME, MSGPACK_AVAILABLE,
+                                MSGPACK_MIME, NPY_MIME, NPZ_MIME, RAW_MIME, WireFormatError,
+                                columnar_response, document_response, parse_binary_body,
+                                response_mimetype)
+
+app = Flask(__name__)
+
+
+def parse(body, mimetype, **kwargs):
+    with app.test_request_context('/', method='POST', data=body, content_type=mimetype):
+        return parse_binary_body(request, **kwargs)
+
+
+def npy(values):
+    buf = io.BytesIO()
+    np.save(buf, values)
+    return buf.getvalue()
+
+
+def arrow(columns):
+    import pyarrow as pa
+    buf = io.BytesIO()
+    table = pa.table(columns)
+    with pa.ipc.new_stream(buf, table.schema) as writer:
+        writer.write_table(table)
+    return buf.getvalue()
+
+
+def test_raw_float32():
+    values = np.arange(6, dtype='<f4')
+    np.testing.assert_array_equal(parse(values.tobytes(), RAW_MIME), values)
+
+
+def test_raw_partial_float_is_400():
+    with pytest.raises(WireFormatError) as e:
+        parse(b'\x00' * 6, RAW_MIME)
+    assert e.value.status == 400
+
+
+def test_npy_matrix():
+    values = np.arange(12.0).reshape(4, 3)
+    np.testing.assert_array_equal(parse(npy(values), NPY_MIME), values)
+
+
+@pytest.mark.parametrize('values', [np.array(['a', 'b']), np.array([{'a': 1}], dtype=object),
+                                    np.zeros((2, 2, 2)), np.float64(1.0)],
+                         ids=['strings', 'objects', '3-d', 'scalar'])
+def test_npy_bad_dtype_or_shape_is_400(values):
+    with pytest.raises(WireFormatError) as e:
+        parse(npy(values), NPY_MIME)
+    assert e.value.status == 400
+
+
+def test_npy_garbage_is_400():
+    with pytest.raises(WireFormatError) as e:
+        parse(b'not an npy file', NPY_MIME)
+    assert e.value.status == 400
+
+
+@pytest.mark.skipif(not ARROW_AVAILABLE, reason='pyarrow not installed')
+def test_arrow_column_and_table():
+    body = arrow({'power': np.array([1.0, 2.0]), 'site': np.array([3, 4])})
+    np.testing.assert_array_equal(parse(body, ARROW_MIME), [1.0, 2.0])
+    table = parse(body, ARROW_MIME, as_table=True)
+    assert list(table) == ['power', 'site']
+    np.testing.assert_array_equal(table['site'], [3, 4])
+
+
+@pytest.mark.skipif(not ARROW_AVAILABLE, reason='pyarrow not installed')
+def test_arrow_bad_body_or_dtype_is_400():
+    with pytest.raises(WireFormatError) as e:
+        parse(b'garbage', ARROW_MIME)
+    assert e.value.status == 400
+    with pytest.raises(WireFormatError) as e:
+        parse(arrow({'name': np.array(['a', 'b'])}), ARROW_MIME)
+    assert e.value.status == 400
+
+
+def test_unsupported_content_type_is_415():
+    with pytest.raises(WireFormatError) as e:
+        parse(b'1,2,3', 'text/csv')
+    assert e.value.status == 415
+
+
+def test_response_mimetype_prefers_json_on_ties():
+    with app.test_request_context('/', headers={'Accept': '*/*'}):
+        assert response_mimetype(request) == JSON_MIME
+    with app.test_request_context('/', headers={'Accept': NPZ_MIME}):
+        assert response_mimetype(request) == NPZ_MIME
+
+
+def test_npz_columns_and_meta():
+    response = columnar_response({'prediction': np.array([1, 2]), 'p': np.array([0.5, 0.25])},
+                                 NPZ_MIME, meta={'model': 'gbm'})
+    arrays = np.load(io.BytesIO(response.get_data()))
+    np.testing.assert_array_equal(arrays['prediction'], [1, 2])
+    assert json.loads(response.headers['X-Meta']) == {'model': 'gbm'}
+
+
+def test_json_document_with_arrays_and_gzip():
+    payload = {'threshold': 0.9, 'probabilities': np.full((300, 5), 0.2), 'n': np.int64(3)}
+    response = document_response(payload, JSON_MIME, compress=True)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    body = json.loads(gzip.decompress(response.get_data()))
+    assert body['threshold'] == 0.9 and body['n'] == 3
+    assert np.shape(body['probabilities']) == (300, 5)
+
+
+@pytest.mark.skipif(not MSGPACK_AVAILABLE, reason='msgpack not installed')
+def test_msgpack_rounds_only_float_arrays():
+    import msgpack
+    payload = {'cascade': {'threshold': 0.9}, 'probabilities': np.array([[0.1, 0.9]])}
+    body = msgpack.unpackb(document_response(payload, MSGPACK_MIME).get_data())
+    assert body['cascade']['threshold'] == 0.9
+    assert body['probabilities'][0][0] == float(np.float32(0.1))
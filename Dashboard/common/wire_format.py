@@ -0,0 +1,187 @@
+"""
+Binary request/response formats for bulk prediction endpoints
+
+Requests may carry, instead of JSON:
+    application/octet-stream             raw little-endian float32 values
+    application/x-npy                    a single .npy array
+    application/vnd.apache.arrow.stream  an Arrow IPC stream (requires pyarrow)
+The remaining request parameters (model, window_size, ...) go in the query string.
+
+Responses are JSON unless the Accept header prefers a columnar binary format:
+    application/x-npz                    one named array per column (np.savez)
+    application/vnd.apache.arrow.stream  one Arrow column per output
+Document (JSON-shaped) responses may instead be MessagePack
+(application/x-msgpack, requires msgpack), and are gzip-compressed when the
+client sends Accept-Encoding: gzip.
+"""
+
+import gzip
+import io
+import json
+
+import numpy as np
+from flask import Response
+
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except Exception:
+    ARROW_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except Exception:
+    MSGPACK_AVAILABLE = False
+
+JSON_MIME = 'application/json'
+RAW_MIME = 'application/octet-stream'
+NPY_MIME = 'application/x-npy'
+NPZ_MIME = 'application/x-npz'
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+MSGPACK_MIME = 'application/x-msgpack'
+
+RESPONSE_MIMES = [JSON_MIME, NPZ_MIME, ARROW_MIME]
+
+# Smaller bodies are sent uncompressed (gzip would not pay for itself)
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 1
+
+
+class WireFormatError(ValueError):
+    """Raised for unsupported or malformed binary payloads (maps to HTTP 415/400)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_binary_request(request):
+    return request.mimetype in (RAW_MIME, NPY_MIME, ARROW_MIME)
+
+
+def parse_binary_body(request, as_table=False):
+    """
+    Decode a binary request body.
+    Returns an ndarray for raw/.npy bodies, and for Arrow bodies either the
+    first column as an ndarray or, with as_table, a dict of all named columns.
+    """
+    body = request.get_data(cache=False)
+    mimetype = request.mimetype
+
+    if mimetype == RAW_MIME:
+        if len(body) % 4:
+            raise WireFormatError('Raw body length must be a multiple of 4 (float32)')
+        return np.frombuffer(body, dtype='<f4').astype(np.float64)
+
+    if mimetype == NPY_MIME:
+        try:
+            values = np.load(io.BytesIO(body), allow_pickle=False)
+        except Exception as e:
+            raise WireFormatError(f'Invalid .npy body: {e}')
+        if values.ndim not in (1, 2):
+            raise WireFormatError(f'.npy body must be a 1-D or 2-D array, got shape {values.shape}')
+        return _numeric(values, '.npy body')
+
+    if mimetype == ARROW_MIME:
+        if not ARROW_AVAILABLE:
+            raise WireFormatError('Arrow payloads require pyarrow', status=415)
+        try:
+            table = pa.ipc.open_stream(body).read_all()
+        except Exception as e:
+            raise WireFormatError(f'Invalid Arrow IPC body: {e}')
+        if not as_table:
+            if not table.num_columns:
+                raise WireFormatError('Arrow body has no columns')
+            return _numeric(table.column(0).to_numpy(), 'Arrow column')
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    raise WireFormatError(f'Unsupported content type {mimetype}', status=415)
+
+
+def _numeric(values, what):
+    if values.dtype.kind not in 'biuf':
+        raise WireFormatError(f'{what} must be numeric, got dtype {values.dtype}')
+    return values
+
+
+def response_mimetype(request, offered=RESPONSE_MIMES):
+    """Preferred response format from the Accept header (JSON on ties)"""
+    best = request.accept_mimetypes.best_match(offered, default=JSON_MIME)
+    if (best == ARROW_MIME and not ARROW_AVAILABLE) or (best == MSGPACK_MIME and not MSGPACK_AVAILABLE):
+        return JSON_MIME
+    return best
+
+
+def accepts_gzip(request):
+    return request.accept_encodings['gzip'] > 0
+
+
+def columnar_response(columns, mimetype, meta=None):
+    """
+    Encode an ordered dict of name -> 1-D array as a binary response.
+    meta is sent JSON-encoded in the X-Meta header.
+    """
+    buf = io.BytesIO()
+    if mimetype == NPZ_MIME:
+        np.savez(buf, **{name: np.asarray(values) for name, values in columns.items()})
+    elif mimetype == ARROW_MIME:
+        table = pa.table({name: np.asarray(values) for name, values in columns.items()})
+        with pa.ipc.new_stream(buf, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise WireFormatError(f'Unsupported response type {mimetype}', status=406)
+
+    response = Response(buf.getvalue(), mimetype=mimetype)
+    if meta is not None:
+        response.headers['X-Meta'] = json.dumps(meta)
+    return response
+
+
+def _plain(value):
+    """JSON fallback for NumPy arrays and scalars"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _packb(payload):
+    """
+    MessagePack-encode a document, packing floating-point arrays (the
+    probability matrices) as float32 and every other value - thresholds,
+    timings, records - at full precision
+    """
+    single = msgpack.Packer(use_single_float=True, default=_plain)
+    double = msgpack.Packer(default=_plain)
+
+    def pack(value):
+        if isinstance(value, dict):
+            return b''.join([double.pack_map_header(len(value))] +
+                            [double.pack(key) + pack(item) for key, item in value.items()])
+        if isinstance(value, np.ndarray) and value.dtype.kind == 'f':
+            return single.pack(value.tolist())
+        return double.pack(value)
+    return pack(payload)
+
+
+def document_response(payload, mimetype=JSON_MIME, compress=False):
+    """
+    Encode a dict of Python values and NumPy arrays as JSON or MessagePack
+    (floating-point arrays as float32), gzip-compressed when compress is set
+    and the body is large enough to gain from it.
+    """
+    if mimetype == MSGPACK_MIME:
+        if not MSGPACK_AVAILABLE:
+            raise WireFormatError('MessagePack responses require msgpack', status=406)
+        body = _packb(payload)
+    elif mimetype == JSON_MIME:
+        body = json.dumps(payload, separators=(',', ':'), default=_plain).encode()
+    else:
+        raise WireFormatError(f'Unsupported response type {mimetype}', status=406)
+
+    response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if compress and len(body) >= GZIP_MIN_BYTES:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -3,16 +3,35 @@ Flask API for NILM (Non-Intrusive Load Monitoring) Models
 Serves BiLSTM, TCN, and ATCN models for appliance disaggregation
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import torch
 import torch.nn as nn
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
+# Serving modules shared with the PV API live in Dashboard/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from inference import batched_window_predict, iter_seq2seq, last_step, run_batches, seq2seq_predict
+from meter_buffers import MeterBufferStore
+from streaming_tcn import StreamingTCN
+from backends import BACKENDS, BackendRegistry, BackendUnavailable
+from common.metrics import NULL_TIMER, Metrics
+from common.micro_batching import MicroBatcher
+from common.model_registry import ModelRegistry
+from common.prefork import serve
+from common.result_cache import ResultCache, make_key
+from common.streaming import StreamJobs, ndjson_response, wants_stream
+from common.wire_format import (JSON_MIME, WireFormatError, columnar_response,
+                                is_binary_request, parse_binary_body, response_mimetype)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
@@ -28,7 +47,34 @@ CONFIG = {
     'num_layers': 3,
     'num_channels': [64, 64, 64, 64, 128, 128, 128, 128],
     'seq_length': 288,
-    'dropout': 0.33
+    'dropout': 0.33,
+    'batch_size': 256,
+    'ingest_max_bytes': 64 * 1024 * 1024,
+    'ingest_idle_timeout': 3600,
+    # Incremental /ingest rebuilds its stream from the buffered window every N readings
+    'incremental_reanchor': int(os.environ.get('NILM_INCREMENTAL_REANCHOR', '288')),
+    # Opt-in coalescing of concurrent /predict calls into batched forward passes
+    'micro_batching': os.environ.get('NILM_MICRO_BATCHING', '0') == '1',
+    'micro_batch_size': 32,
+    'micro_batch_wait_ms': 5.0,
+    # A request waiting longer than this for its micro-batch gets a 503
+    'micro_batch_timeout_s': float(os.environ.get('NILM_MICRO_BATCH_TIMEOUT', '30')),
+    'ensemble_workers': 3,
+    # Inference backend: fp32|int8|torchscript|compile|bf16 (see backends.py)
+    'backend': os.environ.get('NILM_BACKEND', 'fp32'),
+    'backend_tolerance': 1e-2,
+    # Models are loaded on first use; these are loaded at startup
+    'warmup': [m for m in os.environ.get('NILM_WARMUP', '').split(',') if m],
+    'model_memory_mb': int(os.environ.get('NILM_MODEL_MEMORY_MB', '1024')),
+    # /predict result cache (0 entries disables it); NILM_CACHE_URL=redis://... shares it
+    'result_cache_size': int(os.environ.get('NILM_CACHE_SIZE', '10000')),
+    'result_cache_ttl': float(os.environ.get('NILM_CACHE_TTL', '60')),
+    # Metrics start collecting on the first /metrics scrape; NILM_METRICS=1 from startup
+    'metrics': os.environ.get('NILM_METRICS', '0') == '1',
+    # NILM_WORKERS > 0 serves with that many forked workers instead of the dev server
+    'workers': int(os.environ.get('NILM_WORKERS', '0')),
+    'max_requests': int(os.environ.get('NILM_MAX_REQUESTS', '0')),
+    'max_requests_jitter': int(os.environ.get('NILM_MAX_REQUESTS_JITTER', '0'))
 }
 
 APPLIANCE_NAMES = ['EVSE', 'PV', 'CS', 'CHP', 'BA']
@@ -155,76 +201,331 @@ class BiLSTMModel(nn.Module):
         out = self.fc(lstm_out[:, -1, :])
         return out
 
+# ==================== Seq2seq Model Definitions ====================
+# Same backbones, but the head predicts every timestep of the window:
+# output shape is (batch, seq_len, output_size) instead of (batch, output_size).
+# `stitch` is the overlap weighting used when windows are stitched together
+# (see inference.iter_seq2seq): causal models trust late positions most.
+
+class TCNSeq2Seq(TCNModel):
+    seq2seq = True
+    stitch = 'ramp'
+
+    def forward(self, x):
+        x = x.permute(0, 2, 1)
+        x = self.network(x)
+        return self.fc(x.permute(0, 2, 1))
+
+class ATCNSeq2Seq(ATCNModel):
+    seq2seq = True
+    stitch = 'triangle'
+
+    def __init__(self, input_size, num_channels, kernel_size=3, dropout=0.2, output_size=5):
+        super(ATCNSeq2Seq, self).__init__(input_size, num_channels, kernel_size, dropout, output_size)
+        # Each timestep sees its own features plus the attention-pooled window context
+        self.fc = nn.Linear(num_channels[-1] * 2, output_size)
+
+    def forward(self, x):
+        x = x.permute(0, 2, 1)
+        x = self.network(x)
+        x = x.permute(0, 2, 1)
+        context = self.attention(x).unsqueeze(1).expand_as(x)
+        return self.fc(torch.cat((x, context), dim=2))
+
+class BiLSTMSeq2Seq(BiLSTMModel):
+    seq2seq = True
+    stitch = 'triangle'
+
+    def forward(self, x):
+        lstm_out, (_h_n, _c_n) = self.lstm(x)
+        return self.fc(lstm_out)
+
 # ==================== Load Models ====================
 
-models = {}
+models = ModelRegistry(max_bytes=CONFIG['model_memory_mb'] * 1024 * 1024)
 scaler_X = None
 scaler_y = None
 
+def load_bilstm(path):
+    bilstm = BiLSTMModel(
+        input_size=CONFIG['input_size'],
+        hidden_size=CONFIG['hidden_size'],
+        num_layers=CONFIG['num_layers'],
+        output_size=CONFIG['output_size']
+    ).to(device)
+    bilstm.load_state_dict(torch.load(path, map_location=device))
+    bilstm.eval()
+    print("✓ BiLSTM model loaded")
+    return bilstm
+
+def load_tcn(path):
+    tcn = TCNModel(
+        input_size=CONFIG['input_size'],
+        num_channels=CONFIG['num_channels'],
+        dropout=CONFIG['dropout'],
+        output_size=CONFIG['output_size']
+    ).to(device)
+    tcn.load_state_dict(torch.load(path, map_location=device))
+    tcn.eval()
+    print("✓ TCN model loaded")
+    return tcn
+
+def load_atcn(path):
+    atcn = ATCNModel(
+        input_size=CONFIG['input_size'],
+        num_channels=CONFIG['num_channels'],
+        dropout=CONFIG['dropout'],
+        output_size=CONFIG['output_size']
+    ).to(device)
+    atcn.load_state_dict(torch.load(path, map_location=device))
+    atcn.eval()
+    print("✓ ATCN model loaded")
+    return atcn
+
+def build_seq2seq(name):
+    """Untrained seq2seq model for name (bilstm_seq2seq|tcn_seq2seq|atcn_seq2seq)"""
+    if name == 'bilstm_seq2seq':
+        return BiLSTMSeq2Seq(
+            input_size=CONFIG['input_size'],
+            hidden_size=CONFIG['hidden_size'],
+            num_layers=CONFIG['num_layers'],
+            output_size=CONFIG['output_size']
+        )
+    model_class = {'tcn_seq2seq': TCNSeq2Seq, 'atcn_seq2seq': ATCNSeq2Seq}[name]
+    return model_class(
+        input_size=CONFIG['input_size'],
+        num_channels=CONFIG['num_channels'],
+        dropout=CONFIG['dropout'],
+        output_size=CONFIG['output_size']
+    )
+
+def load_seq2seq(name, path):
+    model = build_seq2seq(name).to(device)
+    model.load_state_dict(torch.load(path, map_location=device))
+    model.eval()
+    print(f"✓ {name} model loaded")
+    return model
+
+MODEL_FILES = {
+    'bilstm': ('BiLSTM_best.pth', load_bilstm),
+    'tcn': ('TCN_best.pth', load_tcn),
+    'atcn': ('ATCN_best.pth', load_atcn),
+    # Seq2seq variants, trained with train_seq2seq.py
+    'bilstm_seq2seq': ('BiLSTM_seq2seq_best.pth', partial(load_seq2seq, 'bilstm_seq2seq')),
+    'tcn_seq2seq': ('TCN_seq2seq_best.pth', partial(load_seq2seq, 'tcn_seq2seq')),
+    'atcn_seq2seq': ('ATCN_seq2seq_best.pth', partial(load_seq2seq, 'atcn_seq2seq'))
+}
+
 def load_models():
-    global models, scaler_X, scaler_y
+    """Register every model found in MODELS_DIR and load the warmup list"""
+    global scaler_X, scaler_y
     
     try:
-        # Load BiLSTM
-        bilstm_path = MODELS_DIR / 'BiLSTM_best.pth'
-        if bilstm_path.exists():
-            bilstm = BiLSTMModel(
-                input_size=CONFIG['input_size'],
-                hidden_size=CONFIG['hidden_size'],
-                num_layers=CONFIG['num_layers'],
-                output_size=CONFIG['output_size']
-            ).to(device)
-            bilstm.load_state_dict(torch.load(bilstm_path, map_location=device))
-            bilstm.eval()
-            models['bilstm'] = bilstm
-            print("✓ BiLSTM model loaded")
-        
-        # Load TCN
-        tcn_path = MODELS_DIR / 'TCN_best.pth'
-        if tcn_path.exists():
-            tcn = TCNModel(
-                input_size=CONFIG['input_size'],
-                num_channels=CONFIG['num_channels'],
-                dropout=CONFIG['dropout'],
-                output_size=CONFIG['output_size']
-            ).to(device)
-            tcn.load_state_dict(torch.load(tcn_path, map_location=device))
-            tcn.eval()
-            models['tcn'] = tcn
-            print("✓ TCN model loaded")
-        
-        # Load ATCN
-        atcn_path = MODELS_DIR / 'ATCN_best.pth'
-        if atcn_path.exists():
-            atcn = ATCNModel(
-                input_size=CONFIG['input_size'],
-                num_channels=CONFIG['num_channels'],
-                dropout=CONFIG['dropout'],
-                output_size=CONFIG['output_size']
-            ).to(device)
-            atcn.load_state_dict(torch.load(atcn_path, map_location=device))
-            atcn.eval()
-            models['atcn'] = atcn
-            print("✓ ATCN model loaded")
+        for name, (filename, loader) in MODEL_FILES.items():
+            path = MODELS_DIR / filename
+            if path.exists():
+                models.register(name, lambda loader=loader, path=path: loader(path), path)
+            else:
+                print(f"✗ {name} model not found at {path}")
         
         # Initialize scalers (would need to be saved during training)
+        from sklearn.preprocessing import StandardScaler
         scaler_X = StandardScaler()
         scaler_y = StandardScaler()
         
-        print(f"\nLoaded {len(models)} models successfully on {device}")
+        print(f"\nRegistered {len(models)} models on {device}")
+        
+        # Load the warmup list now and build its inference backends
+        for name in CONFIG['warmup']:
+            if name in models:
+                active = backends.activate(name)
+                print(f"✓ {name} backend: {active}")
         
     except Exception as e:
         print(f"Error loading models: {e}")
 
+backends = BackendRegistry(models, CONFIG['seq_length'], device,
+                           default_backend=CONFIG['backend'],
+                           tolerance=CONFIG['backend_tolerance'])
+models.on_evict(backends.invalidate)
+
+def prepare_for_fork():
+    """Load every model and its active backend once, in shared memory, before forking"""
+    for name in models.keys():
+        active = backends.activate(name)
+        print(f"✓ {name} backend: {active}")
+    for name in models.loaded():
+        models[name].share_memory()
+    backends.share_memory()
+
+def get_model(model_name, backend=None):
+    """Return the runnable module of model_name under backend (default: active)"""
+    return backends.get(model_name, backend)
+
+result_cache = ResultCache(max_entries=CONFIG['result_cache_size'],
+                           ttl=CONFIG['result_cache_ttl'],
+                           redis_url=os.environ.get('NILM_CACHE_URL'),
+                           prefix='nilm')
+
+stream_jobs = StreamJobs()
+
+meter_buffers = MeterBufferStore(CONFIG['seq_length'],
+                                 max_bytes=CONFIG['ingest_max_bytes'],
+                                 idle_timeout=CONFIG['ingest_idle_timeout'])
+
+metrics = Metrics('nilm', enabled=CONFIG['metrics'])
+
+def predict_window(model, window, normalize=True, timer=NULL_TIMER):
+    """Run one window through model and return per-appliance power"""
+    with timer.stage('scaling'):
+        aggregate_array = np.asarray(window, dtype=np.float64).reshape(-1, 1)
+        
+        # Normalize if requested
+        if normalize:
+            # Use simple normalization (ideally should use fitted scaler)
+            mean = aggregate_array.mean()
+            std = aggregate_array.std() + 1e-8
+            aggregate_scaled = (aggregate_array - mean) / std
+        else:
+            aggregate_scaled = aggregate_array
+        
+        # Convert to tensor
+        input_tensor = torch.FloatTensor(aggregate_scaled).unsqueeze(0).to(device)
+    
+    with timer.stage('forward'), torch.no_grad():
+        prediction = last_step(model(input_tensor)).cpu().numpy()[0]
+    
+    # Denormalize if needed
+    if normalize:
+        # Simple denormalization (ideally use fitted scaler)
+        prediction = prediction * std + mean
+    
+    return prediction
+
+def predict_incremental(meter_key, model_name, window, new_values, total, normalize=True):
+    """
+    Advance the meter's StreamingTCN by the new readings and return
+    (prediction, exact). The stream records the buffer total it has consumed;
+    if readings reached the buffer without going through it (non-incremental
+    calls, the other model, concurrent requests) it is rebuilt from the
+    buffered window. It is also rebuilt every incremental_reanchor readings.
+    Only a rebuilt stream matches predict_window exactly; in between, it
+    keeps the causal history the windowed forward pass cuts off (see
+    streaming_tcn.py) and its normalization stays frozen.
+    """
+    with meter_buffers.meter_lock(meter_key):
+        stream = meter_buffers.get_state(meter_key, model_name)
+        exact = (stream is None or stream.total != total - len(new_values) or
+                 stream.normalize != bool(normalize) or
+                 total - stream.anchor_total >= CONFIG['incremental_reanchor'])
+        if exact:
+            # Warm up on the buffered window and freeze its normalization
+            if normalize:
+                mean, std = float(window.mean()), float(window.std()) + 1e-8
+            else:
+                mean, std = 0.0, 1.0
+            stream = StreamingTCN(models[model_name], CONFIG['seq_length'])
+            stream.mean, stream.std = mean, std
+            stream.normalize = bool(normalize)
+            stream.anchor_total = total
+            output = stream.extend((window - mean) / std)
+            meter_buffers.set_state(meter_key, model_name, stream)
+        else:
+            values = np.asarray(new_values, dtype=np.float64)
+            output = stream.extend((values - stream.mean) / stream.std)
+        stream.total = total
+    
+    prediction = output.cpu().numpy()[0]
+    if normalize:
+        prediction = prediction * stream.std + stream.mean
+    return prediction, exact
+
+batchers = {}
+batchers_lock = threading.Lock()
+
+def predict_windows(model, windows, normalize_flags):
+    """Batched predict_window: one forward pass over equally sized windows"""
+    batch = np.asarray(windows, dtype=np.float64)
+    flags = np.asarray(normalize_flags, dtype=bool)
+    means = np.where(flags, batch.mean(axis=1), 0.0)
+    stds = np.where(flags, batch.std(axis=1) + 1e-8, 1.0)
+    batch_scaled = (batch - means[:, None]) / stds[:, None]
+    
+    input_tensor = torch.FloatTensor(batch_scaled).unsqueeze(2).to(device)
+    with torch.no_grad():
+        predictions = last_step(model(input_tensor)).cpu().numpy()
+    
+    return predictions * stds[:, None] + means[:, None]
+
+def get_batcher(model_name):
+    """Return the MicroBatcher for model_name, creating it on first use"""
+    with batchers_lock:
+        if model_name not in batchers:
+            def run_batch(items, model_name=model_name):
+                windows, flags = zip(*items)
+                if metrics.enabled:
+                    metrics.observe_batch('micro_batch', model_name, len(items))
+                return list(predict_windows(get_model(model_name), windows, flags))
+            batchers[model_name] = MicroBatcher(run_batch,
+                                                max_batch_size=CONFIG['micro_batch_size'],
+                                                max_wait_ms=CONFIG['micro_batch_wait_ms'],
+                                                name=model_name)
+        return batchers[model_name]
+
+# Shared pool used by /ensemble_predict to run the models concurrently
+ensemble_pool = ThreadPoolExecutor(max_workers=CONFIG['ensemble_workers'],
+                                   thread_name_prefix='ensemble')
+
+def timed_forward(model, input_tensor):
+    """Forward pass returning (prediction, latency in ms)"""
+    start = time.perf_counter()
+    with torch.no_grad():
+        prediction = last_step(model(input_tensor)).cpu().numpy()[0]
+    return prediction, (time.perf_counter() - start) * 1000.0
+
 # ==================== API Routes ====================
 
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        endpoint, status = request.endpoint or 'unknown', response.status_code
+        request_bytes = request.content_length or 0
+        if response.is_streamed:
+            # The body is produced after this returns: time it until the stream is closed
+            response.call_on_close(lambda: metrics.observe_request(
+                endpoint, status, time.perf_counter() - start, request_bytes))
+        else:
+            metrics.observe_request(endpoint, status, time.perf_counter() - start, request_bytes)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition; the first scrape switches collection on"""
+    metrics.enabled = True
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'models_loaded': list(models.keys()),
-        'device': str(device)
+        'models_loaded': models.loaded(),
+        'models_available': models.keys(),
+        'model_cache': models.stats(),
+        'result_cache': result_cache.stats(),
+        'device': str(device),
+        'ingest_buffers': meter_buffers.stats(),
+        'streams': stream_jobs.stats(),
+        'micro_batching': {
+            'enabled': CONFIG['micro_batching'],
+            'batchers': {name: b.stats() for name, b in batchers.items()}
+        }
     })
 
 @app.route('/predict', methods=['POST'])
@@ -234,11 +535,14 @@ def predict():
     Request: {
         "model": "bilstm|tcn|atcn",
         "aggregate_power": [list of power values],
-        "normalize": true|false
+        "normalize": true|false,
+        "backend": "fp32|int8|torchscript|compile|bf16" (optional)
     }
     """
+    timer = metrics.timer('predict')
     try:
-        data = request.get_json()
+        with timer.stage('parse'):
+            data = request.get_json()
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -246,37 +550,41 @@ def predict():
         model_name = data.get('model', 'atcn').lower()
         aggregate_power = data.get('aggregate_power', [])
         normalize = data.get('normalize', True)
+        backend = data.get('backend')
+        timer.model = model_name
         
         if model_name not in models:
             return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
         
+        if backend is not None and backend not in BACKENDS:
+            return jsonify({'error': f'Unknown backend {backend}. Available: {BACKENDS}'}), 400
+        
         if not aggregate_power or len(aggregate_power) < CONFIG['seq_length']:
             return jsonify({'error': f'Need at least {CONFIG["seq_length"]} data points'}), 400
         
-        # Prepare input
-        aggregate_array = np.array(aggregate_power[-CONFIG['seq_length']:]).reshape(-1, 1)
-        
-        # Normalize if requested
-        if normalize:
-            # Use simple normalization (ideally should use fitted scaler)
-            mean = aggregate_array.mean()
-            std = aggregate_array.std() + 1e-8
-            aggregate_scaled = (aggregate_array - mean) / std
+        window = aggregate_power[-CONFIG['seq_length']:]
+        
+        # Identical windows (dashboard polling) are answered from the cache
+        cache_key = None
+        if result_cache.enabled:
+            active_backend = backend or backends.active.get(model_name, CONFIG['backend'])
+            cache_key = make_key(model_name, models.version(model_name), window,
+                                 active_backend, bool(normalize))
+            with timer.stage('cache_lookup'):
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                with timer.stage('serialize'):
+                    return jsonify(cached)
+        
+        timer.batch_size(1)
+        if CONFIG['micro_batching'] and backend is None:
+            with timer.stage('micro_batch'):
+                prediction = get_batcher(model_name).submit(
+                    (window, bool(normalize)), timeout=CONFIG['micro_batch_timeout_s'])
         else:
-            aggregate_scaled = aggregate_array
-        
-        # Convert to tensor
-        input_tensor = torch.FloatTensor(aggregate_scaled).unsqueeze(0).to(device)
-        
-        # Predict
-        model = models[model_name]
-        with torch.no_grad():
-            prediction = model(input_tensor).cpu().numpy()[0]
-        
-        # Denormalize if needed
-        if normalize:
-            # Simple denormalization (ideally use fitted scaler)
-            prediction = prediction * std + mean
+            with timer.stage('model_load'):
+                model = get_model(model_name, backend)
+            prediction = predict_window(model, window, normalize, timer)
         
         # Format response
         result = {
@@ -288,8 +596,16 @@ def predict():
             'aggregate_input': float(aggregate_power[-1])
         }
         
-        return jsonify(result)
+        if cache_key is not None:
+            result_cache.put(cache_key, result)
         
+        with timer.stage('serialize'):
+            return jsonify(result)
+        
+    except TimeoutError:
+        return jsonify({'error': 'Timed out waiting for a micro-batch'}), 503
+    except BackendUnavailable as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -298,64 +614,312 @@ def batch_predict():
     """
     Batch prediction for time series data
     Request: {
-        "model": "bilstm|tcn|atcn",
+        "model": "bilstm|tcn|atcn|bilstm_seq2seq|tcn_seq2seq|atcn_seq2seq",
         "aggregate_power": [list of power values],
-        "window_size": 288
+        "window_size": 288,
+        "batch_size": 256,
+        "backend": "fp32|int8|torchscript|compile|bf16" (optional),
+        "stream": true|false,
+        "stride": 144 (seq2seq only),
+        "stitch": "ramp|triangle|uniform" (seq2seq only)
     }
+    Point models predict the last sample of every sliding window (indices
+    window_size-1 ... n-1). Seq2seq models run windows every `stride` samples
+    and blend the overlapping outputs, predicting every sample (0 ... n-1)
+    in watts with roughly window_size/stride forward passes per window.
+    With "stream" (or Accept: application/x-ndjson) results are sent as
+    newline-delimited JSON, one mini-batch at a time, after a header line
+    carrying the job id; DELETE /batch_predict/<job_id> cancels the job.
+    aggregate_power may instead be sent as a raw float32, .npy or Arrow body
+    with the other fields in the query string. Accept: application/x-npz or
+    application/vnd.apache.arrow.stream returns one array per appliance.
     """
+    timer = metrics.timer('batch_predict')
     try:
-        data = request.get_json()
+        with timer.stage('parse'):
+            if is_binary_request(request):
+                data = request.args.to_dict()
+                data['aggregate_power'] = np.asarray(parse_binary_body(request), dtype=np.float64).ravel()
+            else:
+                data = request.get_json()
         
         model_name = data.get('model', 'atcn').lower()
         aggregate_power = data.get('aggregate_power', [])
-        window_size = data.get('window_size', CONFIG['seq_length'])
+        window_size = int(data.get('window_size', CONFIG['seq_length']))
+        batch_size = int(data.get('batch_size', CONFIG['batch_size']))
+        backend = data.get('backend')
+        timer.model = model_name
         
         if model_name not in models:
             return jsonify({'error': f'Model {model_name} not available'}), 400
         
+        if backend is not None and backend not in BACKENDS:
+            return jsonify({'error': f'Unknown backend {backend}. Available: {BACKENDS}'}), 400
+        
+        if window_size < 1 or batch_size < 1:
+            return jsonify({'error': 'window_size and batch_size must be positive'}), 400
+        
         if len(aggregate_power) < window_size:
             return jsonify({'error': f'Need at least {window_size} data points'}), 400
         
-        # Create sliding windows
-        predictions = []
-        for i in range(len(aggregate_power) - window_size + 1):
-            window = aggregate_power[i:i+window_size]
-            window_array = np.array(window).reshape(-1, 1)
-            
-            # Simple normalization
-            mean = window_array.mean()
-            std = window_array.std() + 1e-8
-            window_scaled = (window_array - mean) / std
+        seq2seq = getattr(models[model_name], 'seq2seq', False)
+        if seq2seq:
+            stride = int(data.get('stride', max(1, window_size // 2)))
+            stitch = data.get('stitch', models[model_name].stitch)
+            if not 1 <= stride <= window_size:
+                return jsonify({'error': 'stride must be between 1 and window_size'}), 400
+            if stitch not in ('ramp', 'triangle', 'uniform'):
+                return jsonify({'error': f'Unknown stitch weighting {stitch}'}), 400
+        
+        with timer.stage('model_load'):
+            model = get_model(model_name, backend)
+        
+        if seq2seq and wants_stream(request, data):
+            def chunks():
+                for start, _stop, segment in iter_seq2seq(model, aggregate_power, window_size, stride,
+                                                          batch_size, device, stitch=stitch):
+                    yield [{
+                        'index': start + i,
+                        'appliances': dict(zip(APPLIANCE_NAMES, pred))
+                    } for i, pred in enumerate(segment.tolist())]
+            return ndjson_response(stream_jobs, chunks(),
+                                   header={'model': model_name, 'count': len(aggregate_power)})
+        
+        if wants_stream(request, data):
+            n_windows = len(aggregate_power) - window_size + 1
+            def chunks():
+                for start, batch_preds in run_batches(model, aggregate_power, window_size,
+                                                      batch_size, device):
+                    yield [{
+                        'index': start + i + window_size - 1,
+                        'appliances': dict(zip(APPLIANCE_NAMES, pred))
+                    } for i, pred in enumerate(batch_preds.tolist())]
+            return ndjson_response(stream_jobs, chunks(),
+                                   header={'model': model_name, 'count': n_windows})
+        
+        # Run every sliding window through the model in mini-batches
+        with timer.stage('forward'):
+            if seq2seq:
+                preds = seq2seq_predict(model, aggregate_power, window_size, stride,
+                                        batch_size, device, stitch=stitch)
+                first_index = 0
+            else:
+                preds = batched_window_predict(model, aggregate_power, window_size, batch_size, device)
+                first_index = window_size - 1
+        timer.batch_size(len(preds))
+        
+        mimetype = response_mimetype(request)
+        with timer.stage('serialize'):
+            if mimetype != JSON_MIME:
+                columns = {'index': np.arange(first_index, first_index + len(preds))}
+                for j, name in enumerate(APPLIANCE_NAMES):
+                    columns[name] = preds[:, j].astype(np.float32)
+                return columnar_response(columns, mimetype,
+                                         meta={'model': model_name, 'count': len(preds)})
             
-            input_tensor = torch.FloatTensor(window_scaled).unsqueeze(0).to(device)
+            predictions = []
+            for i, pred in enumerate(preds.tolist()):
+                predictions.append({
+                    'index': i + first_index,
+                    'appliances': dict(zip(APPLIANCE_NAMES, pred))
+                })
             
-            model = models[model_name]
-            with torch.no_grad():
-                pred = model(input_tensor).cpu().numpy()[0]
-            
-            predictions.append({
-                'index': i + window_size - 1,
-                'appliances': {
-                    name: float(value) for name, value in zip(APPLIANCE_NAMES, pred)
-                }
+            return jsonify({
+                'model': model_name,
+                'predictions': predictions,
+                'count': len(predictions)
             })
         
+    except WireFormatError as e:
+        return jsonify({'error': str(e)}), e.status
+    except BackendUnavailable as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch_predict/<job_id>', methods=['DELETE'])
+def cancel_batch_predict(job_id):
+    """Cancel a streamed /batch_predict job"""
+    if not stream_jobs.cancel(job_id):
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify({'job_id': job_id, 'cancelled': True})
+
+@app.route('/ensemble_predict', methods=['POST'])
+def ensemble_predict():
+    """
+    Run several models on the same window in one pass
+    Request: {
+        "models": ["bilstm", "tcn", "atcn"],
+        "aggregate_power": [list of power values],
+        "normalize": true|false,
+        "weights": {"bilstm": 1, "tcn": 1, "atcn": 1}
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        model_names = [m.lower() for m in data.get('models', list(models.keys()))]
+        aggregate_power = data.get('aggregate_power', [])
+        normalize = data.get('normalize', True)
+        weights = data.get('weights', {})
+        
+        missing = [m for m in model_names if m not in models]
+        if missing or not model_names:
+            return jsonify({'error': f'Models {missing} not available. Available: {list(models.keys())}'}), 400
+        
+        if not aggregate_power or len(aggregate_power) < CONFIG['seq_length']:
+            return jsonify({'error': f'Need at least {CONFIG["seq_length"]} data points'}), 400
+        
+        weight_values = np.array([float(weights.get(m, 1.0)) for m in model_names])
+        if weight_values.sum() <= 0:
+            return jsonify({'error': 'Ensemble weights must sum to a positive value'}), 400
+        
+        # Preprocess once for every model
+        start = time.perf_counter()
+        aggregate_array = np.asarray(aggregate_power[-CONFIG['seq_length']:], dtype=np.float64)
+        if normalize:
+            mean = aggregate_array.mean()
+            std = aggregate_array.std() + 1e-8
+        else:
+            mean, std = 0.0, 1.0
+        aggregate_scaled = (aggregate_array - mean) / std
+        input_tensor = torch.FloatTensor(aggregate_scaled).reshape(1, -1, 1).to(device)
+        preprocess_ms = (time.perf_counter() - start) * 1000.0
+        
+        futures = {m: ensemble_pool.submit(timed_forward, get_model(m), input_tensor) for m in model_names}
+        
+        per_model = {}
+        stacked = []
+        for m in model_names:
+            prediction, latency_ms = futures[m].result()
+            prediction = prediction * std + mean
+            stacked.append(prediction)
+            per_model[m] = {
+                'appliances': {
+                    name: float(value) for name, value in zip(APPLIANCE_NAMES, prediction)
+                },
+                'total_predicted': float(prediction.sum()),
+                'latency_ms': latency_ms
+            }
+        
+        ensemble = np.average(np.vstack(stacked), axis=0, weights=weight_values)
+        
         return jsonify({
+            'models': per_model,
+            'ensemble': {
+                'appliances': {
+                    name: float(value) for name, value in zip(APPLIANCE_NAMES, ensemble)
+                },
+                'total_predicted': float(ensemble.sum()),
+                'weights': {m: float(w) for m, w in zip(model_names, weight_values / weight_values.sum())}
+            },
+            'preprocess_ms': preprocess_ms,
+            'total_ms': (time.perf_counter() - start) * 1000.0,
+            'aggregate_input': float(aggregate_power[-1])
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    """
+    Stream new readings for a meter and predict on its latest window
+    Request: {
+        "meter_id": "meter-42",
+        "aggregate_power": [new power values] | float,
+        "model": "bilstm|tcn|atcn",
+        "normalize": true|false,
+        "incremental": true|false
+    }
+    With "incremental" (tcn/atcn only) the meter keeps cached dilated-conv
+    activations and only the new timesteps are computed. Normalization stats
+    are frozen from the first full window of the meter. Readings ingested
+    without incremental (or for another model) make the stream rebuild from
+    the buffered window on its next call, and it is rebuilt every
+    incremental_reanchor readings. "exact" is false for outputs of a stream
+    that was not just rebuilt: those keep causal history past the window and
+    approximate the non-incremental result.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        meter_id = data.get('meter_id')
+        model_name = data.get('model', 'atcn').lower()
+        new_values = data.get('aggregate_power', [])
+        normalize = data.get('normalize', True)
+        incremental = data.get('incremental', False)
+        
+        if meter_id is None:
+            return jsonify({'error': 'meter_id is required'}), 400
+        
+        if model_name not in models:
+            return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
+        
+        if incremental and model_name not in ('tcn', 'atcn'):
+            return jsonify({'error': 'incremental mode is only available for tcn and atcn'}), 400
+        
+        if not isinstance(new_values, list):
+            new_values = [new_values]
+        
+        meter_key = str(meter_id)
+        window, count, total = meter_buffers.ingest(meter_key, new_values)
+        
+        if count < CONFIG['seq_length']:
+            # Not enough history yet to fill a window
+            return jsonify({
+                'meter_id': meter_id,
+                'buffered': count,
+                'required': CONFIG['seq_length'],
+                'ready': False
+            }), 202
+        
+        exact = True
+        if incremental:
+            prediction, exact = predict_incremental(meter_key, model_name, window, new_values,
+                                                    total, normalize)
+        else:
+            prediction = predict_window(get_model(model_name), window, normalize)
+        
+        return jsonify({
+            'meter_id': meter_id,
             'model': model_name,
-            'predictions': predictions,
-            'count': len(predictions)
+            'ready': True,
+            'incremental': bool(incremental),
+            'exact': exact,
+            'index': total - 1,
+            'appliances': {
+                name: float(value) for name, value in zip(APPLIANCE_NAMES, prediction)
+            },
+            'total_predicted': float(prediction.sum()),
+            'aggregate_input': float(window[-1])
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ingest/<meter_id>', methods=['DELETE'])
+def drop_meter(meter_id):
+    """Forget the buffered readings of a meter"""
+    if not meter_buffers.drop(meter_id):
+        return jsonify({'error': f'Unknown meter {meter_id}'}), 404
+    return jsonify({'meter_id': meter_id, 'dropped': True})
+
 @app.route('/models', methods=['GET'])
 def get_models():
     """Get available models and their info"""
     return jsonify({
         'available_models': list(models.keys()),
         'appliances': APPLIANCE_NAMES,
-        'config': CONFIG
+        'config': CONFIG,
+        'backends': backends.report(),
+        'supported_backends': BACKENDS
     })
 
 # ==================== Main ====================
@@ -365,5 +929,11 @@ if __name__ == '__main__':
     print("NILM API Server")
     print("="*50)
     load_models()
-    print("\nStarting Flask server...")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    if CONFIG['workers'] > 0:
+        print(f"\nStarting {CONFIG['workers']} workers...")
+        serve(app, '0.0.0.0', 5001, CONFIG['workers'], prepare=prepare_for_fork,
+              cleanup=stream_jobs.close, max_requests=CONFIG['max_requests'],
+              max_requests_jitter=CONFIG['max_requests_jitter'])
+    else:
+        print("\nStarting Flask server...")
+        app.run(host='0.0.0.0', port=5001, debug=True)
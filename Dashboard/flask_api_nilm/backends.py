@@ -0,0 +1,268 @@
+"""
+CPU inference backends for the NILM models
+
+Each loaded fp32 model can be wrapped in one of several backends:
+    fp32         - the eager PyTorch module as loaded
+    int8         - dynamic int8 quantization of LSTM/Linear layers
+    torchscript  - torch.jit.trace of the eager module
+    compile      - torch.compile of the eager module
+    bf16         - bfloat16 weights/activations (only where the CPU supports it)
+
+Every backend is checked against fp32 on a fixed reference window set when it
+is built, and its single-window latency is measured, so /models can report
+what is active and how it behaves. Built modules are attached to their fp32
+model in the ModelRegistry, so they count toward its memory budget and are
+dropped when the model is evicted. A backend that is unsupported on this
+device or exceeds the accuracy tolerance is refused: explicit requests for it
+fail with BackendUnavailable, and activating it falls back to fp32.
+"""
+
+import copy
+import io
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+BACKENDS = ['fp32', 'int8', 'torchscript', 'compile', 'bf16']
+
+
+class BackendUnavailable(ValueError):
+    """The backend cannot serve this model here (unsupported or not accurate enough)"""
+
+
+def bf16_supported(device):
+    """True if bfloat16 matmuls are natively supported on device"""
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    return torch.backends.cpu.get_cpu_capability() in ('AVX512', 'AVX512_BF16', 'AMX')
+
+
+class _CpuWrapper(nn.Module):
+    """Runs a CPU-only (quantized) module on inputs from any device"""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        return self.module(x.cpu()).to(x.device)
+
+
+class _CastWrapper(nn.Module):
+    """Runs a module in another dtype and returns float32 outputs"""
+
+    def __init__(self, module, dtype):
+        super().__init__()
+        self.module = module
+        self.dtype = dtype
+
+    def forward(self, x):
+        return self.module(x.to(self.dtype)).float()
+
+
+def build_backend(model, backend, example_input):
+    """Return an eval-mode module equivalent to model under the given backend"""
+    if backend == 'fp32':
+        return model
+    if backend == 'int8':
+        quantized = torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(model).cpu(), {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+        return _CpuWrapper(quantized.eval()).eval()
+    if backend == 'torchscript':
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            traced = torch.jit.freeze(torch.jit.trace(model, example_input).eval())
+        return traced
+    if backend == 'compile':
+        return torch.compile(model, dynamic=True)
+    if backend == 'bf16':
+        if not bf16_supported(example_input.device):
+            raise BackendUnavailable('bf16 is not supported on this device')
+        return _CastWrapper(copy.deepcopy(model).to(torch.bfloat16), torch.bfloat16).eval()
+    raise ValueError(f'Unknown backend {backend}. Available: {BACKENDS}')
+
+
+def backend_size(module, backend):
+    """Extra resident bytes of a built backend (serialized size of its weights)"""
+    if backend in ('fp32', 'compile'):
+        return 0  # shares the fp32 model's tensors
+    buf = io.BytesIO()
+    if isinstance(module, torch.jit.ScriptModule):
+        torch.jit.save(module, buf)
+    else:
+        torch.save(module.state_dict(), buf)
+    return buf.getbuffer().nbytes
+
+
+def reference_windows(seq_length, count=16, seed=0):
+    """Fixed set of normalized windows used for accuracy checks"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seq_length)
+    windows = []
+    for _ in range(count):
+        base = rng.uniform(0.5, 2.0) * np.sin(2 * np.pi * t / seq_length * rng.uniform(1, 4))
+        steps = rng.normal(0, 1, seq_length).cumsum() * 0.1
+        window = base + steps
+        windows.append((window - window.mean()) / (window.std() + 1e-8))
+    return torch.FloatTensor(np.array(windows)).unsqueeze(2)
+
+
+def accuracy_check(reference, candidate, windows, device):
+    """Compare candidate against reference on windows; returns error stats"""
+    with torch.no_grad():
+        expected = reference(windows.to(device)).float().cpu()
+        actual = candidate(windows.to(device)).float().cpu()
+    abs_err = (expected - actual).abs()
+    scale = expected.abs().max().item() + 1e-8
+    return {
+        'max_abs_error': abs_err.max().item(),
+        'mean_abs_error': abs_err.mean().item(),
+        'max_rel_error': abs_err.max().item() / scale
+    }
+
+
+def measure_latency(module, example_input, repeats=10):
+    """Median single-call latency in milliseconds"""
+    timings = []
+    with torch.no_grad():
+        module(example_input)  # warm up (and trigger compilation)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            module(example_input)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+class BackendRegistry:
+    """
+    Builds backends lazily per (model, backend), keeps the active backend per
+    model and the accuracy/latency report of everything that was built.
+    Built modules live in the model registry as attachments of their model.
+    """
+
+    def __init__(self, models, seq_length, device, default_backend='fp32', tolerance=1e-2):
+        self.models = models
+        self.seq_length = seq_length
+        self.device = device
+        self.default_backend = default_backend
+        self.tolerance = tolerance
+        self.active = {}
+        self.fallbacks = {}
+        self._reports = {}
+        self._failed = {}
+        self._build_locks = {}
+        # Guards the dicts above; builds run under a per-(model, backend) lock
+        # instead, so a slow first build does not block other models.
+        # Re-entrant: loading a model can evict another, which calls back
+        # into invalidate()
+        self._lock = threading.RLock()
+        self._windows = reference_windows(seq_length)
+
+    def _cached(self, model, model_name, backend):
+        """The built module, or None if it still has to be (re)built"""
+        if backend == 'fp32':
+            with self._lock:
+                return model if (model_name, backend) in self._reports else None
+        return self.models.attached(model_name, backend)
+
+    def _build(self, model_name, backend):
+        key = (model_name, backend)
+        model = self.models[model_name]
+        module = self._cached(model, model_name, backend)
+        if module is not None:
+            return module
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            module = self._cached(model, model_name, backend)
+            if module is not None:
+                return module
+            with self._lock:
+                if key in self._failed:
+                    raise BackendUnavailable(self._failed[key])
+            example = torch.zeros(1, self.seq_length, 1, device=self.device)
+            try:
+                module = build_backend(model, backend, example)
+            except BackendUnavailable as e:
+                with self._lock:
+                    self._failed[key] = str(e)
+                raise
+            report = accuracy_check(model, module, self._windows, self.device)
+            report['accuracy_ok'] = report['max_rel_error'] <= self.tolerance
+            report['latency_ms'] = measure_latency(module, example)
+            with self._lock:
+                self._reports[key] = report
+                if not report['accuracy_ok']:
+                    self._failed[key] = (f"{backend} backend of {model_name} exceeds the accuracy "
+                                         f"tolerance ({report['max_rel_error']:.4g} > {self.tolerance})")
+                    print(f"! {self._failed[key]}")
+                    raise BackendUnavailable(self._failed[key])
+            if backend != 'fp32':
+                # Not kept if the model was evicted meanwhile; rebuilt on next use
+                self.models.attach(model_name, backend, module, backend_size(module, backend))
+            return module
+
+    def activate(self, model_name, backend=None):
+        """Build and select the backend for model_name (falls back to fp32 on failure)"""
+        backend = backend or self.default_backend
+        try:
+            self._build(model_name, backend)
+            with self._lock:
+                self.fallbacks.pop(model_name, None)
+        except Exception as e:
+            print(f"! Could not use {backend} backend for {model_name}: {e}; using fp32")
+            with self._lock:
+                self.fallbacks[model_name] = {'requested': backend, 'reason': str(e)}
+            backend = 'fp32'
+            self._build(model_name, backend)
+        with self._lock:
+            self.active[model_name] = backend
+        return backend
+
+    def invalidate(self, model_name):
+        """
+        Forget failed checks of model_name after it was unloaded (its built
+        modules went with it), so a reloaded model is checked again
+        """
+        with self._lock:
+            for key in [k for k in self._failed if k[0] == model_name]:
+                del self._failed[key]
+
+    def get(self, model_name, backend=None):
+        """
+        Return the module for model_name under backend (default: the active
+        one); raises BackendUnavailable if that backend was refused
+        """
+        if backend is None:
+            backend = self.active.get(model_name) or self.activate(model_name)
+        return self._build(model_name, backend)
+
+    def share_memory(self):
+        """Move every built module's tensors to shared memory (before forking workers)"""
+        with self._lock:
+            keys = list(self._reports)
+        for model_name, backend in keys:
+            module = self.models.attached(model_name, backend)
+            if module is not None:
+                try:
+                    module.share_memory()
+                except Exception as e:
+                    print(f"! Could not share {backend} backend of {model_name}: {e}")
+
+    def report(self):
+        with self._lock:
+            result = {}
+            for key in list(self._reports) + [k for k in self._failed if k not in self._reports]:
+                model_name, backend = key
+                entry = result.setdefault(model_name, {'active': self.active.get(model_name), 'backends': {}})
+                entry['backends'][backend] = dict(self._reports.get(key, {}))
+                if key in self._failed:
+                    entry['backends'][backend]['error'] = self._failed[key]
+            for model_name, fallback in self.fallbacks.items():
+                entry = result.setdefault(model_name, {'active': self.active.get(model_name), 'backends': {}})
+                entry['fallback'] = fallback
+            return result
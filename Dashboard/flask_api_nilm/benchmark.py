@@ -0,0 +1,176 @@
+"""
+Benchmark suite for the NILM API
+
+Runs the Flask app in-process (default) or against a running server (--url),
+sweeping model, concurrency, window count and batch size for /predict and
+/batch_predict, and microbenchmarks each model's forward pass. Results are
+written as JSON; pass --compare with an earlier file to flag regressions.
+
+Usage:
+    python benchmark.py --random-weights --output bench_nilm.json
+    python benchmark.py --url http://localhost:5001 --concurrency 1 8 32
+    python benchmark.py --random-weights --compare bench_nilm.json
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# Shared serving modules live in Dashboard/common (also when run as a script)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as nilm
+from common.load_test import (HttpClient, InProcessClient, compare_results, microbench,
+                              print_result, run_load, write_results)
+
+MODEL_CLASSES = {
+    'bilstm': lambda c: nilm.BiLSTMModel(c['input_size'], c['hidden_size'],
+                                         c['num_layers'], c['output_size']),
+    'tcn': lambda c: nilm.TCNModel(c['input_size'], c['num_channels'],
+                                   dropout=c['dropout'], output_size=c['output_size']),
+    'atcn': lambda c: nilm.ATCNModel(c['input_size'], c['num_channels'],
+                                     dropout=c['dropout'], output_size=c['output_size'])
+}
+
+
+def setup_models(random_weights):
+    """Register the saved models, or randomly initialized ones (same cost per call)"""
+    if random_weights:
+        torch.manual_seed(0)
+        for name, build in MODEL_CLASSES.items():
+            nilm.models[name] = build(nilm.CONFIG).to(nilm.device).eval()
+    else:
+        nilm.load_models()
+    return list(nilm.models.keys())
+
+
+def make_series(rng, length):
+    return (rng.standard_normal(length) * 1000 + 5000).tolist()
+
+
+def bench_predict(client, model_names, concurrencies, requests, rng):
+    results = []
+    seq_length = nilm.CONFIG['seq_length']
+    # Distinct windows so the result cache never answers
+    payloads = [make_series(rng, seq_length) for _ in range(64)]
+    for model in model_names:
+        for concurrency in concurrencies:
+            def send(i, model=model):
+                return client.post('/predict', json={
+                    'model': model,
+                    'aggregate_power': payloads[i % len(payloads)],
+                    'normalize': True
+                })
+            result = run_load(send, concurrency=concurrency, requests=requests)
+            result.update(name=f'predict/{model}/c{concurrency}', endpoint='predict',
+                          model=model)
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def bench_batch_predict(client, model_names, concurrencies, window_counts, batch_sizes,
+                        requests, rng):
+    results = []
+    seq_length = nilm.CONFIG['seq_length']
+    for model in model_names:
+        for windows in window_counts:
+            series = make_series(rng, windows + seq_length - 1)
+            for batch_size in batch_sizes:
+                for concurrency in concurrencies:
+                    def send(i, model=model, series=series, batch_size=batch_size):
+                        return client.post('/batch_predict', json={
+                            'model': model,
+                            'aggregate_power': series,
+                            'batch_size': batch_size
+                        })
+                    result = run_load(send, concurrency=concurrency, requests=requests, warmup=1)
+                    result.update(name=f'batch_predict/{model}/w{windows}/b{batch_size}/c{concurrency}',
+                                  endpoint='batch_predict', model=model, windows=windows,
+                                  batch_size=batch_size,
+                                  windows_per_s=result['throughput_rps'] * windows)
+                    print_result(result)
+                    results.append(result)
+    return results
+
+
+def bench_forward(model_names, batch_sizes, number):
+    """Raw model forward pass per model and batch size, no HTTP or preprocessing"""
+    results = []
+    seq_length = nilm.CONFIG['seq_length']
+    for model_name in model_names:
+        model = nilm.get_model(model_name)
+        for batch_size in [1] + list(batch_sizes):
+            x = torch.randn(batch_size, seq_length, 1, device=nilm.device)
+
+            def forward(model=model, x=x):
+                with torch.no_grad():
+                    model(x)
+            result = microbench(forward, number=max(1, number // batch_size))
+            result.update(name=f'forward/{model_name}/b{batch_size}', model=model_name,
+                          batch_size=batch_size)
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NILM API load tests and microbenchmarks')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='use randomly initialized models (in-process only)')
+    parser.add_argument('--models', nargs='+', default=None)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--windows', nargs='+', type=int, default=[64, 1024],
+                        help='sliding windows per /batch_predict request')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[64, 256])
+    parser.add_argument('--requests', type=int, default=200, help='/predict requests per scenario')
+    parser.add_argument('--batch-requests', type=int, default=10,
+                        help='/batch_predict requests per scenario')
+    parser.add_argument('--forward-calls', type=int, default=256,
+                        help='windows per forward microbenchmark repeat')
+    parser.add_argument('--threads', type=int, help='torch.set_num_threads for in-process runs')
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['predict', 'batch_predict', 'forward'])
+    parser.add_argument('--output', default='bench_nilm.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+
+    if args.url:
+        client = HttpClient(args.url)
+        model_names = args.models or ['bilstm', 'tcn', 'atcn']
+    else:
+        nilm.result_cache.max_entries = 0
+        available = setup_models(args.random_weights)
+        if not available:
+            sys.exit('No models found; pass --random-weights or fix MODELS_DIR')
+        model_names = [m for m in (args.models or available) if m in available]
+        client = InProcessClient(nilm.app)
+
+    results = []
+    if 'predict' not in args.skip:
+        print('\n/predict')
+        results += bench_predict(client, model_names, args.concurrency, args.requests, rng)
+    if 'batch_predict' not in args.skip:
+        print('\n/batch_predict')
+        results += bench_batch_predict(client, model_names, args.concurrency, args.windows,
+                                       args.batch_sizes, args.batch_requests, rng)
+    if 'forward' not in args.skip and not args.url:
+        print('\nforward pass')
+        results += bench_forward(model_names, args.batch_sizes, args.forward_calls)
+
+    write_results(args.output, results, dict(vars(args), models=model_names,
+                                             mode='http' if args.url else 'in-process'))
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
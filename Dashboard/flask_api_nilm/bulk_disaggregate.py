@@ -0,0 +1,263 @@
+"""
+Offline bulk NILM disaggregation over SIDED / AMDA_SIDED directories
+
+Walks <data_dir>/<Facility>/<Location>.csv (the layout create_augmented_dataset
+assumes), reads every CSV in chunks, runs batched sliding-window inference with
+the service models in a process pool (one worker per file) and writes one
+Parquet file per input file and model with per-appliance predictions.
+
+Finished (file, model) pairs are recorded in <out_dir>/_progress.json, so an
+interrupted run skips them. Resume granularity is the whole file: chunk
+offsets are not recorded, and a file that was interrupted part way is
+processed again from its first row (its *.partial outputs are overwritten).
+Outputs are only renamed from *.partial once complete. Split very large
+inputs into several CSVs if losing a partial file's work matters.
+
+Usage:
+    python bulk_disaggregate.py ../../NILM_SIDED-master/AMDA_SIDED ./backfill \
+        --models tcn atcn --workers 4 --resample 5
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+import app as nilm
+from inference import iter_window_batches, seq2seq_predict
+
+PROGRESS_FILE = '_progress.json'
+
+_worker_models = {}
+
+
+def find_csv_files(data_dir):
+    """All <Facility>/<Location>.csv files below data_dir, sorted"""
+    return sorted(p for facility in Path(data_dir).iterdir() if facility.is_dir()
+                  for p in facility.iterdir() if p.suffix == '.csv')
+
+
+def load_progress(out_dir):
+    path = Path(out_dir) / PROGRESS_FILE
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_progress(out_dir, progress):
+    # Write-then-rename so a crash never leaves a truncated manifest
+    path = Path(out_dir) / PROGRESS_FILE
+    tmp = path.with_suffix('.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp, path)
+
+
+def file_signature(path):
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def done_models(progress, key, path, out_dir):
+    """Models already finished for this (unchanged) file"""
+    entry = progress.get(key)
+    if entry is None or entry.get('signature') != file_signature(path):
+        return []
+    if not all((Path(out_dir) / output).exists() for output in entry['outputs']):
+        return []
+    return entry['models']
+
+
+def _init_worker(models_dir, model_names, threads):
+    torch.set_num_threads(threads)
+    for name in model_names:
+        filename, loader = nilm.MODEL_FILES[name]
+        _worker_models[name] = loader(Path(models_dir) / filename)
+
+
+def _resampled_chunks(path, chunk_rows, aggregate_column, time_column, resample):
+    """Yield (aggregate values, timestamps or None) chunk by chunk"""
+    # Keep chunks a multiple of `resample` rows so groups never straddle chunks
+    chunk_rows = max(resample, chunk_rows - chunk_rows % resample)
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        values = chunk[aggregate_column].to_numpy(dtype=np.float64)
+        times = chunk[time_column].astype(str).to_numpy() if time_column in chunk.columns else None
+        if resample > 1:
+            # Average every `resample` rows (1-min -> 5-min as in training)
+            groups = np.arange(len(values)) // resample
+            values = pd.Series(values).groupby(groups).mean().to_numpy()
+            if times is not None:
+                times = times[::resample]
+        yield values, times
+
+
+def predict_series(model, series, window_size, batch_size, denormalize):
+    """Predictions for the samples window_size-1 ... len(series)-1 of series"""
+    if getattr(model, 'seq2seq', False):
+        # Stitched per-timestep outputs (always in watts), trimmed to the
+        # samples point models report so consecutive chunks line up
+        stitched = seq2seq_predict(model, series, window_size, max(1, window_size // 2),
+                                   batch_size, nilm.device, stitch=model.stitch)
+        return stitched[window_size - 1:].astype(np.float32)
+
+    n_windows = len(series) - window_size + 1
+    preds = np.empty((n_windows, len(nilm.APPLIANCE_NAMES)), dtype=np.float32)
+    for start, batch, mean, std in iter_window_batches(series, window_size, batch_size):
+        with torch.no_grad():
+            out = model(torch.from_numpy(batch).to(nilm.device)).cpu().numpy()
+        if denormalize:
+            out = out * std[:, None] + mean[:, None]
+        preds[start:start + len(out)] = out
+    return preds
+
+
+def disaggregate_file(path, out_paths, window_size, batch_size, chunk_rows,
+                      aggregate_column, time_column, resample, denormalize):
+    """Worker: stream one CSV through every model, write one Parquet per model
+    (always from the file's first row; see the module docstring on resuming)"""
+    writers = {}
+    partial_paths = {name: Path(str(out) + '.partial') for name, out in out_paths.items()}
+    tail = np.empty(0)
+    tail_times = None
+    offset = 0  # row index of tail[0] in the (resampled) series
+    windows = 0
+    try:
+        for values, times in _resampled_chunks(path, chunk_rows, aggregate_column, time_column, resample):
+            series = np.concatenate((tail, values))
+            if times is not None:
+                times = times if tail_times is None else np.concatenate((tail_times, times))
+
+            if len(series) >= window_size:
+                n_windows = len(series) - window_size + 1
+                index = np.arange(offset + window_size - 1, offset + len(series))
+                columns = {'index': index}
+                if times is not None:
+                    columns[time_column] = times[window_size - 1:]
+
+                for name, model in _worker_models.items():
+                    if name not in out_paths:
+                        continue
+                    preds = predict_series(model, series, window_size, batch_size, denormalize)
+
+                    table = pa.table(dict(columns, **{
+                        appliance: preds[:, j] for j, appliance in enumerate(nilm.APPLIANCE_NAMES)
+                    }))
+                    if name not in writers:
+                        partial_paths[name].parent.mkdir(parents=True, exist_ok=True)
+                        writers[name] = pq.ParquetWriter(partial_paths[name], table.schema)
+                    writers[name].write_table(table)
+                windows += n_windows
+
+            # Carry the last window_size - 1 readings into the next chunk
+            keep = min(len(series), window_size - 1)
+            offset += len(series) - keep
+            tail = series[len(series) - keep:]
+            tail_times = times[len(times) - keep:] if times is not None else None
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for name in writers:
+        os.replace(partial_paths[name], out_paths[name])
+    return {'windows': windows, 'rows': offset + len(tail), 'written': list(writers)}
+
+
+def run(data_dir, out_dir, model_names, models_dir, workers=1, threads=1,
+        window_size=None, batch_size=None, chunk_rows=100000, aggregate_column='Aggregate',
+        time_column='timestamp', resample=1, denormalize=True):
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError('pyarrow is required to write Parquet output')
+    window_size = window_size or nilm.CONFIG['seq_length']
+    batch_size = batch_size or nilm.CONFIG['batch_size']
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    progress = load_progress(out_dir)
+    files = find_csv_files(data_dir)
+    pending = []
+    for path in files:
+        key = f'{path.parent.name}/{path.name}'
+        finished = done_models(progress, key, path, out_dir)
+        missing = [name for name in model_names if name not in finished]
+        if not missing:
+            print(f"✓ {key} already done, skipping")
+            continue
+        out_paths = {name: out_dir / path.parent.name / f'{path.stem}_{name}.parquet'
+                     for name in missing}
+        pending.append((key, path, out_paths))
+
+    print(f"{len(pending)} of {len(files)} files need {model_names}")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(str(models_dir), model_names, threads)) as pool:
+        futures = {
+            pool.submit(disaggregate_file, path, out_paths, window_size, batch_size, chunk_rows,
+                        aggregate_column, time_column, resample, denormalize): (key, path, out_paths)
+            for key, path, out_paths in pending
+        }
+        for future in as_completed(futures):
+            key, path, out_paths = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"✗ {key} failed: {e}")
+                continue
+            previous = progress.get(key, {})
+            if previous.get('signature') != file_signature(path):
+                previous = {}
+            progress[key] = {
+                'signature': file_signature(path),
+                'models': previous.get('models', []) + list(out_paths),
+                'outputs': previous.get('outputs', []) + [
+                    str(out_paths[name].relative_to(out_dir)) for name in result['written']],
+                'windows': result['windows'],
+                'rows': result['rows']
+            }
+            save_progress(out_dir, progress)
+            print(f"✓ {key}: {result['windows']} windows")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline bulk NILM disaggregation to Parquet')
+    parser.add_argument('data_dir', help='SIDED-style directory: <Facility>/<Location>.csv')
+    parser.add_argument('out_dir', help='Output directory for Parquet files and progress')
+    parser.add_argument('--models', nargs='+', default=['atcn'], choices=list(nilm.MODEL_FILES))
+    parser.add_argument('--models-dir', default=str(nilm.MODELS_DIR))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=1, help='torch threads per worker')
+    parser.add_argument('--window-size', type=int, default=nilm.CONFIG['seq_length'])
+    parser.add_argument('--batch-size', type=int, default=nilm.CONFIG['batch_size'])
+    parser.add_argument('--chunk-rows', type=int, default=100000)
+    parser.add_argument('--aggregate-column', default='Aggregate')
+    parser.add_argument('--time-column', default='timestamp')
+    parser.add_argument('--resample', type=int, default=1,
+                        help='average every N rows first (5 turns 1-min SIDED data into 5-min)')
+    parser.add_argument('--no-denormalize', action='store_true',
+                        help='write point model outputs in the normalized model space')
+    args = parser.parse_args()
+
+    run(args.data_dir, args.out_dir, args.models, args.models_dir,
+        workers=args.workers, threads=args.threads, window_size=args.window_size,
+        batch_size=args.batch_size, chunk_rows=args.chunk_rows,
+        aggregate_column=args.aggregate_column, time_column=args.time_column,
+        resample=args.resample, denormalize=not args.no_denormalize)
+
+
+if __name__ == '__main__':
+    main()
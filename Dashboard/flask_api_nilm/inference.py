@@ -0,0 +1,183 @@
+"""
+Batched sliding-window inference engine for the NILM models
+
+Builds every window of a long aggregate power series as one strided view,
+computes the per-window mean/std in O(n) with cumulative sums and runs the
+model over fixed-size mini-batches instead of one forward pass per window.
+
+Seq2seq models predict every timestep of a window; iter_seq2seq runs them
+over overlapping windows and stitches the outputs into one series.
+"""
+
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+EPS = 1e-8
+
+
+def sliding_windows(series, window_size):
+    """Return a read-only (n_windows, window_size) strided view over series"""
+    series = np.asarray(series, dtype=np.float64)
+    return sliding_window_view(series, window_size)
+
+
+def window_stats(series, window_size):
+    """
+    Per-window mean and std (ddof=0, as np.std) for every sliding window.
+    Uses cumulative sums so the cost is O(n) regardless of window_size.
+
+    The series is cut into blocks of window_size starts; each block's sums run
+    over its own 2 * window_size readings, shifted by the mean of its first
+    window. E[x^2] - E[x]^2 then only cancels against nearby readings, so a
+    quiet stretch after a large swing keeps its std to full precision.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    n_windows = len(series) - window_size + 1
+    n_blocks = -(-n_windows // window_size)
+    # Windows starting in block k cover readings [k * w, (k + 2) * w - 1)
+    padded = np.zeros((n_blocks + 1) * window_size)
+    padded[:len(series)] = series
+    blocks = sliding_window_view(padded, 2 * window_size)[::window_size]
+    shift = blocks[:, :window_size].mean(axis=1, keepdims=True)
+    shifted = blocks - shift
+
+    zeros = np.zeros((n_blocks, 1))
+    csum = np.concatenate((zeros, np.cumsum(shifted, axis=1)), axis=1)
+    csum_sq = np.concatenate((zeros, np.cumsum(shifted * shifted, axis=1)), axis=1)
+    window_sum = csum[:, window_size:2 * window_size] - csum[:, :window_size]
+    window_sum_sq = csum_sq[:, window_size:2 * window_size] - csum_sq[:, :window_size]
+
+    shifted_mean = window_sum / window_size
+    var = np.maximum(window_sum_sq / window_size - shifted_mean ** 2, 0.0)
+    mean = (shifted_mean + shift).ravel()[:n_windows]
+    return mean, np.sqrt(var).ravel()[:n_windows]
+
+
+def iter_window_batches(series, window_size, batch_size, normalize=True):
+    """
+    Yield (start_index, batch, mean, std) for consecutive mini-batches of
+    windows. batch has shape (b, window_size, 1) and is float32, ready to be
+    wrapped in a tensor; mean/std are the per-window statistics (std includes
+    the EPS offset used by the single-window /predict path).
+    """
+    windows = sliding_windows(series, window_size)
+    n_windows = windows.shape[0]
+    if normalize:
+        means, stds = window_stats(series, window_size)
+        stds = stds + EPS
+    else:
+        means = np.zeros(n_windows)
+        stds = np.ones(n_windows)
+
+    for start in range(0, n_windows, batch_size):
+        stop = min(start + batch_size, n_windows)
+        mean = means[start:stop]
+        std = stds[start:stop]
+        batch = windows[start:stop]
+        if normalize:
+            batch = (batch - mean[:, None]) / std[:, None]
+        yield start, batch.astype(np.float32)[:, :, None], mean, std
+
+
+def last_step(output):
+    """Point prediction of a model output: seq2seq (b, T, out) -> (b, out)"""
+    return output[:, -1] if output.dim() == 3 else output
+
+
+def run_batches(model, series, window_size, batch_size, device, normalize=True):
+    """
+    Yield (start_index, predictions) per mini-batch, predictions being a
+    (b, output_size) array in the model's (normalized) output space.
+    """
+    for start, batch, _mean, _std in iter_window_batches(series, window_size, batch_size, normalize):
+        input_tensor = torch.from_numpy(batch).to(device)
+        with torch.no_grad():
+            yield start, last_step(model(input_tensor)).cpu().numpy()
+
+
+def batched_window_predict(model, series, window_size, batch_size, device, normalize=True):
+    """
+    Run model over every sliding window of series.
+    Returns an (n_windows, output_size) array; row i is the prediction for the
+    window ending at index i + window_size - 1.
+    """
+    outputs = [preds for _start, preds in run_batches(model, series, window_size,
+                                                      batch_size, device, normalize)]
+    return np.concatenate(outputs, axis=0)
+
+
+def window_starts(n, window_size, stride):
+    """Start indices of windows covering [0, n), the last one aligned to the end"""
+    starts = list(range(0, n - window_size + 1, stride))
+    if starts[-1] != n - window_size:
+        starts.append(n - window_size)
+    return np.asarray(starts)
+
+
+def stitch_weights(window_size, kind='uniform'):
+    """
+    Per-position weight of a window's outputs where windows overlap.
+    'ramp' favours late positions (causal models have more history there),
+    'triangle' favours the centre (bidirectional context), 'uniform' averages.
+    """
+    pos = np.arange(window_size, dtype=np.float64)
+    if kind == 'ramp':
+        return (pos + 1) / window_size
+    if kind == 'triangle':
+        return 1.0 - np.abs(pos - (window_size - 1) / 2) / (window_size / 2)
+    if kind == 'uniform':
+        return np.ones(window_size)
+    raise ValueError(f'Unknown stitch weighting {kind}')
+
+
+def iter_seq2seq(model, series, window_size, stride, batch_size, device, normalize=True,
+                 stitch='uniform'):
+    """
+    Run a seq2seq model over overlapping windows (every `stride` samples) and
+    yield (start, stop, predictions) for consecutive finished segments of the
+    series; predictions is (stop - start, output_size), denormalized with
+    each window's statistics before the overlapping outputs are blended.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    n = len(series)
+    starts = window_starts(n, window_size, stride)
+    weights = stitch_weights(window_size, stitch)
+    windows = sliding_windows(series, window_size)[starts]
+    if normalize:
+        means = windows.mean(axis=1)
+        stds = windows.std(axis=1) + EPS
+    else:
+        means = np.zeros(len(starts))
+        stds = np.ones(len(starts))
+
+    acc = None
+    weight_sum = np.zeros(n)
+    done = 0
+    for first in range(0, len(starts), batch_size):
+        last = min(first + batch_size, len(starts))
+        mean = means[first:last, None, None]
+        std = stds[first:last, None, None]
+        batch = (windows[first:last, :, None] - mean) / std
+        with torch.no_grad():
+            out = model(torch.from_numpy(batch.astype(np.float32)).to(device)).cpu().numpy()
+        out = out * std + mean
+        if acc is None:
+            acc = np.zeros((n, out.shape[2]))
+        for k, start in enumerate(starts[first:last]):
+            acc[start:start + window_size] += out[k] * weights[:, None]
+            weight_sum[start:start + window_size] += weights
+
+        # Positions before the next window's start receive no more outputs
+        ready = int(starts[last]) if last < len(starts) else n
+        if ready > done:
+            yield done, ready, acc[done:ready] / weight_sum[done:ready, None]
+            done = ready
+
+
+def seq2seq_predict(model, series, window_size, stride, batch_size, device, normalize=True,
+                    stitch='uniform'):
+    """Per-timestep (n, output_size) predictions for the whole series"""
+    segments = [preds for _start, _stop, preds in iter_seq2seq(
+        model, series, window_size, stride, batch_size, device, normalize, stitch)]
+    return np.concatenate(segments, axis=0)
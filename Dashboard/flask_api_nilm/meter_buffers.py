@@ -0,0 +1,162 @@
+"""
+Per-meter ring buffers for streaming NILM ingestion
+
+Each meter keeps the latest `capacity` aggregate power readings in a fixed-size
+NumPy array, so clients only need to send new readings instead of the full
+window. Idle meters are evicted after `idle_timeout` seconds and the least
+recently used ones are dropped once the store exceeds its memory cap.
+Per-meter model state (e.g. a StreamingTCN) can be attached to a buffer so it
+is accounted for in the cap and evicted together with the readings; the
+meter's lock serializes updates of that state across concurrent requests.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MeterRingBuffer:
+    """Fixed-size circular buffer of float64 readings"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float64)
+        self.head = 0  # next write position
+        self.count = 0
+        self.total = 0  # readings ingested since creation
+        self.last_seen = time.monotonic()
+        self.state = {}
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + sum(getattr(v, 'nbytes', 0) for v in self.state.values())
+
+    def is_full(self):
+        return self.count == self.capacity
+
+    def append(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        n = len(values)
+        self.total += n
+        self.last_seen = time.monotonic()
+        if n == 0:
+            return
+        if n >= self.capacity:
+            self.data[:] = values[-self.capacity:]
+            self.head = 0
+            self.count = self.capacity
+            return
+
+        end = self.head + n
+        if end <= self.capacity:
+            self.data[self.head:end] = values
+        else:
+            split = self.capacity - self.head
+            self.data[self.head:] = values[:split]
+            self.data[:n - split] = values[split:]
+        self.head = end % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def window(self):
+        """Return the buffered readings in chronological order (a copy)"""
+        if self.count < self.capacity:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+
+class MeterBufferStore:
+    """Thread-safe LRU map of meter_id -> MeterRingBuffer"""
+
+    def __init__(self, capacity, max_bytes=64 * 1024 * 1024, idle_timeout=3600):
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def ingest(self, meter_id, values):
+        """
+        Append new readings for meter_id. Returns (window, count, total) where
+        window is the chronological copy of the buffer contents.
+        """
+        with self._lock:
+            buf = self._buffers.get(meter_id)
+            if buf is None:
+                buf = MeterRingBuffer(self.capacity)
+                self._buffers[meter_id] = buf
+                self._bytes += buf.nbytes
+            else:
+                self._buffers.move_to_end(meter_id)
+            buf.append(values)
+            window = buf.window()
+            count, total = buf.count, buf.total
+            self._evict_locked()
+        return window, count, total
+
+    def get_state(self, meter_id, key):
+        """Return the object attached to meter_id under key, or None"""
+        with self._lock:
+            buf = self._buffers.get(meter_id)
+            return None if buf is None else buf.state.get(key)
+
+    def meter_lock(self, meter_id):
+        """Lock guarding the state attached to meter_id (a fresh one if it is gone)"""
+        with self._lock:
+            buf = self._buffers.get(meter_id)
+            return threading.Lock() if buf is None else buf.lock
+
+    def set_state(self, meter_id, key, value):
+        """Attach value (counted via its nbytes) to an existing meter buffer"""
+        with self._lock:
+            buf = self._buffers.get(meter_id)
+            if buf is None:
+                return False
+            self._bytes -= buf.nbytes
+            buf.state[key] = value
+            self._bytes += buf.nbytes
+            self._buffers.move_to_end(meter_id)
+            self._evict_locked()
+            return True
+
+    def drop(self, meter_id):
+        with self._lock:
+            buf = self._buffers.pop(meter_id, None)
+            if buf is None:
+                return False
+            self._bytes -= buf.nbytes
+            return True
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        # Idle meters first (oldest are at the front), then LRU over the cap
+        now = time.monotonic()
+        while self._buffers:
+            meter_id, buf = next(iter(self._buffers.items()))
+            # Always keep the most recently used meter, even if it alone exceeds the cap
+            within_cap = self._bytes <= self.max_bytes or len(self._buffers) == 1
+            if now - buf.last_seen <= self.idle_timeout and within_cap:
+                break
+            del self._buffers[meter_id]
+            self._bytes -= buf.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'meters': len(self._buffers),
+                'window_size': self.capacity,
+                'memory_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
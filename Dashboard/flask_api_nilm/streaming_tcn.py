@@ -0,0 +1,142 @@
+"""
+Incremental (streaming) inference for the causal TCN and ATCN models
+
+Every TemporalBlock convolution is causal, so the activation of a layer at
+time t only depends on the last (kernel_size - 1) * dilation + 1 activations
+of the layer below. StreamingTCN keeps exactly those activations per layer and
+computes one new timestep per step() call, so the cost of a new sample is
+O(layers) instead of O(window x layers).
+
+The per-timestep activations are identical to a full forward pass over the
+whole stream (both start from the zero causal padding). The pooled heads
+(mean for TCN, attention for ATCN) are applied over the last `window`
+timesteps, which matches model(x) exactly as long as the stream is no longer
+than the window; past that point the windowed forward pass re-pads with zeros
+and only sees the last `window` inputs, while the stream keeps its full causal
+history. Inputs must use a fixed normalization for the same reason.
+
+So after the first window the output equals model.fc(pool(network(x_0..t)))
+over the last `window` timesteps, up to float rounding, and not the windowed
+model(x_t-window+1..t). The gap is as large as the part of the receptive field
+(1 + 2 * (kernel_size - 1) * sum of dilations, 1021 steps for the default
+8 levels) that falls outside the window. With random weights it reaches a few
+percent of the output scale. Callers that need the windowed result rebuild
+the stream from the window (see /ingest's incremental_reanchor).
+"""
+
+import torch
+import torch.nn.functional as F
+
+
+class _CausalConvState:
+    """Sliding queue of the inputs a dilated causal conv needs for one step"""
+
+    def __init__(self, conv, batch_size, device, dtype):
+        self.conv = conv
+        self.dilation = conv.dilation[0]
+        history = (conv.kernel_size[0] - 1) * self.dilation
+        # Zeros reproduce the left padding that Chomp1d leaves in place
+        self.queue = torch.zeros(batch_size, conv.in_channels, history, device=device, dtype=dtype)
+
+    def step(self, x_t):
+        """x_t: (batch, in_channels) -> (batch, out_channels)"""
+        frame = torch.cat((self.queue, x_t.unsqueeze(2)), dim=2)
+        self.queue = frame[:, :, 1:]
+        out = F.conv1d(frame, self.conv.weight, self.conv.bias, dilation=self.dilation)
+        return out[:, :, 0]
+
+    @property
+    def nbytes(self):
+        return self.queue.element_size() * self.queue.nelement()
+
+
+class StreamingTCN:
+    """
+    Wraps an eval-mode TCNModel or ATCNModel for sample-by-sample inference.
+
+    Usage:
+        stream = StreamingTCN(models['tcn'], window=288)
+        for value in normalized_readings:
+            prediction = stream.step(value)   # (batch, output_size)
+    """
+
+    def __init__(self, model, window, batch_size=1):
+        self.model = model
+        self.window = window
+        self.batch_size = batch_size
+        self.has_attention = hasattr(model, 'attention')
+        param = next(model.parameters())
+        self.device, self.dtype = param.device, param.dtype
+        self.reset()
+
+    def reset(self):
+        """Drop all cached activations (equivalent to starting a new stream)"""
+        self.blocks = []
+        for block in self.model.network:
+            self.blocks.append((
+                block,
+                _CausalConvState(block.conv1, self.batch_size, self.device, self.dtype),
+                _CausalConvState(block.conv2, self.batch_size, self.device, self.dtype),
+            ))
+        channels = self.model.fc.in_features
+        # Last-layer features of the most recent `window` timesteps (ring buffer)
+        self.features = torch.zeros(self.batch_size, self.window, channels,
+                                     device=self.device, dtype=self.dtype)
+        self.scores = torch.zeros(self.batch_size, self.window, 1,
+                                  device=self.device, dtype=self.dtype)
+        self.pos = 0
+        self.steps = 0
+
+    @property
+    def nbytes(self):
+        total = self.features.element_size() * self.features.nelement()
+        total += self.scores.element_size() * self.scores.nelement()
+        for _block, conv1, conv2 in self.blocks:
+            total += conv1.nbytes + conv2.nbytes
+        return total
+
+    @torch.no_grad()
+    def step(self, x_t):
+        """
+        Push one timestep and return the model output for the current window.
+        x_t: scalar, (batch,) or (batch, input_size) input at the new timestep.
+        """
+        x_t = torch.as_tensor(x_t, device=self.device, dtype=self.dtype)
+        x_t = x_t.reshape(self.batch_size, -1)
+
+        h = x_t
+        for block, conv1, conv2 in self.blocks:
+            out = torch.relu(conv1.step(h))
+            out = torch.relu(conv2.step(out))
+            res = h if block.downsample is None else block.downsample(h.unsqueeze(2))[:, :, 0]
+            h = torch.relu(out + res)
+
+        self.features[:, self.pos] = h
+        if self.has_attention:
+            self.scores[:, self.pos] = self.model.attention.attention(h)
+        self.pos = (self.pos + 1) % self.window
+        self.steps += 1
+
+        filled = min(self.steps, self.window)
+        if filled < self.window:
+            features = self.features[:, :filled]
+        else:
+            features = self.features
+
+        if self.has_attention:
+            scores = self.scores[:, :filled] if filled < self.window else self.scores
+            weights = torch.softmax(scores, dim=1)
+            pooled = (features * weights).sum(dim=1)
+        else:
+            pooled = features.mean(dim=1)
+        return self.model.fc(pooled)
+
+    @torch.no_grad()
+    def extend(self, values):
+        """Push a sequence of timesteps (batch, steps) or (steps,); return the last output"""
+        values = torch.as_tensor(values, device=self.device, dtype=self.dtype)
+        values = values.reshape(self.batch_size, -1)
+        output = None
+        for t in range(values.shape[1]):
+            output = self.step(values[:, t])
+        return output
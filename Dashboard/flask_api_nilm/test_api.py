@@ -1,5 +1,5 @@
 """
-Test script for NILM API
+Smoke test script for NILM API (see benchmark.py for load tests and benchmarks)
 """
 import requests
 import json
@@ -0,0 +1,37 @@
+"""
+Tests of the inference backend registry (no server, random weights)
+
+    python -m pytest -q test_backends.py
+"""
+
+import pytest
+import torch
+
+import app as nilm
+from backends import BackendRegistry
+from common.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def registry():
+    models = ModelRegistry()
+    torch.manual_seed(0)
+    models['tcn'] = nilm.TCNModel(nilm.CONFIG['input_size'], nilm.CONFIG['num_channels'],
+                                  output_size=nilm.CONFIG['output_size']).eval()
+    backends = BackendRegistry(models, nilm.CONFIG['seq_length'], torch.device('cpu'))
+    models.on_evict(backends.invalidate)
+    return models, backends
+
+
+def test_built_backend_counts_toward_the_budget(registry):
+    models, backends = registry
+    fp32_bytes = models.resident_bytes()
+    if backends.activate('tcn', 'torchscript') != 'torchscript':
+        pytest.skip('torchscript backend unavailable')
+    assert models.resident_bytes() > fp32_bytes
+    assert models.stats()['models']['tcn']['attached'] == ['torchscript']
+
+    models.unload('tcn')
+    assert models.attached('tcn', 'torchscript') is None
+    backends.get('tcn')  # rebuilt for the reloaded model
+    assert models.attached('tcn', 'torchscript') is not None
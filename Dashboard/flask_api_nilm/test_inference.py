@@ -0,0 +1,27 @@
+"""
+Tests of the batched sliding-window statistics (no server)
+
+    python -m pytest -q test_inference.py
+"""
+
+import numpy as np
+import pytest
+
+from inference import sliding_windows, window_stats
+
+
+@pytest.mark.parametrize('length, window_size', [(5, 5), (6, 5), (100, 7), (999, 100), (1000, 100)])
+def test_window_stats_match_numpy(length, window_size):
+    series = np.random.default_rng(0).standard_normal(length) * 100 + 5000
+    mean, std = window_stats(series, window_size)
+    windows = sliding_windows(series, window_size)
+    np.testing.assert_allclose(mean, windows.mean(axis=1), rtol=1e-12)
+    np.testing.assert_allclose(std, windows.std(axis=1), rtol=1e-9)
+
+
+def test_quiet_tail_after_large_swings_keeps_its_std():
+    rng = np.random.default_rng(0)
+    series = np.concatenate((rng.standard_normal(20000) * 3000 + 5000,
+                             rng.standard_normal(2000) * 0.01 + 5000))
+    _mean, std = window_stats(series, 100)
+    np.testing.assert_allclose(std, sliding_windows(series, 100).std(axis=1), rtol=1e-9)
@@ -0,0 +1,88 @@
+"""
+Equivalence tests for incremental TCN / ATCN inference (no server, random weights)
+
+    python -m pytest -q test_streaming_tcn.py
+"""
+
+import numpy as np
+import pytest
+import torch
+
+import app as nilm
+from streaming_tcn import StreamingTCN
+
+WINDOW = nilm.CONFIG['seq_length']
+
+
+def build(name):
+    torch.manual_seed(0)
+    model_class = nilm.TCNModel if name == 'tcn' else nilm.ATCNModel
+    return model_class(nilm.CONFIG['input_size'], nilm.CONFIG['num_channels'],
+                       dropout=nilm.CONFIG['dropout'],
+                       output_size=nilm.CONFIG['output_size']).to(nilm.device).eval()
+
+
+@torch.no_grad()
+def full_history_output(model, x):
+    """fc(pool(network(x))) with the pool over the last WINDOW timesteps of the whole history"""
+    features = model.network(x.reshape(1, 1, -1))[:, :, -WINDOW:]
+    if hasattr(model, 'attention'):
+        pooled = model.attention(features.permute(0, 2, 1))
+    else:
+        pooled = features.mean(dim=2)
+    return model.fc(pooled)
+
+
+@pytest.mark.parametrize('name', ['tcn', 'atcn'])
+def test_stream_matches_forward(name):
+    model = build(name)
+    x = torch.tensor(np.random.default_rng(0).standard_normal(2 * WINDOW), dtype=torch.float32)
+    stream = StreamingTCN(model, WINDOW)
+
+    # First window: exactly the windowed forward pass
+    output = stream.extend(x[:WINDOW])
+    with torch.no_grad():
+        expected = model(x[:WINDOW].reshape(1, WINDOW, 1))
+    assert torch.allclose(output, expected, atol=1e-5)
+
+    # Afterwards: the forward pass over the whole history, pooled over the window
+    for t in range(WINDOW, 2 * WINDOW, 37):
+        output = stream.extend(x[stream.steps:t + 1])
+        assert torch.allclose(output, full_history_output(model, x[:t + 1]), atol=1e-5)
+
+
+@pytest.mark.parametrize('name', ['tcn', 'atcn'])
+def test_ingest_reanchors_exactly(name, monkeypatch):
+    nilm.models[name] = build(name)
+    monkeypatch.setitem(nilm.CONFIG, 'incremental_reanchor', 8)
+    client = nilm.app.test_client()
+    values = (np.random.default_rng(1).standard_normal(WINDOW + 20) * 1000 + 5000).tolist()
+    meter = f'test-{name}'
+
+    def ingest(new_values, incremental):
+        response = client.post('/ingest', json={'meter_id': meter, 'model': name,
+                                                'aggregate_power': new_values,
+                                                'incremental': incremental})
+        return response.get_json()
+
+    def close(a, b):
+        return all(abs(a['appliances'][k] - b['appliances'][k]) < 1e-2 for k in a['appliances'])
+
+    flags = []
+    for start in range(WINDOW, WINDOW + 20, 2):
+        result = ingest(values[:start] if start == WINDOW else values[start - 2:start], True)
+        flags.append(result['exact'])
+        if result['exact']:
+            assert close(result, ingest([], False))
+    # Rebuilt on the first call and then every 8 readings
+    assert flags == [True, False, False, False, True, False, False, False, True, False]
+
+    # Readings that bypassed the stream force a rebuild
+    ingest(values[:3], False)
+    result = ingest(values[3:4], True)
+    assert result['exact'] and close(result, ingest([], False))
+    client.delete(f'/ingest/{meter}')
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,186 @@
+"""
+Train the seq2seq NILM models (per-timestep outputs for a whole window)
+
+Reads SIDED-style CSVs (<data_dir>/<Facility>/<Location>.csv with an
+Aggregate column and one column per appliance), cuts them into overlapping
+windows and trains one of bilstm_seq2seq / tcn_seq2seq / atcn_seq2seq on the
+MSE over every timestep of every window.
+
+Inputs and targets are normalized with each window's aggregate mean/std,
+the same statistics the service uses to denormalize outputs. The backbone can
+be initialized from a trained point model (--init-from TCN_best.pth).
+
+Usage:
+    python train_seq2seq.py ../../NILM_SIDED-master/AMDA_SIDED --model tcn_seq2seq \
+        --resample 5 --epochs 20 --init-from ../../NILM_SIDED-master/saved_models/TCN_best.pth
+"""
+
+import argparse
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+import app as nilm
+from bulk_disaggregate import find_csv_files
+from inference import EPS
+
+OUTPUT_FILES = {name: filename for name, (filename, _loader) in nilm.MODEL_FILES.items()
+                if name.endswith('_seq2seq')}
+
+
+def load_series(path, resample, aggregate_column='Aggregate'):
+    """(aggregate, appliances) float32 arrays of one CSV, optionally row-averaged"""
+    df = pd.read_csv(path, usecols=[aggregate_column] + nilm.APPLIANCE_NAMES).dropna()
+    if resample > 1:
+        df = df.groupby(np.arange(len(df)) // resample).mean()
+    return (df[aggregate_column].to_numpy(dtype=np.float32),
+            df[nilm.APPLIANCE_NAMES].to_numpy(dtype=np.float32))
+
+
+class WindowDataset(Dataset):
+    """Overlapping windows over several series, sliced on access"""
+
+    def __init__(self, series, window_size, stride):
+        self.series = series
+        self.window_size = window_size
+        self.index = [(i, start) for i, (aggregate, _targets) in enumerate(series)
+                      for start in range(0, len(aggregate) - window_size + 1, stride)]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        i, start = self.index[idx]
+        aggregate, targets = self.series[i]
+        x = aggregate[start:start + self.window_size]
+        y = targets[start:start + self.window_size]
+        mean = x.mean()
+        std = x.std() + EPS
+        return (torch.from_numpy((x - mean) / std).unsqueeze(1),
+                torch.from_numpy((y - mean) / std))
+
+
+def split_series(series, val_split):
+    """Hold out the tail of every series for validation (no window overlap)"""
+    train, val = [], []
+    for aggregate, targets in series:
+        cut = int(len(aggregate) * (1 - val_split))
+        train.append((aggregate[:cut], targets[:cut]))
+        val.append((aggregate[cut:], targets[cut:]))
+    return train, val
+
+
+def init_from_point_model(model, path):
+    """Copy every matching-shape weight (the backbone) from a point model checkpoint"""
+    state = torch.load(path, map_location='cpu')
+    own = model.state_dict()
+    matched = {k: v for k, v in state.items() if k in own and own[k].shape == v.shape}
+    model.load_state_dict(matched, strict=False)
+    print(f"✓ Initialized {len(matched)}/{len(own)} tensors from {path}")
+
+
+def evaluate(model, loader, criterion, device):
+    model.eval()
+    total, batches = 0.0, 0
+    with torch.no_grad():
+        for batch_X, batch_y in loader:
+            outputs = model(batch_X.to(device))
+            total += criterion(outputs, batch_y.to(device)).item()
+            batches += 1
+    return total / max(1, batches)
+
+
+def train(model, train_loader, val_loader, epochs, lr, device, out_path, patience=5,
+          gradient_clip=1.0):
+    model.to(device)
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, factor=0.5, patience=2)
+    best_val_loss = float('inf')
+    patience_counter = 0
+
+    for epoch in range(epochs):
+        start = time.time()
+        model.train()
+        train_loss = 0.0
+        for batch_X, batch_y in train_loader:
+            batch_X = batch_X.to(device)
+            batch_y = batch_y.to(device)
+            optimizer.zero_grad(set_to_none=True)
+            loss = criterion(model(batch_X), batch_y)
+            if not math.isfinite(loss.item()):
+                print(f"❌ Invalid loss at epoch {epoch + 1}, stopping")
+                return best_val_loss
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=gradient_clip)
+            optimizer.step()
+            train_loss += loss.item()
+        train_loss /= max(1, len(train_loader))
+
+        val_loss = evaluate(model, val_loader, criterion, device)
+        scheduler.step(val_loss)
+        print(f"Epoch {epoch + 1}/{epochs}: train {train_loss:.4f}  val {val_loss:.4f}  "
+              f"({time.time() - start:.0f}s)")
+
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            patience_counter = 0
+            torch.save(model.state_dict(), out_path)
+            print(f"  ✓ saved {out_path}")
+        else:
+            patience_counter += 1
+            if patience_counter >= patience:
+                print("Early stopping")
+                break
+    return best_val_loss
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a seq2seq NILM model')
+    parser.add_argument('data_dir', help='SIDED-style directory: <Facility>/<Location>.csv')
+    parser.add_argument('--model', default='tcn_seq2seq', choices=sorted(OUTPUT_FILES))
+    parser.add_argument('--out', help='checkpoint path (default: MODELS_DIR/<Model>_seq2seq_best.pth)')
+    parser.add_argument('--init-from', help='point model checkpoint to copy the backbone from')
+    parser.add_argument('--window-size', type=int, default=nilm.CONFIG['seq_length'])
+    parser.add_argument('--stride', type=int, default=48, help='training window stride')
+    parser.add_argument('--resample', type=int, default=1,
+                        help='average every N rows first (5 turns 1-min SIDED data into 5-min)')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--val-split', type=float, default=0.1)
+    parser.add_argument('--patience', type=int, default=5)
+    args = parser.parse_args()
+
+    out_path = Path(args.out) if args.out else nilm.MODELS_DIR / OUTPUT_FILES[args.model]
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    series = []
+    for path in find_csv_files(args.data_dir):
+        aggregate, targets = load_series(path, args.resample)
+        print(f"  Loaded {path.parent.name}/{path.name}: {len(aggregate)} samples")
+        series.append((aggregate, targets))
+    train_series, val_series = split_series(series, args.val_split)
+
+    train_set = WindowDataset(train_series, args.window_size, args.stride)
+    val_set = WindowDataset(val_series, args.window_size, args.window_size)
+    print(f"{len(train_set)} training / {len(val_set)} validation windows")
+    train_loader = DataLoader(train_set, batch_size=args.batch_size, shuffle=True)
+    val_loader = DataLoader(val_set, batch_size=args.batch_size)
+
+    model = nilm.build_seq2seq(args.model)
+    if args.init_from:
+        init_from_point_model(model, args.init_from)
+    best = train(model, train_loader, val_loader, args.epochs, args.lr, nilm.device, out_path,
+                 patience=args.patience)
+    print(f"Best validation loss {best:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,38 @@ Flask API for PV Fault Detection Models
 Serves Random Forest, XGBoost, and LSTM models for PV fault classification
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import torch
 import torch.nn as nn
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import joblib
-import xgboost as xgb
+import math
 import os
+import sys
+import threading
+import time
 from pathlib import Path
 
+# Serving modules shared with the NILM API live in Dashboard/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bulk_score import bulk_score, detect_format, parse_interval, primed
+from cascade import Cascade
+from inverter_state import NO_STATE, InverterStates
+from power_lookup import load_or_build
+from tree_ensemble import NotCompilable, TreeEnsemble, compile_ensemble
+from common.metrics import NULL_TIMER, Metrics
+from common.micro_batching import MicroBatcher
+from common.model_registry import ModelRegistry
+from common.prefork import serve
+from common.result_cache import ResultCache, make_key
+from common.streaming import StreamJobs, ndjson_response, wants_stream
+from common.wire_format import (JSON_MIME, MSGPACK_MIME, RESPONSE_MIMES, WireFormatError,
+                                accepts_gzip, columnar_response, document_response,
+                                is_binary_request, parse_binary_body, response_mimetype)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -29,6 +49,9 @@ FEATURES = ['Irradiance', 'Temperature', 'Current(A)', 'Power(W)', 'Voltage(V)',
             'LoadCurrent(A)', 'LoadPower(W)', 'LoadVoltage(V)',
             'Power_Ratio', 'Power_Theo']
 
+# Raw sensor columns expected in binary (raw float32 / .npy) request bodies
+INPUT_FEATURES = FEATURES[:8]
+
 # Fault types
 FAULT_TYPES = ['Healthy', 'No production', 'Open Circuit', 'Partial Shadowing', 'Short Circuit']
 STATUS_MAPPING = {
@@ -63,6 +86,85 @@ PV_PARAMS = {
     'A': 1.9
 }
 
+# Opt-in coalescing of concurrent /predict calls into batched model calls
+MICRO_BATCHING = {
+    'enabled': os.environ.get('PV_MICRO_BATCHING', '0') == '1',
+    'max_batch_size': 64,
+    'max_wait_ms': 5.0,
+    # A request waiting longer than this for its micro-batch gets a 503
+    'timeout_s': float(os.environ.get('PV_MICRO_BATCH_TIMEOUT', '30'))
+}
+
+# Models are loaded on first use (or at startup when listed in 'warmup') and
+# the least recently used ones are unloaded above the memory budget
+MODEL_CACHE = {
+    'warmup': [m for m in os.environ.get('PV_WARMUP', '').split(',') if m],
+    'memory_mb': int(os.environ.get('PV_MODEL_MEMORY_MB', '1024'))
+}
+
+# /predict result cache (0 entries disables it); PV_CACHE_URL=redis://... shares it
+RESULT_CACHE = {
+    'max_entries': int(os.environ.get('PV_CACHE_SIZE', '10000')),
+    'ttl': float(os.environ.get('PV_CACHE_TTL', '60')),
+    'url': os.environ.get('PV_CACHE_URL')
+}
+
+# PV_WORKERS > 0 serves with that many forked workers instead of the dev server
+SERVING = {
+    'workers': int(os.environ.get('PV_WORKERS', '0')),
+    'max_requests': int(os.environ.get('PV_MAX_REQUESTS', '0')),
+    'max_requests_jitter': int(os.environ.get('PV_MAX_REQUESTS_JITTER', '0'))
+}
+
+# PV_TREE_BACKEND=native|numpy|auto replaces the gbm/lightgbm/xgboost runtimes
+# with one compiled TreeEnsemble each at load time (auto: native if numba is
+# installed); PV_TREE_THREADS splits large batches over threads (native only)
+TREE_BACKEND = {
+    'engine': os.environ.get('PV_TREE_BACKEND', ''),
+    'threads': int(os.environ.get('PV_TREE_THREADS', '1'))
+}
+
+# Stateful /stream/readings: per-inverter LSTM state plus the last `window`
+# feature rows; a fault state only changes after `debounce` consecutive
+# readings agree. Inverters idle for idle_ttl seconds are evicted, and the
+# least recently seen ones once memory_mb of state is in use
+INVERTER_STREAM = {
+    'window': int(os.environ.get('PV_STREAM_WINDOW', '12')),
+    'debounce': int(os.environ.get('PV_STREAM_DEBOUNCE', '3')),
+    'idle_ttl': float(os.environ.get('PV_STREAM_IDLE_TTL', '3600')),
+    'memory_mb': int(os.environ.get('PV_STREAM_MEMORY_MB', '256'))
+}
+
+# model='cascade' runs these models cheapest first and passes a reading on to
+# the next one only while its top-class probability is below threshold
+CASCADE = {
+    'stages': os.environ.get('PV_CASCADE_STAGES', 'gbm,lightgbm,lstm').split(','),
+    'threshold': float(os.environ.get('PV_CASCADE_THRESHOLD', '0.9'))
+}
+
+# Rows per chunk of a streamed /batch_predict response
+STREAM_CHUNK_ROWS = 1024
+
+# Inputs of up to this many readings get their features in plain Python
+# (fast_features); pandas only pays off for larger batches
+FAST_FEATURES_MAX_ROWS = 128
+
+# Readings per I-V grid in calculate_theoretical_power_batch (x 1000 float64 each)
+THEO_CHUNK_ROWS = 512
+
+# Power_Theo from a precomputed irradiance x temperature table (bilinear, error
+# bound in W); PV_POWER_THEO_LOOKUP=0 computes every reading exactly
+POWER_THEO = {
+    'lookup': os.environ.get('PV_POWER_THEO_LOOKUP', '1') == '1',
+    'irradiance': (0.0, 1500.0, 5.0),    # W/m2: start, stop, step
+    'temperature': (-40.0, 90.0, 1.0),   # degC: start, stop, step
+    'max_error': float(os.environ.get('PV_POWER_THEO_MAX_ERROR', '0.05')),
+    'cache_dir': os.environ.get('PV_POWER_THEO_CACHE', '.cache')
+}
+
+# Metrics start collecting on the first /metrics scrape; PV_METRICS=1 from startup
+metrics = Metrics('pv', enabled=os.environ.get('PV_METRICS', '0') == '1')
+
 # ==================== Helper Functions ====================
 
 def find_mpp(voltage, current):
@@ -71,8 +173,8 @@ def find_mpp(voltage, current):
     mpp_idx = np.argmax(power)
     return power[mpp_idx].round(3)
 
-def calculate_theoretical_power(irradiance, temperature):
-    """Calculate theoretical PV power output"""
+def _iv_curve_params(irradiance, temperature):
+    """Thermal voltage, photo/saturation currents and array Voc (scalars or arrays)"""
     k = 1.38e-23  # Boltzmann constant
     q = 1.602e-19  # Electron charge
     
@@ -89,9 +191,15 @@ def calculate_theoretical_power(irradiance, temperature):
     Voc_array = Voc * PV_PARAMS['modules_per_string']
     I0 = Isc / (np.exp(Voc / (PV_PARAMS['A'] * PV_PARAMS['n_s'] * Vt)) - 1)
     
-    voltage_range = np.linspace(0, Voc_array * 1.1, 1000)
     photo_current = Isc * PV_PARAMS['n_p']
     saturation_current = I0 * PV_PARAMS['n_p']
+    return Vt, photo_current, saturation_current, Voc_array
+
+def calculate_theoretical_power(irradiance, temperature):
+    """Calculate theoretical PV power output"""
+    Vt, photo_current, saturation_current, Voc_array = _iv_curve_params(irradiance, temperature)
+    
+    voltage_range = np.linspace(0, Voc_array * 1.1, 1000)
     
     voltage_per_module = voltage_range / PV_PARAMS['modules_per_string']
     current_values = photo_current - saturation_current * \
@@ -100,15 +208,112 @@ def calculate_theoretical_power(irradiance, temperature):
     
     return find_mpp(voltage_range, current_values) / 3
 
+IV_CURVE_POINTS = 1000
+
+def _grid_power(idx, Vt, photo_current, saturation_current, Voc_array):
+    """
+    P = V * I at points idx of each reading's I-V grid, computed exactly like
+    np.linspace(0, Voc_array * 1.1, IV_CURVE_POINTS) in calculate_theoretical_power
+    """
+    stop = Voc_array[:, None] * 1.1
+    voltage = idx * (stop / (IV_CURVE_POINTS - 1))
+    voltage = np.where(idx == IV_CURVE_POINTS - 1, stop, voltage)
+    voltage_per_module = voltage / PV_PARAMS['modules_per_string']
+    current_values = photo_current[:, None] - saturation_current[:, None] * \
+                     (np.exp(voltage_per_module / (PV_PARAMS['A'] * PV_PARAMS['n_s'] * Vt[:, None])) - 1)
+    return voltage * np.maximum(current_values, 0)
+
+def _solve_mpp_index(Vt, photo_current, saturation_current, Voc_array, iterations=8):
+    """
+    Fractional I-V grid index of the continuous maximum power point.
+
+    With x = V / (modules * A * n_s * Vt), dP/dV = 0 reduces to
+    x + ln(1 + x) = ln(1 + Iph / I0), solved by Newton's method from
+    x = ln(1 + Iph / I0); the iteration decreases monotonically onto the root.
+    """
+    log_c = np.log1p(photo_current / saturation_current)
+    x = log_c
+    for _ in range(iterations):
+        x = x - (x + np.log1p(x) - log_c) / (1 + 1 / (1 + x))
+    v_mpp = x * PV_PARAMS['modules_per_string'] * PV_PARAMS['A'] * PV_PARAMS['n_s'] * Vt
+    return v_mpp / (Voc_array * 1.1) * (IV_CURVE_POINTS - 1)
+
+def calculate_theoretical_power_batch(irradiance, temperature, chunk_rows=THEO_CHUNK_ROWS):
+    """
+    Vectorized calculate_theoretical_power for arrays of readings.
+
+    P(V) is concave where the current is positive, so the best point of the
+    1000-point I-V grid is a neighbour of the continuous MPP: solve for it and
+    evaluate only the surrounding grid points. Readings the solver does not
+    cover (dark or non-physical inputs) evaluate the full grid, chunk_rows
+    readings at a time.
+    """
+    irradiance = np.asarray(irradiance, dtype=np.float64).ravel()
+    temperature = np.asarray(temperature, dtype=np.float64).ravel()
+    with np.errstate(all='ignore'):
+        Vt, photo_current, saturation_current, Voc_array = _iv_curve_params(irradiance, temperature)
+        mpp = np.zeros(len(irradiance))
+
+        solvable = (photo_current > 0) & (saturation_current > 0) & np.isfinite(saturation_current) \
+            & np.isfinite(Vt) & np.isfinite(Voc_array)
+        if solvable.any():
+            rows = np.flatnonzero(solvable)
+            params = (Vt[rows], photo_current[rows], saturation_current[rows], Voc_array[rows])
+            center = np.floor(_solve_mpp_index(*params))
+            idx = np.clip(center[:, None] + np.arange(-1, 3), 0, IV_CURVE_POINTS - 1)
+            mpp[rows] = _grid_power(idx, *params).max(axis=1)
+
+        # Zero irradiance gives zero current everywhere; everything else left is brute-forced
+        remaining = np.flatnonzero(~solvable & (photo_current != 0))
+        grid = np.arange(IV_CURVE_POINTS, dtype=np.float64)
+        for start in range(0, len(remaining), chunk_rows):
+            rows = remaining[start:start + chunk_rows]
+            params = (Vt[rows], photo_current[rows], saturation_current[rows], Voc_array[rows])
+            power = _grid_power(grid, *params)
+            # np.argmax picks the first NaN, as find_mpp does
+            mpp[rows] = power[np.arange(len(rows)), np.argmax(power, axis=1)]
+    return mpp.round(3) / 3
+
+power_theo_table = None
+power_theo_lock = threading.Lock()
+
+def get_power_theo_table():
+    """The Power_Theo lookup table, loaded from cache or built on first use"""
+    global power_theo_table
+    with power_theo_lock:
+        if power_theo_table is None:
+            power_theo_table = load_or_build(
+                calculate_theoretical_power_batch,
+                dict(PV_PARAMS, iv_curve_points=IV_CURVE_POINTS),
+                POWER_THEO['irradiance'], POWER_THEO['temperature'],
+                POWER_THEO['max_error'], cache_dir=POWER_THEO['cache_dir'])
+        return power_theo_table
+
+def theoretical_power_one(irradiance, temperature):
+    """Power_Theo of one reading as a Python float"""
+    if POWER_THEO['lookup']:
+        return get_power_theo_table().lookup_one(irradiance, temperature,
+                                                 fallback=calculate_theoretical_power)
+    return float(calculate_theoretical_power(irradiance, temperature))
+
+def theoretical_power(irradiance, temperature):
+    """Power_Theo for arrays of readings, from the lookup table when enabled"""
+    if POWER_THEO['lookup']:
+        table = get_power_theo_table()
+        if len(irradiance) == 1:
+            return np.array([theoretical_power_one(float(irradiance[0]), float(temperature[0]))])
+        return table.lookup(irradiance, temperature, fallback=calculate_theoretical_power_batch)
+    return calculate_theoretical_power_batch(irradiance, temperature)
+
 def feature_engineering(data):
     """Perform feature engineering on input data"""
     df = pd.DataFrame([data]) if isinstance(data, dict) else pd.DataFrame(data)
     
     # Calculate theoretical power if not present
     if 'Power_Theo' not in df.columns:
-        df['Power_Theo'] = df.apply(
-            lambda row: calculate_theoretical_power(row['Irradiance'], row['Temperature']),
-            axis=1
+        df['Power_Theo'] = theoretical_power(
+            df['Irradiance'].to_numpy(dtype=np.float64),
+            df['Temperature'].to_numpy(dtype=np.float64)
         ).round(3)
     
     # Calculate power ratio if not present
@@ -126,6 +331,63 @@ def feature_engineering(data):
     
     return df
 
+CLIPPED_FEATURES = {'Current(A)', 'Power(W)', 'Voltage(V)', 'LoadCurrent(A)', 'LoadPower(W)',
+                    'LoadVoltage(V)', 'Power_Ratio', 'Power_Theo'}
+
+def _round3(value):
+    # Same result as numpy's round(3): scale, round half to even, unscale
+    return round(value * 1000.0) / 1000.0 if math.isfinite(value) else value
+
+def fast_features(data):
+    """
+    feature_engineering(data)[FEATURES].values without pandas for a reading
+    dict or a short list of them. Returns None when the input needs the
+    pandas path: too many rows, missing or non-numeric values, or optional
+    columns present in only some readings.
+    """
+    readings = [data] if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not 0 < len(readings) <= FAST_FEATURES_MAX_ROWS:
+        return None
+    # pandas computes Power_Theo / Power_Ratio only for columns no reading has
+    has_theo = 'Power_Theo' in readings[0]
+    has_ratio = 'Power_Ratio' in readings[0]
+    
+    rows = []
+    for reading in readings:
+        if not isinstance(reading, dict) or ('Power_Theo' in reading) != has_theo or \
+                ('Power_Ratio' in reading) != has_ratio:
+            return None
+        values = {}
+        for name in FEATURES:
+            value = reading.get(name)
+            if value is None:
+                if (name == 'Power_Theo' and not has_theo) or (name == 'Power_Ratio' and not has_ratio):
+                    continue
+                return None
+            if type(value) not in (float, int):
+                return None
+            values[name] = value
+        
+        if not has_theo:
+            values['Power_Theo'] = _round3(theoretical_power_one(float(values['Irradiance']),
+                                                                 float(values['Temperature'])))
+        if not has_ratio:
+            denominator = values['Power_Theo'] + 1
+            if denominator == 0:
+                return None
+            values['Power_Ratio'] = _round3(values['Power(W)'] / denominator)
+        # max() keeps NaN and -0.0 as clip(lower=0) does
+        rows.append([float(max(values[name], 0)) if name in CLIPPED_FEATURES else float(values[name])
+                     for name in FEATURES])
+    return np.array(rows, dtype=np.float64)
+
+def feature_matrix(data):
+    """FEATURES matrix of raw readings, through fast_features when the input is small"""
+    X = fast_features(data)
+    if X is None:
+        X = feature_engineering(data)[FEATURES].values
+    return X
+
 # ==================== LSTM Model Definition ====================
 
 class LSTMModel(nn.Module):
@@ -163,13 +425,114 @@ class LSTMModel(nn.Module):
 
 # ==================== Load Models ====================
 
-models = {}
+models = ModelRegistry(max_bytes=MODEL_CACHE['memory_mb'] * 1024 * 1024)
 scaler = None
 lstm_scaler = None
 label_encoder = None
 
+def align_classes(model):
+    """
+    Map a classifier's classes_ onto FAULT_TYPES once: column i of the aligned
+    probabilities is column fault_columns_[i] of predict_proba (-1 if the
+    model never saw that class). Integer classes are label-encoded names.
+    """
+    classes = list(model.classes_)
+    if classes and all(isinstance(c, (int, np.integer)) for c in classes):
+        codes = [int(c) for c in classes]
+        if label_encoder is not None:
+            names = [str(n) for n in label_encoder.inverse_transform(codes)]
+        else:
+            names = [FAULT_TYPES[c] if 0 <= c < len(FAULT_TYPES) else str(c) for c in codes]
+    else:
+        names = [str(c) for c in classes]
+    column_of = {name: col for col, name in enumerate(names)}
+    unknown = [name for name in names if name not in FAULT_TYPES]
+    if unknown:
+        print(f"Warning: model classes {unknown} are not in FAULT_TYPES and are ignored")
+    model.fault_columns_ = np.array([column_of.get(name, -1) for name in FAULT_TYPES])
+    return model.fault_columns_
+
+def aligned_probabilities(model, X):
+    """predict_proba of a scikit-learn style model with columns in FAULT_TYPES order"""
+    raw_probs = model.predict_proba(X)
+    columns = getattr(model, 'fault_columns_', None)
+    if columns is None:
+        # Models registered directly rather than through a loader
+        columns = align_classes(model)
+    if (columns >= 0).all():
+        return raw_probs[:, columns]
+    probabilities = np.zeros((raw_probs.shape[0], len(FAULT_TYPES)))
+    present = columns >= 0
+    probabilities[:, present] = raw_probs[:, columns[present]]
+    return probabilities
+
+def compile_tree_model(model):
+    """The TreeEnsemble for a tree model when TREE_BACKEND is set, else the model"""
+    if not TREE_BACKEND['engine']:
+        return model
+    engine = None if TREE_BACKEND['engine'] == 'auto' else TREE_BACKEND['engine']
+    try:
+        ensemble = compile_ensemble(model, engine=engine, n_threads=TREE_BACKEND['threads'])
+    except NotCompilable as e:
+        print(f"! Tree backend not used ({e}); keeping the library runtime")
+        return model
+    ensemble.fault_columns_ = getattr(model, 'fault_columns_', None)
+    print(f"✓ Compiled {ensemble.n_trees} trees ({ensemble.engine} engine)")
+    return ensemble
+
+def load_gbm(path):
+    model = joblib.load(path)
+    align_classes(model)
+    print("✓ Gradient Boosting model loaded")
+    return compile_tree_model(model)
+
+def load_lightgbm(path):
+    model = joblib.load(path)
+    align_classes(model)
+    print("✓ LightGBM model loaded")
+    return compile_tree_model(model)
+
+def load_xgboost(path):
+    import xgboost as xgb
+    xgb_model = xgb.Booster()
+    xgb_model.load_model(str(path))
+    print("✓ XGBoost model loaded")
+    return compile_tree_model(xgb_model)
+
+def load_lstm(path):
+    global lstm_scaler
+    lstm_model = LSTMModel(
+        input_size=len(FEATURES),  # 10 features
+        hidden_size1=128,
+        hidden_size2=64,
+        output_size=len(FAULT_TYPES),  # 5 fault types
+        seq_length=1
+    ).to(device)
+    lstm_model.load_state_dict(torch.load(path, map_location=device))
+    lstm_model.eval()
+    print("✓ LSTM model loaded")
+    
+    # Load LSTM scaler if available
+    lstm_scaler_path = MODELS_DIR / 'lstm_pytorch_scaler.pkl'
+    if lstm_scaler_path.exists():
+        lstm_scaler = joblib.load(lstm_scaler_path)
+        print("✓ LSTM scaler loaded")
+    else:
+        from sklearn.preprocessing import StandardScaler
+        print("✗ LSTM scaler not found, using StandardScaler")
+        lstm_scaler = StandardScaler()
+    return lstm_model
+
+MODEL_FILES = {
+    'gbm': ('gbm_pv_model.pkl', load_gbm),
+    'lightgbm': ('lightgbm_model.pkl', load_lightgbm),
+    'xgboost': ('xgboost_pv_model.json', load_xgboost),
+    'lstm': ('lstm_pytorch_model.pth', load_lstm)
+}
+
 def load_models():
-    global models, scaler, lstm_scaler, label_encoder, FAULT_TYPES
+    """Load the class labels, register every model found and load the warmup list"""
+    global scaler, label_encoder, FAULT_TYPES
     
     try:
         # Try to load label encoder and status mapping to set FAULT_TYPES
@@ -187,77 +550,352 @@ def load_models():
         except Exception as e:
             print("! Could not load label encoder/status mapping:", e)
         
-        # Load Gradient Boosting (sklearn)
-        gbm_path = MODELS_DIR / 'gbm_pv_model.pkl'
-        if gbm_path.exists():
-            models['gbm'] = joblib.load(gbm_path)
-            print("✓ Gradient Boosting model loaded")
-        else:
-            print(f"✗ GBM model not found at {gbm_path}")
-        
-        # Load LightGBM
-        lgbm_path = MODELS_DIR / 'lightgbm_model.pkl'
-        if lgbm_path.exists():
-            models['lightgbm'] = joblib.load(lgbm_path)
-            print("✓ LightGBM model loaded")
-        else:
-            print(f"✗ LightGBM model not found at {lgbm_path}")
-        
-        # Load XGBoost
-        xgb_path = MODELS_DIR / 'xgboost_pv_model.json'
-        if xgb_path.exists():
-            xgb_model = xgb.Booster()
-            xgb_model.load_model(str(xgb_path))
-            models['xgboost'] = xgb_model
-            print("✓ XGBoost model loaded")
-        else:
-            print(f"✗ XGBoost model not found at {xgb_path}")
-        
-        # Load LSTM
-        lstm_path = MODELS_DIR / 'lstm_pytorch_model.pth'
-        lstm_scaler_path = MODELS_DIR / 'lstm_pytorch_scaler.pkl'
-        if lstm_path.exists():
-            lstm_model = LSTMModel(
-                input_size=len(FEATURES),  # 10 features
-                hidden_size1=128,
-                hidden_size2=64,
-                output_size=len(FAULT_TYPES),  # 5 fault types
-                seq_length=1
-            ).to(device)
-            lstm_model.load_state_dict(torch.load(lstm_path, map_location=device))
-            lstm_model.eval()
-            models['lstm'] = lstm_model
-            print("✓ LSTM model loaded")
-            
-            # Load LSTM scaler if available
-            if lstm_scaler_path.exists():
-                lstm_scaler = joblib.load(lstm_scaler_path)
-                print("✓ LSTM scaler loaded")
+        for name, (filename, loader) in MODEL_FILES.items():
+            path = MODELS_DIR / filename
+            if path.exists():
+                models.register(name, lambda loader=loader, path=path: loader(path), path)
             else:
-                print("✗ LSTM scaler not found, using StandardScaler")
-                lstm_scaler = StandardScaler()
-        else:
-            print(f"✗ LSTM model not found at {lstm_path}")
+                print(f"✗ {MODEL_DISPLAY_NAMES[name]} model not found at {path}")
         
         # Initialize general scaler
+        from sklearn.preprocessing import StandardScaler
         scaler = StandardScaler()
         
-        print(f"\nLoaded {len(models)} models successfully on {device}")
+        print(f"\nRegistered {len(models)} models on {device}")
+        models.warmup(MODEL_CACHE['warmup'])
         
     except Exception as e:
         print(f"Error loading models: {e}")
         import traceback
         traceback.print_exc()
 
+def prepare_for_fork():
+    """Load every model once, torch weights in shared memory, before forking"""
+    if POWER_THEO['lookup']:
+        get_power_theo_table()
+    models.warmup(models.keys())
+    for name in models.loaded():
+        model = models[name]
+        if isinstance(model, nn.Module):
+            model.share_memory()
+
+def scale_lstm_inputs(X):
+    if lstm_scaler:
+        return lstm_scaler.transform(X)
+    return scaler.fit_transform(X)
+
+cascade = Cascade(CASCADE['stages'], CASCADE['threshold'])
+
+def model_available(model_name):
+    if model_name == 'cascade':
+        return bool(cascade.active_stages(models))
+    return model_name in models
+
+def model_version(model_name, threshold=None):
+    """Result cache version tag; a cascade's depends on every stage and the threshold"""
+    if model_name == 'cascade':
+        stages = ','.join(f'{stage}:{models.version(stage)}' for stage in cascade.active_stages(models))
+        return f'{stages}@{threshold or cascade.threshold}'
+    return models.version(model_name)
+
+def cascade_threshold(data):
+    """Per-request cascade threshold, None for the configured one"""
+    threshold = data.get('threshold')
+    if threshold is None:
+        return None
+    threshold = float(threshold)
+    if not 0 < threshold <= 1:
+        raise ValueError('threshold must be in (0, 1]')
+    return threshold
+
+def predict_cascade(X, threshold=None):
+    """(predictions, probabilities, decided_by, stages) of the model cascade"""
+    return cascade.run(X, lambda stage, rows: predict_batch(stage, rows)[1], models, threshold)
+
+def predict_batch(model_name, X, timer=NULL_TIMER):
+    """Run model_name on feature matrix X; returns (predictions, probabilities)"""
+    if model_name == 'cascade':
+        with timer.stage('forward'):
+            predictions, probabilities, _decided_by, _stages = predict_cascade(X)
+        return predictions, probabilities
+    
+    with timer.stage('model_load'):
+        model = models[model_name]
+    
+    if model_name in ['gbm', 'lightgbm']:
+        # Scikit-learn style models
+        with timer.stage('forward'):
+            probabilities = aligned_probabilities(model, X)
+        predictions = np.argmax(probabilities, axis=1)
+        
+    elif model_name == 'xgboost':
+        if isinstance(model, TreeEnsemble):
+            with timer.stage('forward'):
+                probs = model.predict_proba(X)
+        else:
+            import xgboost as xgb
+            with timer.stage('scaling'):
+                dmatrix = xgb.DMatrix(X, feature_names=FEATURES)
+            with timer.stage('forward'):
+                probs = model.predict(dmatrix)
+        predictions = np.argmax(probs, axis=1)
+        probabilities = probs
+        
+    elif model_name == 'lstm':
+        # Scale features
+        with timer.stage('scaling'):
+            X_scaled = scale_lstm_inputs(X)
+            
+            # Shape: (batch_size, seq_len=1, features)
+            X_tensor = torch.FloatTensor(X_scaled).unsqueeze(1).to(device)
+        with timer.stage('forward'), torch.no_grad():
+            outputs = model(X_tensor)
+            probs = torch.softmax(outputs, dim=1).cpu().numpy()
+        predictions = np.argmax(probs, axis=1)
+        probabilities = probs
+    
+    return predictions, probabilities
+
+def read_binary_readings(request):
+    """Decode a binary batch body into a DataFrame of sensor readings"""
+    if request.mimetype == 'application/vnd.apache.arrow.stream':
+        return pd.DataFrame(parse_binary_body(request, as_table=True))
+    
+    columns = request.args.get('columns')
+    columns = columns.split(',') if columns else INPUT_FEATURES
+    values = np.asarray(parse_binary_body(request), dtype=np.float64)
+    if values.size % len(columns):
+        raise WireFormatError(f'Body size is not a multiple of {len(columns)} columns')
+    return pd.DataFrame(values.reshape(-1, len(columns)), columns=columns)
+
+result_cache = ResultCache(max_entries=RESULT_CACHE['max_entries'],
+                           ttl=RESULT_CACHE['ttl'],
+                           redis_url=RESULT_CACHE['url'],
+                           prefix='pv')
+
+stream_jobs = StreamJobs()
+
+# /batch_predict result layouts: one dict per reading, or index / matrix columns
+RESPONSE_FORMATS = ('records', 'matrix')
+
+def response_options(data):
+    """(format, top_k) of a /batch_predict request; top_k None keeps every class"""
+    response_format = str(data.get('format') or 'records').lower()
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f'format must be one of {list(RESPONSE_FORMATS)}')
+    top_k = data.get('top_k')
+    if top_k in (None, ''):
+        return response_format, None
+    try:
+        top_k = int(top_k)
+    except (TypeError, ValueError):
+        raise ValueError('top_k must be an integer')
+    if not 1 <= top_k <= len(FAULT_TYPES):
+        raise ValueError(f'top_k must be between 1 and {len(FAULT_TYPES)}')
+    return response_format, top_k
+
+def top_classes(probabilities, k):
+    """Indices of the k most probable classes per row, most probable first"""
+    return np.argsort(-probabilities, axis=1, kind='stable')[:, :k]
+
+def format_results(predictions, probabilities, response_format='records', top_k=None,
+                   first_index=0):
+    """
+    The per-reading part of a /batch_predict response. 'records' is a list
+    of dicts; 'matrix' gives prediction indices and a probability matrix
+    (n x k, with the class indices alongside when top_k is set) as arrays,
+    both indexing the fault_types sent once in the response.
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    predictions = np.asarray(predictions, dtype=np.int64)
+    classes = top_classes(probabilities, top_k) if top_k is not None else None
+    
+    if response_format == 'matrix':
+        result = {'predictions': predictions}
+        if classes is None:
+            result['probabilities'] = probabilities
+        else:
+            result['classes'] = classes
+            result['probabilities'] = np.take_along_axis(probabilities, classes, axis=1)
+        return result
+    
+    results = []
+    for i, (pred, prob) in enumerate(zip(predictions.tolist(), probabilities.tolist())):
+        columns = range(len(FAULT_TYPES)) if classes is None else classes[i].tolist()
+        results.append({
+            'index': first_index + i,
+            'prediction': FAULT_TYPES[pred],
+            'confidence': prob[pred],
+            'probabilities': {FAULT_TYPES[j]: prob[j] for j in columns}
+        })
+    return {'predictions': results}
+
+def columnar_results(predictions, probabilities, top_k=None):
+    """npz / Arrow columns: prediction plus one probability column per fault
+    type, or class_i / probability_i for the top_k classes"""
+    probabilities = np.asarray(probabilities)
+    columns = {'prediction': np.asarray(predictions, dtype=np.int64)}
+    if top_k is None:
+        for j, fault in enumerate(FAULT_TYPES):
+            columns[fault] = probabilities[:, j].astype(np.float32)
+        return columns
+    classes = top_classes(probabilities, top_k)
+    top = np.take_along_axis(probabilities, classes, axis=1)
+    for i in range(top_k):
+        columns[f'class_{i + 1}'] = classes[:, i]
+        columns[f'probability_{i + 1}'] = top[:, i].astype(np.float32)
+    return columns
+
+def score_frame(model_name, readings, threshold=None):
+    """
+    (predictions, probabilities, decided_by, stages) for a chunk of raw
+    readings; decided_by and stages are None unless model_name is 'cascade'
+    """
+    X = feature_matrix(readings)
+    if model_name == 'cascade':
+        return predict_cascade(X, threshold)
+    predictions, probabilities = predict_batch(model_name, X)
+    return predictions, probabilities, None, None
+
+def cascade_header(model_name, threshold=None):
+    """Stream header fields of a cascade: its stages and threshold"""
+    if model_name != 'cascade':
+        return {}
+    return {'cascade': {'stages': cascade.active_stages(models),
+                        'threshold': threshold or cascade.threshold}}
+
+def stream_predictions(model_name, input_data, chunk_rows, response_format='records', top_k=None,
+                       threshold=None):
+    """
+    Yield lists of /batch_predict result records, chunk_rows readings at a
+    time; with the 'matrix' format one record per chunk holds its columns
+    """
+    for start in range(0, len(input_data), chunk_rows):
+        if isinstance(input_data, pd.DataFrame):
+            chunk = input_data.iloc[start:start + chunk_rows]
+        else:
+            chunk = input_data[start:start + chunk_rows]
+        predictions, probabilities, decided_by, stages = score_frame(model_name, chunk, threshold)
+        result = format_results(predictions, probabilities, response_format, top_k,
+                                first_index=start)
+        if response_format == 'matrix':
+            line = dict({key: value.tolist() for key, value in result.items()}, index=start)
+            if stages is not None:
+                line['stage'] = np.asarray(decided_by).tolist()
+            yield [line]
+        else:
+            if stages is not None:
+                for record, stage in zip(result['predictions'], decided_by):
+                    record['stage'] = stages[stage]
+            yield result['predictions']
+
+def lstm_step(model, X, states):
+    """One LSTM time step for a batch of inverters from their (h1, c1, h2, c2)"""
+    x = torch.from_numpy(np.asarray(scale_lstm_inputs(X), dtype=np.float32)).unsqueeze(1).to(device)
+    h1, c1, h2, c2 = (torch.from_numpy(state).unsqueeze(0).to(device) for state in states)
+    with torch.no_grad():
+        out1, (h1, c1) = model.lstm1(x, (h1, c1))
+        out2, (h2, c2) = model.lstm2(out1, (h2, c2))
+        logits = model.fc2(model.relu(model.fc1(out2[:, -1, :])))
+        probs = torch.softmax(logits, dim=1).cpu().numpy()
+    return probs, [t.squeeze(0).cpu().numpy() for t in (h1, c1, h2, c2)]
+
+inverter_streams = {}
+inverter_streams_lock = threading.Lock()
+
+def get_inverter_stream(model_name):
+    """
+    (InverterStates, advance) for model_name. The LSTM carries its h/c per
+    inverter; other models are stateless per reading and only get the window
+    and debouncing. States are dropped when the model file changes.
+    """
+    version = models.version(model_name)
+    with inverter_streams_lock:
+        entry = inverter_streams.get(model_name)
+        if entry is None or entry[0] != version:
+            model = models[model_name]
+            if model_name == 'lstm':
+                state_sizes = [model.hidden_size1, model.hidden_size1,
+                               model.hidden_size2, model.hidden_size2]
+                advance = lambda X, states: lstm_step(models[model_name], X, states)
+            else:
+                state_sizes = []
+                advance = lambda X, states: (predict_batch(model_name, X)[1], [])
+            states = InverterStates(state_sizes, len(FEATURES),
+                                    window=INVERTER_STREAM['window'],
+                                    debounce=INVERTER_STREAM['debounce'],
+                                    idle_ttl=INVERTER_STREAM['idle_ttl'],
+                                    max_bytes=INVERTER_STREAM['memory_mb'] * 1024 * 1024)
+            entry = inverter_streams[model_name] = (version, states, advance)
+        return entry[1], entry[2]
+
+def fault_name(index):
+    return FAULT_TYPES[index] if index != NO_STATE else None
+
+batchers = {}
+batchers_lock = threading.Lock()
+
+def get_batcher(model_name):
+    """Return the MicroBatcher for model_name, creating it on first use"""
+    with batchers_lock:
+        if model_name not in batchers:
+            def run_batch(rows, model_name=model_name):
+                if metrics.enabled:
+                    metrics.observe_batch('micro_batch', model_name, len(rows))
+                predictions, probabilities = predict_batch(model_name, np.vstack(rows))
+                return list(zip(predictions, probabilities))
+            batchers[model_name] = MicroBatcher(run_batch,
+                                                max_batch_size=MICRO_BATCHING['max_batch_size'],
+                                                max_wait_ms=MICRO_BATCHING['max_wait_ms'],
+                                                name=model_name)
+        return batchers[model_name]
+
 # ==================== API Routes ====================
 
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        endpoint, status = request.endpoint or 'unknown', response.status_code
+        request_bytes = request.content_length or 0
+        if response.is_streamed:
+            # The body is produced after this returns: time it until the stream is closed
+            response.call_on_close(lambda: metrics.observe_request(
+                endpoint, status, time.perf_counter() - start, request_bytes))
+        else:
+            metrics.observe_request(endpoint, status, time.perf_counter() - start, request_bytes)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition; the first scrape switches collection on"""
+    metrics.enabled = True
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'models_loaded': list(models.keys()),
-        'device': str(device)
+        'models_loaded': models.loaded(),
+        'models_available': models.keys(),
+        'model_cache': models.stats(),
+        'result_cache': result_cache.stats(),
+        'device': str(device),
+        'streams': stream_jobs.stats(),
+        'power_theo_table': power_theo_table.info() if power_theo_table is not None else None,
+        'tree_backend': TREE_BACKEND['engine'] or None,
+        'cascade': cascade.stats(),
+        'inverter_streams': {name: entry[1].stats() for name, entry in inverter_streams.items()},
+        'micro_batching': {
+            'enabled': MICRO_BATCHING['enabled'],
+            'batchers': {name: b.stats() for name, b in batchers.items()}
+        }
     })
 
 @app.route('/predict', methods=['POST'])
@@ -265,7 +903,7 @@ def predict():
     """
     Predict PV fault from sensor readings
     Request: {
-        "model": "gbm|lightgbm|xgboost|lstm",
+        "model": "gbm|lightgbm|xgboost|lstm|cascade",
         "data": {
             "Irradiance": float,
             "Temperature": float,
@@ -275,82 +913,89 @@ def predict():
             "LoadCurrent(A)": float,
             "LoadPower(W)": float,
             "LoadVoltage(V)": float
-        }
+        },
+        "threshold": 0.9
     }
+    "cascade" runs the CASCADE stages cheapest first, escalating while the
+    top-class probability is below threshold; "stage" names the deciding model.
     """
+    timer = metrics.timer('predict')
     try:
-        data = request.get_json()
+        with timer.stage('parse'):
+            data = request.get_json()
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
         model_name = data.get('model', 'random_forest').lower()
         input_data = data.get('data', {})
+        timer.model = model_name
         
-        if model_name not in models:
+        if not model_available(model_name):
             return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
+        try:
+            threshold = cascade_threshold(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Feature engineering
-        df = feature_engineering(input_data)
-        
-        # Ensure all features are present
-        missing_features = [f for f in FEATURES if f not in df.columns]
-        if missing_features:
-            return jsonify({'error': f'Missing features: {missing_features}'}), 400
+        with timer.stage('feature_engineering'):
+            X = fast_features(input_data)
+            if X is None:
+                df = feature_engineering(input_data)
+                
+                # Ensure all features are present
+                missing_features = [f for f in FEATURES if f not in df.columns]
+                if missing_features:
+                    return jsonify({'error': f'Missing features: {missing_features}'}), 400
+                
+                X = df[FEATURES].values
         
-        X = df[FEATURES].values
+        # Identical readings are answered from the cache
+        cache_key = None
+        if result_cache.enabled:
+            cache_key = make_key(model_name, model_version(model_name, threshold), X[0])
+            with timer.stage('cache_lookup'):
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                with timer.stage('serialize'):
+                    return jsonify(cached)
         
         # Predict based on model type
-        model = models[model_name]
+        if model_name != 'cascade':
+            with timer.stage('model_load'):
+                model = models[model_name]
+        timer.batch_size(1)
+        stage = None
         
-        if model_name in ['gbm', 'lightgbm']:
-            # Scikit-learn style models
-            prediction_idx = model.predict(X)[0]
-            raw_probs = model.predict_proba(X)[0]
+        if model_name == 'cascade':
+            with timer.stage('forward'):
+                predictions, probs, decided_by, stages = predict_cascade(X, threshold)
+            prediction = int(predictions[0])
+            probabilities = probs[0]
+            stage = stages[decided_by[0]]
             
-            # Get class mapping from model
-            if hasattr(model, 'classes_'):
-                # Model classes might be integers or strings
-                model_classes = model.classes_
-                
-                # Create probability dictionary with correct alignment
-                if label_encoder is not None:
-                    try:
-                        # Try to map model classes to fault type names
-                        class_names = []
-                        for cls in model_classes:
-                            if isinstance(cls, (int, np.integer)):
-                                class_names.append(label_encoder.inverse_transform([int(cls)])[0])
-                            else:
-                                class_names.append(str(cls))
-                        
-                        # Build probability array aligned with FAULT_TYPES
-                        probabilities = np.zeros(len(FAULT_TYPES))
-                        name_to_idx = {name: i for i, name in enumerate(FAULT_TYPES)}
-                        for i, (cls_name, prob) in enumerate(zip(class_names, raw_probs)):
-                            if cls_name in name_to_idx:
-                                probabilities[name_to_idx[cls_name]] = prob
-                        
-                        # Get prediction class name
-                        if isinstance(prediction_idx, (int, np.integer)):
-                            prediction = int(prediction_idx)
-                        else:
-                            # If prediction is string, find its index
-                            prediction = name_to_idx.get(str(prediction_idx), 0)
-                    except Exception as e:
-                        print(f"Warning: Label mapping failed: {e}")
-                        probabilities = raw_probs
-                        prediction = int(prediction_idx) if isinstance(prediction_idx, (int, np.integer)) else 0
-                else:
-                    probabilities = raw_probs
-                    prediction = int(prediction_idx) if isinstance(prediction_idx, (int, np.integer)) else 0
-            else:
-                probabilities = raw_probs
-                prediction = int(prediction_idx) if isinstance(prediction_idx, (int, np.integer)) else 0
+        elif MICRO_BATCHING['enabled']:
+            with timer.stage('micro_batch'):
+                prediction, probabilities = get_batcher(model_name).submit(
+                    X[0], timeout=MICRO_BATCHING['timeout_s'])
+            
+        elif model_name in ['gbm', 'lightgbm']:
+            # Scikit-learn style models
+            with timer.stage('forward'):
+                probabilities = aligned_probabilities(model, X)[0]
+            prediction = int(np.argmax(probabilities))
             
         elif model_name == 'xgboost':
-            dmatrix = xgb.DMatrix(X, feature_names=FEATURES)
-            probs = model.predict(dmatrix)
+            if isinstance(model, TreeEnsemble):
+                with timer.stage('forward'):
+                    probs = model.predict_proba(X)
+            else:
+                import xgboost as xgb
+                with timer.stage('scaling'):
+                    dmatrix = xgb.DMatrix(X, feature_names=FEATURES)
+                with timer.stage('forward'):
+                    probs = model.predict(dmatrix)
             # Handle both single and batch predictions
             if probs.ndim == 1:
                 # Single prediction case - probs is already the probability array
@@ -371,14 +1016,12 @@ def predict():
             
         elif model_name == 'lstm':
             # Scale features if scaler available
-            if lstm_scaler:
-                X_scaled = lstm_scaler.transform(X)
-            else:
-                X_scaled = scaler.fit_transform(X)
-            
-            # LSTM needs sequence (batch_size, seq_len, features)
-            X_tensor = torch.FloatTensor(X_scaled).unsqueeze(0).unsqueeze(0).to(device)
-            with torch.no_grad():
+            with timer.stage('scaling'):
+                X_scaled = scale_lstm_inputs(X)
+                
+                # LSTM needs sequence (batch_size, seq_len, features)
+                X_tensor = torch.FloatTensor(X_scaled).unsqueeze(0).unsqueeze(0).to(device)
+            with timer.stage('forward'), torch.no_grad():
                 outputs = model(X_tensor)
                 probs = torch.softmax(outputs, dim=1).cpu().numpy()[0]
             prediction = np.argmax(probs)
@@ -396,16 +1039,24 @@ def predict():
                 fault: float(prob) for fault, prob in zip(FAULT_TYPES, probabilities)
             },
             'input_data': {
-                'Irradiance': float(df['Irradiance'].values[0]),
-                'Temperature': float(df['Temperature'].values[0]),
-                'Power': float(df['Power(W)'].values[0]),
-                'Power_Theo': float(df['Power_Theo'].values[0]),
-                'Power_Ratio': float(df['Power_Ratio'].values[0])
+                'Irradiance': float(X[0, FEATURES.index('Irradiance')]),
+                'Temperature': float(X[0, FEATURES.index('Temperature')]),
+                'Power': float(X[0, FEATURES.index('Power(W)')]),
+                'Power_Theo': float(X[0, FEATURES.index('Power_Theo')]),
+                'Power_Ratio': float(X[0, FEATURES.index('Power_Ratio')])
             }
         }
+        if stage is not None:
+            result['stage'] = stage
+        
+        if cache_key is not None:
+            result_cache.put(cache_key, result)
         
-        return jsonify(result)
+        with timer.stage('serialize'):
+            return jsonify(result)
         
+    except TimeoutError:
+        return jsonify({'error': 'Timed out waiting for a micro-batch'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -414,115 +1065,285 @@ def batch_predict():
     """
     Batch prediction for multiple data points
     Request: {
-        "model": "gbm|lightgbm|xgboost|lstm",
-        "data": [array of sensor readings]
+        "model": "gbm|lightgbm|xgboost|lstm|cascade",
+        "data": [array of sensor readings],
+        "stream": true|false,
+        "chunk_rows": 1024,
+        "threshold": 0.9,
+        "format": "records|matrix",
+        "top_k": 2
     }
+    For "cascade" every result carries the deciding "stage" (in "matrix"
+    layouts an index into cascade.stages).
+    "format": "matrix" returns prediction indices and a probability matrix
+    against "fault_types" (sent once) instead of one dict per reading, and
+    "top_k" keeps only the k most probable classes. Accept:
+    application/x-msgpack returns MessagePack, and Accept-Encoding: gzip
+    compresses the response.
+    With "stream" (or Accept: application/x-ndjson) readings are processed
+    chunk_rows at a time and results are sent as newline-delimited JSON after
+    a header line carrying the job id, one record per line ("matrix": one
+    line per chunk); DELETE /batch_predict/<job_id> cancels.
+    data may instead be sent as an Arrow IPC table, or as a row-major raw
+    float32 / .npy matrix whose columns are given by ?columns=a,b,...
+    (default: INPUT_FEATURES), with model in the query string. Accept:
+    application/x-npz or application/vnd.apache.arrow.stream returns the
+    prediction indices plus one probability array per fault type (with
+    top_k, class_i / probability_i arrays); "format": "records" is rejected.
     """
+    timer = metrics.timer('batch_predict')
     try:
-        data = request.get_json()
+        with timer.stage('parse'):
+            if is_binary_request(request):
+                data = request.args.to_dict()
+                input_data = read_binary_readings(request)
+            else:
+                data = request.get_json()
+                input_data = data.get('data', [])
         
         model_name = data.get('model', 'random_forest').lower()
-        input_data = data.get('data', [])
+        timer.model = model_name
         
         if not model_name:
             model_name = list(models.keys())[0] if models else 'gbm'
             
-        if model_name not in models:
+        if not model_available(model_name):
             return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
+        try:
+            threshold = cascade_threshold(data)
+            response_format, top_k = response_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not input_data:
+        if len(input_data) == 0:
             return jsonify({'error': 'No data provided'}), 400
         
+        mimetype = response_mimetype(request, RESPONSE_MIMES + [MSGPACK_MIME])
+        columnar = mimetype not in (JSON_MIME, MSGPACK_MIME)
+        if columnar and str(data.get('format') or '').lower() == 'records':
+            return jsonify({'error': 'npz / Arrow responses are column-shaped; '
+                                     'use format "matrix" or a JSON response'}), 400
+        
+        if wants_stream(request, data):
+            chunk_rows = int(data.get('chunk_rows', STREAM_CHUNK_ROWS))
+            if chunk_rows < 1:
+                return jsonify({'error': 'chunk_rows must be positive'}), 400
+            header = {'model': model_name, 'count': len(input_data), 'fault_types': FAULT_TYPES,
+                      'format': response_format}
+            if top_k is not None:
+                header['top_k'] = top_k
+            header.update(cascade_header(model_name, threshold))
+            return ndjson_response(stream_jobs,
+                                   stream_predictions(model_name, input_data, chunk_rows,
+                                                      response_format, top_k, threshold),
+                                   header=header)
+        
         # Feature engineering
-        df = feature_engineering(input_data)
-        X = df[FEATURES].values
+        with timer.stage('feature_engineering'):
+            X = feature_matrix(input_data)
+        timer.batch_size(len(X))
         
         # Predict
-        model = models[model_name]
+        decided_by = stages = None
+        if model_name == 'cascade':
+            with timer.stage('forward'):
+                predictions, probabilities, decided_by, stages = predict_cascade(X, threshold)
+        else:
+            predictions, probabilities = predict_batch(model_name, X, timer)
         
-        if model_name in ['gbm', 'lightgbm']:
-            # Scikit-learn style models
-            prediction_indices = model.predict(X)
-            raw_probs = model.predict_proba(X)
-            
-            # Get class mapping from model
-            if hasattr(model, 'classes_') and label_encoder is not None:
-                try:
-                    model_classes = model.classes_
-                    # Try to map model classes to fault type names
-                    class_names = []
-                    for cls in model_classes:
-                        if isinstance(cls, (int, np.integer)):
-                            class_names.append(label_encoder.inverse_transform([int(cls)])[0])
-                        else:
-                            class_names.append(str(cls))
-                    
-                    # Build aligned probability matrix
-                    probabilities = np.zeros((raw_probs.shape[0], len(FAULT_TYPES)))
-                    name_to_idx = {name: i for i, name in enumerate(FAULT_TYPES)}
-                    for col_idx, name in enumerate(class_names):
-                        if name in name_to_idx:
-                            probabilities[:, name_to_idx[name]] = raw_probs[:, col_idx]
-                    
-                    # Convert predictions to indices
-                    predictions = []
-                    for pred_idx in prediction_indices:
-                        if isinstance(pred_idx, (int, np.integer)):
-                            predictions.append(int(pred_idx))
-                        else:
-                            pred_name = str(pred_idx)
-                            predictions.append(name_to_idx.get(pred_name, 0))
-                    predictions = np.array(predictions)
-                except Exception as e:
-                    print(f"Warning: Batch label mapping failed: {e}")
-                    probabilities = raw_probs
-                    predictions = np.array([int(p) if isinstance(p, (int, np.integer)) else 0 for p in prediction_indices])
-            else:
-                probabilities = raw_probs
-                predictions = np.array([int(p) if isinstance(p, (int, np.integer)) else 0 for p in prediction_indices])
-            
-        elif model_name == 'xgboost':
-            dmatrix = xgb.DMatrix(X, feature_names=FEATURES)
-            probs = model.predict(dmatrix)
-            predictions = np.argmax(probs, axis=1)
-            probabilities = probs
-            
-        elif model_name == 'lstm':
-            # Scale features
-            if lstm_scaler:
-                X_scaled = lstm_scaler.transform(X)
-            else:
-                X_scaled = scaler.fit_transform(X)
+        with timer.stage('serialize'):
+            if columnar:
+                columns = columnar_results(predictions, probabilities, top_k)
+                meta = {
+                    'model': model_name,
+                    'count': len(predictions),
+                    'fault_types': FAULT_TYPES
+                }
+                if top_k is not None:
+                    meta['top_k'] = top_k
+                if stages is not None:
+                    columns['stage'] = decided_by
+                    meta['stages'] = stages
+                return columnar_response(columns, mimetype, meta=meta)
             
-            # Shape: (batch_size, seq_len=1, features)
-            X_tensor = torch.FloatTensor(X_scaled).unsqueeze(1).to(device)
-            with torch.no_grad():
-                outputs = model(X_tensor)
-                probs = torch.softmax(outputs, dim=1).cpu().numpy()
-            predictions = np.argmax(probs, axis=1)
-            probabilities = probs
+            response = {
+                'model': model_name,
+                'count': len(predictions)
+            }
+            if response_format == 'matrix':
+                response.update(format='matrix', fault_types=FAULT_TYPES)
+            if top_k is not None:
+                response['top_k'] = top_k
+            response.update(format_results(predictions, probabilities, response_format, top_k))
+            if stages is not None:
+                if response_format == 'matrix':
+                    response['stage'] = np.asarray(decided_by)
+                else:
+                    for result, stage in zip(response['predictions'], decided_by):
+                        result['stage'] = stages[stage]
+                response['cascade'] = {
+                    'stages': stages,
+                    'threshold': threshold or cascade.threshold,
+                    'decided': {stage: int(n) for stage, n in
+                                zip(stages, np.bincount(decided_by, minlength=len(stages)))}
+                }
+            return document_response(response, mimetype, compress=accepts_gzip(request))
         
-        # Format results
+    except WireFormatError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch_predict/upload', methods=['POST'])
+def batch_predict_upload():
+    """
+    Score a CSV or Parquet file of readings in chunks, streamed back as NDJSON
+
+    The file is a multipart 'file' field or the raw body (Content-Type
+    text/csv or application/vnd.apache.parquet) with the INPUT_FEATURES
+    columns. Query string: model, chunk_rows, interval (N readings or a
+    pandas frequency such as 15min for per-interval fault summaries instead
+    of per-row predictions), time_column (passed through; required for
+    frequency intervals) and threshold (cascade). Cascade rows carry their
+    deciding "stage", intervals a "decided" count per stage. Memory is
+    bounded by chunk_rows, not file size.
+    """
+    try:
+        args = request.args
+        model_name = args.get('model', 'gbm').lower()
+        if not model_available(model_name):
+            return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
+        chunk_rows = int(args.get('chunk_rows', STREAM_CHUNK_ROWS))
+        if chunk_rows < 1:
+            return jsonify({'error': 'chunk_rows must be positive'}), 400
+        interval = parse_interval(args.get('interval'))
+        time_column = args.get('time_column')
+        try:
+            threshold = cascade_threshold(args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        upload = request.files.get('file')
+        if upload is not None:
+            source = upload.stream
+            fmt = detect_format(upload.filename, upload.mimetype)
+        else:
+            source = request.stream
+            fmt = detect_format(args.get('filename'), request.mimetype)
+        
+        chunks = primed(bulk_score(source, fmt,
+                                   lambda chunk: score_frame(model_name, chunk, threshold),
+                                   FAULT_TYPES, INPUT_FEATURES, chunk_rows, interval=interval,
+                                   time_column=time_column, optional=FEATURES))
+        # The upload is read while streaming, so keep the request open
+        return ndjson_response(stream_jobs, stream_with_context(chunks), header=dict({
+            'model': model_name,
+            'mode': 'intervals' if interval is not None else 'rows',
+            'interval': interval,
+            'fault_types': FAULT_TYPES
+        }, **cascade_header(model_name, threshold)))
+    
+    except WireFormatError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch_predict/<job_id>', methods=['DELETE'])
+def cancel_batch_predict(job_id):
+    """Cancel a streamed /batch_predict job"""
+    if not stream_jobs.cancel(job_id):
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify({'job_id': job_id, 'cancelled': True})
+
+@app.route('/stream/readings', methods=['POST'])
+def stream_readings():
+    """
+    Stateful fault detection: feed new readings of many inverters
+    
+    Expected JSON:
+    {
+        "model": "lstm",
+        "readings": [{"inverter_id": "INV-0001", "Irradiance": ..., ...}, ...]
+    }
+    Each reading costs one model step from that inverter's carried state.
+    "state" is the debounced fault state (null until one has settled) and
+    "transition" is present on the reading that switched it.
+    Inverter state lives in the serving process: with PV_WORKERS > 0 the
+    readings of one inverter may reach different workers, each with its own
+    LSTM and debounce state. Run a single worker for this endpoint, or route
+    each inverter to a fixed worker in front of the service.
+    """
+    try:
+        data = request.get_json()
+        model_name = data.get('model', 'lstm').lower()
+        if model_name not in models:
+            return jsonify({'error': f'Model {model_name} not available. Available: {list(models.keys())}'}), 400
+        
+        readings = data.get('readings', [])
+        if isinstance(readings, dict):
+            readings = [readings]
+        if len(readings) == 0:
+            return jsonify({'error': 'No readings provided'}), 400
+        if not all(isinstance(reading, dict) for reading in readings):
+            return jsonify({'error': 'Every reading must be an object'}), 400
+        missing_features = [f for f in INPUT_FEATURES if any(f not in reading for reading in readings)]
+        if missing_features:
+            return jsonify({'error': f'Missing features: {missing_features}'}), 400
+        inverter_ids = [reading.get('inverter_id') for reading in readings]
+        if any(inverter_id is None for inverter_id in inverter_ids):
+            return jsonify({'error': 'Every reading needs an inverter_id'}), 400
+        inverter_ids = [str(inverter_id) for inverter_id in inverter_ids]
+        
+        X = feature_matrix(readings)
+        states, advance = get_inverter_stream(model_name)
+        result = states.step(inverter_ids, X, advance)
+        
+        ratio = FEATURES.index('Power_Ratio')
         results = []
-        for i, (pred, prob) in enumerate(zip(predictions, probabilities)):
-            results.append({
-                'index': i,
+        for i, inverter_id in enumerate(inverter_ids):
+            pred = int(result['prediction'][i])
+            record = {
+                'inverter_id': inverter_id,
                 'prediction': FAULT_TYPES[pred],
-                'confidence': float(prob[pred]),
-                'probabilities': {
-                    fault: float(p) for fault, p in zip(FAULT_TYPES, prob)
-                }
-            })
+                'confidence': float(result['probabilities'][i, pred]),
+                'state': fault_name(int(result['state'][i])),
+                'power_ratio_mean': round(float(result['window_mean'][i, ratio]), 4)
+            }
+            if result['transition'][i] is not None:
+                record['transition'] = {'from': fault_name(result['transition'][i]),
+                                        'to': record['state']}
+            results.append(record)
         
         return jsonify({
             'model': model_name,
-            'predictions': results,
+            'results': results,
             'count': len(results)
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/stream/inverters/<inverter_id>', methods=['GET', 'DELETE'])
+def stream_inverter(inverter_id):
+    """Inspect (GET) or reset (DELETE) one inverter's streaming state; ?model=lstm"""
+    model_name = request.args.get('model', 'lstm').lower()
+    entry = inverter_streams.get(model_name)
+    states = entry[1] if entry is not None else None
+    if request.method == 'DELETE':
+        if states is None or not states.reset(inverter_id):
+            return jsonify({'error': f'Unknown inverter {inverter_id}'}), 404
+        return jsonify({'inverter_id': inverter_id, 'reset': True})
+    
+    snapshot = states.snapshot(inverter_id) if states is not None else None
+    if snapshot is None:
+        return jsonify({'error': f'Unknown inverter {inverter_id}'}), 404
+    snapshot['state'] = fault_name(snapshot['state'])
+    snapshot['candidate'] = fault_name(snapshot['candidate'])
+    snapshot['window_mean'] = dict(zip(FEATURES, snapshot['window_mean']))
+    return jsonify(dict(snapshot, inverter_id=inverter_id, model=model_name))
+
 @app.route('/models', methods=['GET'])
 def get_models():
     """Get available models and their info"""
@@ -540,7 +1361,7 @@ def calculate_theoretical():
         irradiance = data.get('irradiance', 1000)
         temperature = data.get('temperature', 25)
         
-        power_theo = calculate_theoretical_power(irradiance, temperature)
+        power_theo = theoretical_power([irradiance], [temperature])[0]
         
         return jsonify({
             'irradiance': irradiance,
@@ -558,5 +1379,13 @@ if __name__ == '__main__':
     print("PV Fault Detection API Server")
     print("="*50)
     load_models()
-    print("\nStarting Flask server...")
-    app.run(host='0.0.0.0', port=5002, debug=True)
+    if POWER_THEO['lookup']:
+        get_power_theo_table()
+    if SERVING['workers'] > 0:
+        print(f"\nStarting {SERVING['workers']} workers...")
+        serve(app, '0.0.0.0', 5002, SERVING['workers'], prepare=prepare_for_fork,
+              cleanup=stream_jobs.close, max_requests=SERVING['max_requests'],
+              max_requests_jitter=SERVING['max_requests_jitter'])
+    else:
+        print("\nStarting Flask server...")
+        app.run(host='0.0.0.0', port=5002, debug=True)
@@ -0,0 +1,286 @@
+"""
+Benchmark suite for the PV fault detection API
+
+Runs the Flask app in-process (default) or against a running server (--url),
+sweeping model, concurrency and rows per /batch_predict request, and
+microbenchmarks calculate_theoretical_power(_batch), feature_engineering, the
+pandas-free fast_features path and each
+model's batch prediction, and compares the tree models' library runtimes with
+the compiled tree backend at 1, 64 and 10k rows. The model cascade is
+benchmarked as model 'cascade' whenever one of its stages is available.
+/batch_predict response layouts and encodings (records / matrix / top-k,
+JSON / MessagePack, gzip) are compared by encode time and body size. Results are written as JSON;
+pass --compare with an earlier file to flag regressions.
+
+Usage:
+    python benchmark.py --synthetic-models --output bench_pv.json
+    python benchmark.py --url http://localhost:5002 --concurrency 1 8 32
+    python benchmark.py --synthetic-models --compare bench_pv.json
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Shared serving modules live in Dashboard/common (also when run as a script)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as pv
+from common.load_test import (HttpClient, InProcessClient, compare_results, microbench,
+                              print_result, run_load, write_results)
+
+
+def make_readings(rng, n):
+    """Random but physically plausible raw sensor readings"""
+    irradiance = rng.uniform(0, 1200, n)
+    voltage = rng.uniform(0, 700, n)
+    current = rng.uniform(0, 35, n)
+    return [{
+        'Irradiance': float(irradiance[i]),
+        'Temperature': float(rng.uniform(0, 60)),
+        'Current(A)': float(current[i]),
+        'Power(W)': float(current[i] * voltage[i]),
+        'Voltage(V)': float(voltage[i]),
+        'LoadCurrent(A)': float(current[i] * 0.95),
+        'LoadPower(W)': float(current[i] * voltage[i] * 0.93),
+        'LoadVoltage(V)': float(voltage[i] * 0.98)
+    } for i in range(n)]
+
+
+def setup_models(synthetic, rng):
+    """Register the saved models, or small ones fitted on random labels"""
+    if not synthetic:
+        pv.load_models()
+        return list(pv.models.keys())
+
+    X = pv.feature_engineering(make_readings(rng, 500))[pv.FEATURES].values
+    y = rng.integers(0, len(pv.FAULT_TYPES), len(X))
+    try:
+        from sklearn.ensemble import GradientBoostingClassifier
+        pv.models['gbm'] = GradientBoostingClassifier(n_estimators=100).fit(X, y)
+    except ImportError:
+        print('! scikit-learn not installed, skipping gbm')
+    try:
+        import lightgbm as lgb
+        pv.models['lightgbm'] = lgb.LGBMClassifier(n_estimators=100, verbose=-1).fit(X, y)
+    except ImportError:
+        print('! lightgbm not installed, skipping lightgbm')
+    try:
+        import xgboost as xgb
+        dtrain = xgb.DMatrix(X, label=y, feature_names=pv.FEATURES)
+        pv.models['xgboost'] = xgb.train({'objective': 'multi:softprob',
+                                          'num_class': len(pv.FAULT_TYPES)}, dtrain, 100)
+    except ImportError:
+        print('! xgboost not installed, skipping xgboost')
+    import torch
+    from sklearn.preprocessing import StandardScaler
+    torch.manual_seed(0)
+    pv.models['lstm'] = pv.LSTMModel(len(pv.FEATURES), 128, 64, len(pv.FAULT_TYPES)).to(pv.device).eval()
+    pv.lstm_scaler = StandardScaler().fit(X)
+    return list(pv.models.keys())
+
+
+def bench_predict(client, model_names, concurrencies, requests, rng):
+    results = []
+    # Distinct readings so the result cache never answers
+    payloads = make_readings(rng, 256)
+    for model in model_names:
+        for concurrency in concurrencies:
+            def send(i, model=model):
+                return client.post('/predict', json={'model': model,
+                                                     'data': payloads[i % len(payloads)]})
+            result = run_load(send, concurrency=concurrency, requests=requests)
+            result.update(name=f'predict/{model}/c{concurrency}', endpoint='predict',
+                          model=model)
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def bench_batch_predict(client, model_names, concurrencies, row_counts, requests, rng):
+    results = []
+    for model in model_names:
+        for rows in row_counts:
+            readings = make_readings(rng, rows)
+            for concurrency in concurrencies:
+                def send(i, model=model, readings=readings):
+                    return client.post('/batch_predict', json={'model': model, 'data': readings})
+                result = run_load(send, concurrency=concurrency, requests=requests, warmup=1)
+                result.update(name=f'batch_predict/{model}/r{rows}/c{concurrency}',
+                              endpoint='batch_predict', model=model, rows=rows,
+                              rows_per_s=result['throughput_rps'] * rows)
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def bench_functions(model_names, row_counts, number, rng):
+    """Preprocessing and model calls without HTTP"""
+    results = []
+
+    def record(result, name, **extra):
+        result.update(name=name, **extra)
+        print_result(result)
+        results.append(result)
+
+    record(microbench(lambda: pv.calculate_theoretical_power(800.0, 35.0), number=number),
+           'calculate_theoretical_power')
+
+    for rows in [1] + list(row_counts):
+        readings = make_readings(rng, rows)
+        data = readings[0] if rows == 1 else readings
+        irradiance = np.array([r['Irradiance'] for r in readings])
+        temperature = np.array([r['Temperature'] for r in readings])
+        record(microbench(lambda g=irradiance, t=temperature: pv.calculate_theoretical_power_batch(g, t),
+                          number=max(1, number // rows)),
+               f'calculate_theoretical_power_batch/r{rows}', rows=rows)
+        record(microbench(lambda data=data: pv.feature_engineering(data),
+                          number=max(1, number // rows)),
+               f'feature_engineering/r{rows}', rows=rows)
+        if rows <= pv.FAST_FEATURES_MAX_ROWS:
+            record(microbench(lambda data=data: pv.fast_features(data),
+                              number=max(1, number // rows)),
+                   f'fast_features/r{rows}', rows=rows)
+
+        X = pv.feature_engineering(data)[pv.FEATURES].values
+        for model_name in model_names:
+            record(microbench(lambda model_name=model_name, X=X: pv.predict_batch(model_name, X),
+                              number=max(1, number // rows)),
+                   f'forward/{model_name}/r{rows}', model=model_name, rows=rows)
+    return results
+
+
+def bench_responses(row_counts, number, rng):
+    """Encode time and body size of each /batch_predict response option"""
+    from common.wire_format import JSON_MIME, MSGPACK_AVAILABLE, MSGPACK_MIME, document_response
+
+    variants = [('records', None, JSON_MIME), ('records', 1, JSON_MIME),
+                ('matrix', None, JSON_MIME), ('matrix', 2, JSON_MIME)]
+    if MSGPACK_AVAILABLE:
+        variants += [('matrix', None, MSGPACK_MIME), ('matrix', 2, MSGPACK_MIME)]
+    results = []
+    with pv.app.app_context():
+        for rows in row_counts:
+            probabilities = rng.dirichlet(np.ones(len(pv.FAULT_TYPES)), rows)
+            predictions = probabilities.argmax(axis=1)
+            for response_format, top_k, mimetype in variants:
+                for compress in (False, True):
+                    def encode(response_format=response_format, top_k=top_k, mimetype=mimetype,
+                               compress=compress):
+                        body = pv.format_results(predictions, probabilities, response_format, top_k)
+                        return document_response(dict(body, fault_types=pv.FAULT_TYPES),
+                                                 mimetype, compress=compress)
+                    encoding = mimetype.rsplit('/', 1)[-1].replace('x-', '') + ('+gzip' if compress else '')
+                    result = microbench(encode, number=max(1, number // rows))
+                    result.update(name=f'response/{response_format}/k{top_k or "all"}/{encoding}/r{rows}',
+                                  rows=rows, format=response_format, top_k=top_k,
+                                  encoding=encoding, bytes=len(encode().get_data()))
+                    print_result(result)
+                    results.append(result)
+    return results
+
+
+def library_proba(model_name, model):
+    if model_name == 'xgboost':
+        import xgboost as xgb
+        return lambda X: model.predict(xgb.DMatrix(X, feature_names=pv.FEATURES))
+    return model.predict_proba
+
+
+def bench_tree_backend(model_names, row_counts, number, rng):
+    """Library runtimes vs the compiled TreeEnsemble engines (tree_ensemble.py)"""
+    from tree_ensemble import NUMBA_AVAILABLE, NotCompilable, TreeEnsemble, compile_ensemble
+
+    engines = ['native', 'numpy'] if NUMBA_AVAILABLE else ['numpy']
+    results = []
+    for model_name in model_names:
+        model = pv.models[model_name]
+        if model_name not in ('gbm', 'lightgbm', 'xgboost') or isinstance(model, TreeEnsemble):
+            continue
+        runtimes = {'library': library_proba(model_name, model)}
+        for engine in engines:
+            try:
+                runtimes[engine] = compile_ensemble(model, engine=engine).predict_proba
+            except NotCompilable as e:
+                print(f'! {model_name} not compiled: {e}')
+        for rows in row_counts:
+            X = pv.feature_engineering(make_readings(rng, rows))[pv.FEATURES].values
+            for runtime, predict in runtimes.items():
+                result = microbench(lambda predict=predict, X=X: predict(X),
+                                    number=max(1, number // rows))
+                result.update(name=f'trees/{model_name}/{runtime}/r{rows}', model=model_name,
+                              runtime=runtime, rows=rows)
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PV API load tests and microbenchmarks')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--synthetic-models', action='store_true',
+                        help='fit small models on random data (in-process only)')
+    parser.add_argument('--models', nargs='+', default=None)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--rows', nargs='+', type=int, default=[64, 1024],
+                        help='readings per /batch_predict request')
+    parser.add_argument('--requests', type=int, default=200, help='/predict requests per scenario')
+    parser.add_argument('--batch-requests', type=int, default=10,
+                        help='/batch_predict requests per scenario')
+    parser.add_argument('--calls', type=int, default=200,
+                        help='rows per function microbenchmark repeat')
+    parser.add_argument('--tree-rows', nargs='+', type=int, default=[1, 64, 10000],
+                        help='batch sizes for the tree backend comparison')
+    parser.add_argument('--threads', type=int, help='torch.set_num_threads for in-process runs')
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['predict', 'batch_predict', 'functions', 'trees', 'responses'])
+    parser.add_argument('--output', default='bench_pv.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+
+    if args.url:
+        client = HttpClient(args.url)
+        model_names = args.models or ['gbm', 'lightgbm', 'xgboost', 'lstm']
+    else:
+        pv.result_cache.max_entries = 0
+        available = setup_models(args.synthetic_models, rng)
+        if not available:
+            sys.exit('No models found; pass --synthetic-models or fix MODELS_DIR')
+        if pv.model_available('cascade'):
+            available.append('cascade')
+        model_names = [m for m in (args.models or available) if m in available]
+        client = InProcessClient(pv.app)
+
+    results = []
+    if 'predict' not in args.skip:
+        print('\n/predict')
+        results += bench_predict(client, model_names, args.concurrency, args.requests, rng)
+    if 'batch_predict' not in args.skip:
+        print('\n/batch_predict')
+        results += bench_batch_predict(client, model_names, args.concurrency, args.rows,
+                                       args.batch_requests, rng)
+    if 'functions' not in args.skip and not args.url:
+        print('\nfunctions')
+        results += bench_functions(model_names, args.rows, args.calls, rng)
+    if 'trees' not in args.skip and not args.url:
+        print('\ntree backend')
+        results += bench_tree_backend(model_names, args.tree_rows, args.calls, rng)
+    if 'responses' not in args.skip and not args.url:
+        print('\nresponses')
+        results += bench_responses(args.rows, args.calls, rng)
+
+    write_results(args.output, results, dict(vars(args), models=model_names,
+                                             mode='http' if args.url else 'in-process'))
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
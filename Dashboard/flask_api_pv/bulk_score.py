@@ -0,0 +1,352 @@
+"""
+Bulk PV scoring of CSV / Parquet inverter logs in fixed-size chunks
+
+A file with the INPUT_FEATURES columns (Power_Theo / Power_Ratio are derived
+when absent) is read chunk_rows readings at a time, each chunk goes through
+feature_engineering and the chosen model, and the results are emitted as
+either one record per reading or one fault summary per interval. Only one
+chunk (plus the one open interval) is ever held in memory, whatever the file
+size. Intervals are either a fixed number of readings or, with a time
+column, a pandas frequency such as '15min'; input is assumed to be in order.
+
+Used by the /batch_predict/upload endpoint and as a CLI writing NDJSON, CSV
+or Parquet (by output suffix).
+
+Usage:
+    python bulk_score.py logs/inverter_3.parquet --model gbm --out preds.parquet
+    python bulk_score.py logs/inverter_3.csv --model lightgbm --interval 15min \
+        --time-column Timestamp --out summary.csv
+"""
+
+import argparse
+import contextlib
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+# Shared serving modules live in Dashboard/common (also when run as a script)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.wire_format import WireFormatError
+
+CSV_MIMES = ('text/csv', 'application/csv', 'text/plain')
+PARQUET_MIMES = ('application/vnd.apache.parquet', 'application/x-parquet')
+
+
+def detect_format(filename=None, mimetype=None):
+    """'csv' or 'parquet' from a file name suffix, else from a MIME type"""
+    suffix = Path(str(filename or '')).suffix.lower().lstrip('.')
+    if suffix in ('parquet', 'pq'):
+        return 'parquet'
+    if suffix in ('csv', 'txt'):
+        return 'csv'
+    if mimetype in PARQUET_MIMES:
+        return 'parquet'
+    if mimetype in CSV_MIMES:
+        return 'csv'
+    raise WireFormatError(f'Cannot tell the file format of {filename or mimetype!r}; '
+                          f'send .csv or .parquet', status=415)
+
+
+def _seekable(source):
+    """Parquet needs random access (footer first); spool plain streams to disk"""
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        return source
+    try:
+        if source.seekable():
+            return source
+    except AttributeError:
+        pass
+    spooled = tempfile.TemporaryFile()
+    shutil.copyfileobj(source, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+def iter_chunks(source, fmt, chunk_rows, required, optional=()):
+    """
+    Yield DataFrames of at most chunk_rows readings with the required columns
+    (and any optional ones present) from a CSV / Parquet path or file object
+    """
+    wanted = list(required) + [c for c in optional if c and c not in required]
+
+    if fmt == 'parquet':
+        if not PYARROW_AVAILABLE:
+            raise WireFormatError('Parquet input requires pyarrow', status=415)
+        parquet = pq.ParquetFile(_seekable(source))
+        present = set(parquet.schema_arrow.names)
+        missing = [c for c in required if c not in present]
+        if missing:
+            raise WireFormatError(f'Missing columns: {missing}')
+        columns = [c for c in wanted if c in present]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    reader = pd.read_csv(source, chunksize=chunk_rows, usecols=lambda c: c in wanted)
+    with reader:
+        for i, chunk in enumerate(reader):
+            if i == 0:
+                missing = [c for c in required if c not in chunk.columns]
+                if missing:
+                    raise WireFormatError(f'Missing columns: {missing}')
+            yield chunk
+
+
+def _time_values(chunk, time_column):
+    if time_column and time_column in chunk.columns:
+        return chunk[time_column].astype(str).tolist()
+    return None
+
+
+def iter_row_records(chunks, score, fault_types, time_column=None):
+    """Per-reading /batch_predict records, one list per chunk"""
+    offset = 0
+    for chunk in chunks:
+        predictions, probabilities, decided_by, stages = score(chunk)
+        times = _time_values(chunk, time_column)
+        records = []
+        for i, (pred, prob) in enumerate(zip(predictions, probabilities)):
+            record = {
+                'index': offset + i,
+                'prediction': fault_types[pred],
+                'confidence': float(prob[pred]),
+                'probabilities': {
+                    fault: float(p) for fault, p in zip(fault_types, prob)
+                }
+            }
+            if stages is not None:
+                record['stage'] = stages[decided_by[i]]
+            if times is not None:
+                record[time_column] = times[i]
+            records.append(record)
+        offset += len(chunk)
+        yield records
+
+
+class _Interval:
+
+    def __init__(self, key, label, first_index, n_classes, stages=None):
+        self.key = key
+        self.label = label
+        self.first_index = first_index
+        self.rows = 0
+        self.counts = np.zeros(n_classes, dtype=np.int64)
+        self.probability_sum = np.zeros(n_classes)
+        self.stages = stages
+        self.decided = np.zeros(len(stages), dtype=np.int64) if stages is not None else None
+
+    def add(self, predictions, probabilities, decided_by=None):
+        self.rows += len(predictions)
+        self.counts += np.bincount(predictions, minlength=len(self.counts))
+        self.probability_sum += probabilities.sum(axis=0)
+        if self.decided is not None:
+            self.decided += np.bincount(decided_by, minlength=len(self.decided))
+
+    def record(self, fault_types, healthy):
+        counts = {fault: int(n) for fault, n in zip(fault_types, self.counts)}
+        record = {
+            'interval': self.label,
+            'first_index': self.first_index,
+            'rows': self.rows,
+            'dominant': fault_types[int(self.counts.argmax())],
+            'fault_fraction': round(1 - counts.get(healthy, 0) / self.rows, 6),
+            'counts': counts,
+            'mean_probabilities': {
+                fault: float(p) for fault, p in zip(fault_types, self.probability_sum / self.rows)
+            }
+        }
+        if self.stages is not None:
+            record['decided'] = {stage: int(n) for stage, n in zip(self.stages, self.decided)}
+        return record
+
+
+def iter_interval_summaries(chunks, score, fault_types, interval, time_column=None,
+                            healthy='Healthy'):
+    """
+    Per-interval fault summaries, one list per chunk. interval is a number of
+    readings (int) or a pandas frequency over time_column (str); an interval
+    is emitted once a later one has started, the last one at the end. A
+    cascade's summaries count the readings each stage decided.
+    """
+    by_time = isinstance(interval, str)
+    if by_time and not time_column:
+        raise WireFormatError('A time interval needs a time column')
+    offset = 0
+    current = None
+    for chunk in chunks:
+        predictions, probabilities, decided_by, stages = score(chunk)
+        predictions = np.asarray(predictions, dtype=np.int64)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        n = len(predictions)
+
+        if by_time:
+            if time_column not in chunk.columns:
+                raise WireFormatError(f'Missing time column {time_column!r}')
+            stamps = pd.to_datetime(chunk[time_column]).dt.floor(interval)
+            keys = stamps.to_numpy().astype('datetime64[ns]').view(np.int64)
+        else:
+            keys = (np.arange(offset, offset + n) // interval) * interval
+
+        # Runs of equal keys; input order is kept, so a key may only recur
+        # for unsorted input (it is then reported again)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if n else np.empty(0, int)
+        bounds = np.r_[starts, n]
+        finished = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            key = int(keys[start])
+            if current is None or current.key != key:
+                if current is not None:
+                    finished.append(current.record(fault_types, healthy))
+                label = stamps.iloc[start].isoformat() if by_time else key
+                current = _Interval(key, label, offset + int(start), len(fault_types), stages)
+            current.add(predictions[start:stop], probabilities[start:stop],
+                        None if decided_by is None else decided_by[start:stop])
+        offset += n
+        yield finished
+
+    if current is not None:
+        yield [current.record(fault_types, healthy)]
+
+
+def parse_interval(value):
+    """'900' -> 900 readings, '15min' -> a time frequency, None/'' -> None"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, int) or str(value).isdigit():
+        interval = int(value)
+        if interval < 1:
+            raise WireFormatError('interval must be positive')
+        return interval
+    try:
+        pd.tseries.frequencies.to_offset(value)
+    except ValueError:
+        raise WireFormatError(f'Invalid interval {value!r}')
+    return str(value)
+
+
+def bulk_score(source, fmt, score, fault_types, required, chunk_rows, interval=None,
+               time_column=None, optional=()):
+    """
+    Lists of row records (interval=None) or interval summaries, chunk by
+    chunk. score(chunk) returns (predictions, probabilities, decided_by,
+    stages), the last two None unless it is a model cascade.
+    """
+    chunks = iter_chunks(source, fmt, chunk_rows, required,
+                         optional=tuple(optional) + (time_column,))
+    if interval is None:
+        return iter_row_records(chunks, score, fault_types, time_column)
+    return iter_interval_summaries(chunks, score, fault_types, interval, time_column)
+
+
+def primed(records):
+    """
+    Compute the first chunk now, so bad input (missing columns, unreadable
+    file) fails before a streamed response has started
+    """
+    first = next(records, None)
+
+    def chained():
+        if first is not None:
+            yield first
+        yield from records
+    return chained()
+
+
+class _Writer:
+    """Append record lists to NDJSON (default), .csv or .parquet output"""
+
+    def __init__(self, path):
+        self.path = path
+        self.suffix = Path(path).suffix.lower().lstrip('.') if path else 'ndjson'
+        if self.suffix == 'parquet' and not PYARROW_AVAILABLE:
+            raise RuntimeError('pyarrow is required to write Parquet output')
+        self.file = None
+        self.parquet = None
+        self.header = True
+
+    def write(self, records):
+        if not records:
+            return
+        if self.suffix == 'csv':
+            frame = pd.json_normalize(records)
+            frame.to_csv(self.path, mode='w' if self.header else 'a',
+                         header=self.header, index=False)
+            self.header = False
+        elif self.suffix == 'parquet':
+            table = pa.Table.from_pandas(pd.json_normalize(records), preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table.cast(self.parquet.schema))
+        else:
+            if self.file is None:
+                self.file = open(self.path, 'w') if self.path else sys.stdout
+            self.file.write(''.join(json.dumps(record) + '\n' for record in records))
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+        if self.file is not None and self.file is not sys.stdout:
+            self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunked bulk PV fault scoring of CSV / Parquet logs')
+    parser.add_argument('input', help='CSV or Parquet file with the sensor columns')
+    parser.add_argument('--model', default='gbm', help="a loaded model or 'cascade'")
+    parser.add_argument('--out', help='.ndjson / .csv / .parquet output (default: NDJSON on stdout)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], help='input format (default: by suffix)')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='readings per chunk')
+    parser.add_argument('--interval',
+                        help='summarize per N readings or per pandas frequency (e.g. 15min)')
+    parser.add_argument('--time-column', help='column passed through / used for time intervals')
+    parser.add_argument('--threshold', type=float, help='cascade confidence threshold')
+    args = parser.parse_args()
+
+    # The app logs while loading; keep stdout for the NDJSON output
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as pv
+        pv.load_models()
+
+    chunk_rows = args.chunk_rows or pv.STREAM_CHUNK_ROWS
+    if not pv.model_available(args.model):
+        parser.error(f'model {args.model} not available: {list(pv.models.keys())}')
+    try:
+        threshold = pv.cascade_threshold({'threshold': args.threshold})
+    except ValueError as e:
+        parser.error(str(e))
+
+    def score(chunk):
+        return pv.score_frame(args.model, chunk, threshold)
+
+    fmt = args.format or detect_format(args.input)
+    writer = _Writer(args.out)
+    start = time.perf_counter()
+    rows = 0
+    try:
+        for records in bulk_score(args.input, fmt, score, pv.FAULT_TYPES, pv.INPUT_FEATURES,
+                                  chunk_rows, interval=parse_interval(args.interval),
+                                  time_column=args.time_column, optional=pv.FEATURES):
+            writer.write(records)
+            rows += len(records)
+    finally:
+        writer.close()
+    print(f"✓ {rows} {'summaries' if args.interval else 'predictions'} in "
+          f"{time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
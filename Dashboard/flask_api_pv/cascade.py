@@ -0,0 +1,92 @@
+"""
+Confidence-gated model cascade
+
+Readings go through the configured stages cheapest first. A stage decides
+every reading whose top-class probability reaches the threshold; only the
+remaining ones are passed on, and the last stage decides whatever is left.
+Clear-cut readings (most of them Healthy) thus only pay for the first stage,
+while ambiguous ones get the same answer as the most expensive model.
+
+Per-stage counters (readings evaluated / decided, seconds spent) give the
+escalation rate and the average cost per reading.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class Cascade:
+
+    def __init__(self, stages, threshold=0.9):
+        self.stages = list(stages)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.readings = 0
+        self.escalated = 0
+        self._counters = {stage: {'evaluated': 0, 'decided': 0, 'seconds': 0.0}
+                          for stage in self.stages}
+
+    def active_stages(self, available):
+        """The configured stages that are available, in cascade order"""
+        return [stage for stage in self.stages if stage in available]
+
+    def run(self, X, predict, available, threshold=None):
+        """
+        predict(stage, X) -> probabilities. Returns (predictions,
+        probabilities, decided_by) with decided_by the index into the
+        returned list of stages that were active.
+        """
+        stages = self.active_stages(available)
+        if not stages:
+            raise ValueError(f'No cascade stage available (configured: {self.stages})')
+        threshold = self.threshold if threshold is None else threshold
+
+        n = len(X)
+        probabilities = None
+        decided_by = np.zeros(n, dtype=np.int64)
+        pending = np.arange(n)
+        counts = []
+        for i, stage in enumerate(stages):
+            start = time.perf_counter()
+            probs = np.asarray(predict(stage, X[pending]))
+            seconds = time.perf_counter() - start
+            if probabilities is None:
+                probabilities = np.zeros((n, probs.shape[1]), dtype=probs.dtype)
+
+            last = i == len(stages) - 1
+            confident = np.ones(len(pending), dtype=bool) if last else probs.max(axis=1) >= threshold
+            decided = pending[confident]
+            probabilities[decided] = probs[confident]
+            decided_by[decided] = i
+            counts.append((stage, len(pending), len(decided), seconds))
+            pending = pending[~confident]
+            if len(pending) == 0:
+                break
+
+        with self._lock:
+            self.readings += n
+            self.escalated += n - counts[0][2]
+            for stage, evaluated, decided, seconds in counts:
+                counter = self._counters[stage]
+                counter['evaluated'] += evaluated
+                counter['decided'] += decided
+                counter['seconds'] += seconds
+
+        return probabilities.argmax(axis=1), probabilities, decided_by, stages
+
+    def stats(self):
+        with self._lock:
+            readings = self.readings
+            escalated = self.escalated
+            stages = {stage: dict(counter) for stage, counter in self._counters.items()}
+        seconds = sum(counter['seconds'] for counter in stages.values())
+        return {
+            'stages': self.stages,
+            'threshold': self.threshold,
+            'readings': readings,
+            'escalation_rate': escalated / readings if readings else None,
+            'mean_cost_us': seconds / readings * 1e6 if readings else None,
+            'per_stage': stages
+        }
@@ -0,0 +1,3 @@
+# test_api.py is a smoke script against a running server (python test_api.py),
+# not part of the pytest suite
+collect_ignore = ['test_api.py']
@@ -0,0 +1,436 @@
+"""
+Synthetic PV fleet with fault injection, replayed against the service
+
+FleetSimulator produces one reading per inverter per time step from the
+PV_PARAMS single-diode model the service uses for Power_Theo. Irradiance
+follows a clear-sky day curve attenuated by per-site clouds, and module
+temperature follows irradiance. A healthy inverter delivers the model's
+maximum power point (times its own efficiency) at a voltage near Vmp.
+
+Faults from FAULT_TYPES are injected as episodes with a per-step onset
+rate and a mean duration (daylight only), each with its own signature:
+
+    No production       inverter tripped: no voltage, current or power
+    Open Circuit        string at Voc, no current
+    Short Circuit       voltage collapses, current near Isc
+    Partial Shadowing   30-70% of the expected power at a lower voltage
+
+Readings taken in the dark are labelled No production as well.
+
+replay() sends the stream to /predict, /batch_predict or /stream/readings
+at a target rate of readings per second. It reports throughput, request
+latency and per-class recall. For every injected episode it also reports
+the detection latency: readings and seconds from fault onset until the
+service first reports that fault (the debounced state on the streaming
+path). Each inverter's readings stay on one client thread, so they arrive
+in order.
+
+Usage:
+    python fleet_sim.py --synthetic-models --inverters 2000 --steps 24 --rate 2000 --mode stream
+    python fleet_sim.py --url http://localhost:5002 --inverters 10000 --rate 5000 --mode batch \
+        --fault-rate "Short Circuit=0.01" --fault-rate "Open Circuit=0.005"
+"""
+
+import argparse
+import math
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Shared serving modules live in Dashboard/common (also when run as a script)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as pv
+from common.load_test import HttpClient, InProcessClient, latency_summary, write_results
+
+HEALTHY = 'Healthy'
+NO_PRODUCTION = 'No production'
+
+# Onset probability per inverter and step
+DEFAULT_FAULT_RATES = {
+    'No production': 0.001,
+    'Open Circuit': 0.002,
+    'Partial Shadowing': 0.005,
+    'Short Circuit': 0.002
+}
+
+# Irradiance (W/m2) below which an inverter produces nothing
+DARK_IRRADIANCE = 20.0
+
+
+class FleetSimulator:
+
+    def __init__(self, n_inverters, fault_rates=None, fault_duration=12, step_minutes=5.0,
+                 start_hour=6.0, sites=10, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.n = n_inverters
+        self.fault_types = list(pv.FAULT_TYPES)
+        rates = DEFAULT_FAULT_RATES if fault_rates is None else fault_rates
+        unknown = [name for name in rates if name not in self.fault_types or name == HEALTHY]
+        if unknown:
+            raise ValueError(f'Unknown fault types {unknown}; choose from {self.fault_types[1:]}')
+        self.fault_rates = np.array([rates.get(name, 0.0) if name != HEALTHY else 0.0
+                                     for name in self.fault_types])
+        self.fault_duration = fault_duration
+        self.step_hours = step_minutes / 60.0
+        self.hour = start_hour
+        self.step_index = 0
+
+        self.inverter_ids = [f'INV-{i:05d}' for i in range(n_inverters)]
+        self.site = self.rng.integers(0, sites, n_inverters)
+        self.site_temperature = self.rng.normal(0, 3, sites)
+        self.cloud = np.zeros(sites)
+        self.efficiency = self.rng.uniform(0.93, 1.0, n_inverters)
+        self.fault = np.full(n_inverters, -1)      # index into fault_types, -1 healthy
+        self.fault_left = np.zeros(n_inverters, dtype=np.int64)
+        self.onset = np.full(n_inverters, -1)      # step the current episode began
+        self.episodes = {name: 0 for name in self.fault_types}
+
+    def _weather(self):
+        hour = self.hour % 24
+        clear = 1000.0 * max(0.0, math.sin(math.pi * (hour - 6) / 12)) ** 1.2
+        # Slowly drifting cloud cover per site, in [0, 1]
+        self.cloud = 0.85 * self.cloud + 0.15 * self.rng.random(len(self.cloud))
+        attenuation = 1 - 0.7 * self.cloud ** 2
+        irradiance = np.maximum(clear * attenuation[self.site] * self.rng.normal(1, 0.02, self.n), 0)
+        ambient = 15 + 8 * math.sin(math.pi * (hour - 9) / 12) + self.site_temperature[self.site]
+        temperature = ambient + 0.03 * irradiance + self.rng.normal(0, 0.5, self.n)
+        return irradiance, temperature
+
+    def _inject(self, dark):
+        self.fault_left -= 1
+        ended = (self.fault >= 0) & (self.fault_left <= 0)
+        self.fault[ended] = -1
+        self.onset[ended] = -1
+
+        cumulative = np.cumsum(self.fault_rates)
+        draw = self.rng.random(self.n)
+        new = (self.fault < 0) & ~dark & (draw < cumulative[-1])
+        kinds = np.searchsorted(cumulative, draw[new], side='right')
+        self.fault[new] = kinds
+        self.fault_left[new] = self.rng.geometric(1.0 / self.fault_duration, len(kinds))
+        self.onset[new] = self.step_index
+        for kind in kinds:
+            self.episodes[self.fault_types[kind]] += 1
+
+    def step(self):
+        """
+        One reading per inverter: dict with 'readings' (service input dicts
+        with inverter_id), 'labels' (FAULT_TYPES indices), 'onset' (step of
+        the injected episode or -1) and 'step'
+        """
+        n = self.n
+        rng = self.rng
+        irradiance, temperature = self._weather()
+        dark = irradiance < DARK_IRRADIANCE
+        self._inject(dark)
+
+        _Vt, photo_current, _saturation, voc_array = pv._iv_curve_params(irradiance, temperature)
+        string_isc = photo_current / pv.PV_PARAMS['n_p']
+        vmp = voc_array * pv.PV_PARAMS['Vmp_ref'] / pv.PV_PARAMS['Voc_ref']
+
+        # Healthy: the model's MPP (per string, like Power_Theo) at ~Vmp
+        voltage = vmp * rng.normal(1, 0.01, n)
+        power = pv.calculate_theoretical_power_batch(irradiance, temperature) * \
+            self.efficiency * rng.normal(1, 0.01, n)
+        voltage[dark] = 0
+        power[dark] = 0
+
+        kind = np.where(self.fault >= 0, self.fault, 0)
+        is_fault = {name: (self.fault >= 0) & (kind == i) for i, name in enumerate(self.fault_types)}
+        shadow = is_fault['Partial Shadowing']
+        power[shadow] *= rng.uniform(0.3, 0.7, shadow.sum())
+        voltage[shadow] *= rng.uniform(0.8, 0.95, shadow.sum())
+
+        current = np.divide(power, voltage, out=np.zeros(n), where=voltage > 0)
+        short = is_fault['Short Circuit']
+        voltage[short] *= rng.uniform(0.05, 0.2, short.sum())
+        current[short] = string_isc[short] * rng.uniform(1.0, 1.1, short.sum())
+        opened = is_fault['Open Circuit']
+        voltage[opened] = voc_array[opened] * rng.normal(1, 0.01, opened.sum())
+        current[opened] = 0
+        tripped = is_fault[NO_PRODUCTION]
+        voltage[tripped] = 0
+        current[tripped] = 0
+        power = voltage * current
+
+        load_voltage = voltage * rng.uniform(0.97, 0.99, n)
+        load_current = current * rng.uniform(0.95, 0.98, n)
+
+        labels = np.where(self.fault >= 0, self.fault,
+                          np.where(dark, self.fault_types.index(NO_PRODUCTION),
+                                   self.fault_types.index(HEALTHY)))
+        columns = {
+            'Irradiance': irradiance, 'Temperature': temperature, 'Current(A)': current,
+            'Power(W)': power, 'Voltage(V)': voltage, 'LoadCurrent(A)': load_current,
+            'LoadPower(W)': load_voltage * load_current, 'LoadVoltage(V)': load_voltage
+        }
+        values = np.column_stack([columns[name] for name in pv.INPUT_FEATURES]).tolist()
+        readings = [dict(zip(pv.INPUT_FEATURES, row), inverter_id=inverter_id)
+                    for inverter_id, row in zip(self.inverter_ids, values)]
+
+        result = {'readings': readings, 'labels': labels, 'onset': self.onset.copy(),
+                  'step': self.step_index}
+        self.step_index += 1
+        self.hour += self.step_hours
+        return result
+
+    def training_set(self, steps):
+        """(X, y) feature matrix and labels over `steps` steps, for fitting models"""
+        X, y = [], []
+        for _ in range(steps):
+            batch = self.step()
+            X.append(pv.feature_engineering(batch['readings'])[pv.FEATURES].values)
+            y.append(batch['labels'])
+        return np.vstack(X), np.concatenate(y)
+
+
+class DetectionTracker:
+    """Per-class recall and per-episode detection latency from service answers"""
+
+    def __init__(self, fault_types):
+        self.fault_types = fault_types
+        self.healthy = fault_types.index(HEALTHY)
+        self._lock = threading.Lock()
+        self.confusion = np.zeros((len(fault_types), len(fault_types)), dtype=np.int64)
+        self._episodes = {}   # (inverter, onset step) -> [fault, onset sent at, detection]
+
+    def record(self, inverters, steps, labels, onsets, reported, sent_at, answered_at):
+        with self._lock:
+            for inverter, step, label, onset, answer in zip(inverters, steps, labels, onsets, reported):
+                if answer is not None:
+                    self.confusion[label, answer] += 1
+                if onset < 0:
+                    continue
+                episode = self._episodes.get((inverter, onset))
+                if episode is None:
+                    episode = self._episodes[(inverter, onset)] = [label, sent_at, None]
+                if episode[2] is None and answer == label:
+                    episode[2] = (step - onset + 1, answered_at - episode[1])
+
+    def summary(self):
+        with self._lock:
+            confusion = self.confusion.copy()
+            episodes = list(self._episodes.values())
+        totals = confusion.sum(axis=1)
+        result = {
+            'accuracy': float(np.trace(confusion) / confusion.sum()) if confusion.sum() else None,
+            'recall': {name: float(confusion[i, i] / totals[i]) if totals[i] else None
+                       for i, name in enumerate(self.fault_types)},
+            'detection': {}
+        }
+        for i, name in enumerate(self.fault_types):
+            if i == self.healthy:
+                continue
+            found = [episode[2] for episode in episodes if episode[0] == i and episode[2] is not None]
+            total = sum(1 for episode in episodes if episode[0] == i)
+            readings = np.array([f[0] for f in found], dtype=np.float64)
+            result['detection'][name] = {
+                'episodes': total,
+                'detected': len(found),
+                'readings_mean': float(readings.mean()) if found else None,
+                'readings_p50': float(np.median(readings)) if found else None,
+                'seconds': latency_summary([f[1] for f in found])
+            }
+        return result
+
+
+def _answers(mode, body, n):
+    """(reported class indices, or None per row) from a response body"""
+    if body is None:
+        return [None] * n
+    index = {name: i for i, name in enumerate(pv.FAULT_TYPES)}
+    if mode == 'predict':
+        return [index.get(body.get('prediction'))]
+    if mode == 'batch':
+        return [index.get(row['prediction']) for row in body.get('predictions', [])]
+    return [index.get(row['state']) if row['state'] is not None else None
+            for row in body.get('results', [])]
+
+
+def _request(mode, model, readings, threshold=None):
+    if mode == 'predict':
+        reading = dict(readings[0])
+        reading.pop('inverter_id')
+        payload = {'model': model, 'data': reading}
+        path = '/predict'
+    elif mode == 'batch':
+        payload = {'model': model, 'data': readings}
+        path = '/batch_predict'
+    else:
+        payload = {'model': model, 'readings': readings}
+        path = '/stream/readings'
+    if threshold is not None and mode != 'stream':
+        payload['threshold'] = threshold
+    return path, payload
+
+
+def replay(client, sim, steps, rate, mode='batch', model='gbm', batch_size=200,
+           concurrency=4, threshold=None):
+    """
+    Send `steps` fleet steps at `rate` readings/s (None: as fast as possible)
+    and return throughput, request latency and detection results
+    """
+    if mode == 'predict':
+        batch_size = 1
+    tracker = DetectionTracker(pv.FAULT_TYPES)
+    queues = [queue.Queue(maxsize=64) for _ in range(concurrency)]
+    latencies = [[] for _ in range(concurrency)]
+    lags = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+    start = time.perf_counter()
+
+    def worker(w):
+        while True:
+            job = queues[w].get()
+            if job is None:
+                return
+            due, step, rows, readings, labels, onsets = job
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            sent_at = time.perf_counter()
+            lags[w].append(max(0.0, sent_at - due))
+            path, payload = _request(mode, model, readings, threshold)
+            try:
+                status, body = client.post_json(path, json=payload)
+            except Exception:
+                status, body = 'exception', None
+            answered_at = time.perf_counter()
+            latencies[w].append(answered_at - sent_at)
+            statuses[w][status] = statuses[w].get(status, 0) + 1
+            tracker.record(rows, [step] * len(rows), labels, onsets,
+                           _answers(mode, body if status == 200 else None, len(rows)),
+                           sent_at, answered_at)
+
+    threads = [threading.Thread(target=worker, args=(w,), daemon=True) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    sent = 0
+    for _ in range(steps):
+        batch = sim.step()
+        for k, first in enumerate(range(0, sim.n, batch_size)):
+            rows = list(range(first, min(first + batch_size, sim.n)))
+            due = start + sent / rate if rate else 0.0
+            # A given inverter always goes to the same worker, so its readings stay in order
+            queues[k % concurrency].put((due, batch['step'], rows, batch['readings'][first:first + batch_size],
+                                         batch['labels'][rows], batch['onset'][rows]))
+            sent += len(rows)
+    for q in queues:
+        q.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    status_counts = {}
+    for counts in statuses:
+        for status, n in counts.items():
+            status_counts[str(status)] = status_counts.get(str(status), 0) + n
+    return dict(
+        latency_summary([t for per_worker in latencies for t in per_worker]),
+        name=f'fleet/{mode}/{model}/n{sim.n}',
+        mode=mode, model=model, inverters=sim.n, steps=steps, readings=sent,
+        target_rate=rate, achieved_rate=sent / elapsed if elapsed > 0 else None,
+        elapsed_s=elapsed, batch_size=batch_size, concurrency=concurrency,
+        schedule_lag=latency_summary([t for per_worker in lags for t in per_worker]),
+        errors=sum(n for status, n in status_counts.items() if status != '200'),
+        status_counts=status_counts,
+        episodes=dict(sim.episodes),
+        **tracker.summary())
+
+
+def fit_models(fault_rates, steps, inverters, seed):
+    """Fit gbm / lightgbm on simulated fleet readings (in-process runs)"""
+    sim = FleetSimulator(inverters, fault_rates=fault_rates, seed=seed, step_minutes=37)
+    X, y = sim.training_set(steps)
+    print(f"Training on {len(y)} simulated readings: "
+          f"{dict(zip(pv.FAULT_TYPES, np.bincount(y, minlength=len(pv.FAULT_TYPES)).tolist()))}")
+    y = np.array(pv.FAULT_TYPES)[y]
+    try:
+        from sklearn.ensemble import GradientBoostingClassifier
+        model = GradientBoostingClassifier(n_estimators=50).fit(X, y)
+        pv.align_classes(model)
+        pv.models['gbm'] = pv.compile_tree_model(model)
+    except ImportError:
+        print('! scikit-learn not installed, skipping gbm')
+    try:
+        import lightgbm as lgb
+        model = lgb.LGBMClassifier(n_estimators=50, verbose=-1).fit(X, y)
+        pv.align_classes(model)
+        pv.models['lightgbm'] = pv.compile_tree_model(model)
+    except ImportError:
+        print('! lightgbm not installed, skipping lightgbm')
+
+
+def parse_fault_rates(values):
+    rates = dict(DEFAULT_FAULT_RATES)
+    for value in values or []:
+        name, _, rate = value.rpartition('=')
+        rates[name] = float(rate)
+    return rates
+
+
+def print_summary(result):
+    print(f"  {result['name']}: {result['readings']} readings in {result['elapsed_s']:.1f}s "
+          f"({result['achieved_rate']:.0f}/s, target {result['target_rate'] or 'max'}), "
+          f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  errors {result['errors']}")
+    accuracy = result['accuracy']
+    print(f"  accuracy {accuracy:.3f}" if accuracy is not None else "  accuracy n/a")
+    for name, detection in result['detection'].items():
+        mean = detection['readings_mean']
+        print(f"    {name:<18} {detection['detected']:>5}/{detection['episodes']:<5} episodes detected"
+              + (f", after {mean:.1f} readings / {detection['seconds']['p50_ms']:.1f} ms (p50)"
+                 if mean is not None else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a synthetic PV fleet against the service')
+    parser.add_argument('--url', help='send to a running server instead of the in-process app')
+    parser.add_argument('--synthetic-models', action='store_true',
+                        help='fit gbm / lightgbm on simulated readings first (in-process only)')
+    parser.add_argument('--mode', choices=['predict', 'batch', 'stream'], default='batch')
+    parser.add_argument('--model', default='gbm')
+    parser.add_argument('--threshold', type=float, help='cascade threshold (model cascade)')
+    parser.add_argument('--inverters', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=24, help='readings per inverter')
+    parser.add_argument('--rate', type=float, default=None, help='target readings/s (default: max)')
+    parser.add_argument('--batch-size', type=int, default=200, help='readings per request')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--fault-rate', action='append', metavar='FAULT=RATE',
+                        help='onset probability per step, e.g. "Short Circuit=0.01" (repeatable)')
+    parser.add_argument('--fault-duration', type=float, default=12, help='mean episode length in steps')
+    parser.add_argument('--step-minutes', type=float, default=5.0)
+    parser.add_argument('--start-hour', type=float, default=8.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='fleet_pv.json')
+    args = parser.parse_args()
+
+    fault_rates = parse_fault_rates(args.fault_rate)
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        if args.synthetic_models:
+            fit_models({name: 0.05 for name in fault_rates}, steps=40, inverters=500, seed=args.seed + 1)
+        else:
+            pv.load_models()
+        if not pv.model_available(args.model):
+            sys.exit(f'Model {args.model} not available: {pv.models.keys()}')
+        client = InProcessClient(pv.app)
+
+    sim = FleetSimulator(args.inverters, fault_rates=fault_rates, fault_duration=args.fault_duration,
+                         step_minutes=args.step_minutes, start_hour=args.start_hour, seed=args.seed)
+    result = replay(client, sim, args.steps, args.rate, mode=args.mode, model=args.model,
+                    batch_size=args.batch_size, concurrency=args.concurrency,
+                    threshold=args.threshold)
+    print_summary(result)
+    write_results(args.output, [result], dict(vars(args), fault_rates=fault_rates,
+                                              target='http' if args.url else 'in-process'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Per-inverter state for stateful streaming fault detection
+
+Every inverter that sends readings gets a slot holding its recurrent model
+state (e.g. the LSTM h/c of both layers), a ring buffer of its last `window`
+feature rows and its debounced fault state. All slots live in a few numpy
+arrays (grown by doubling up to the memory budget), so a batch of readings
+from many inverters costs one gather, one model step and one scatter.
+
+Fault states are debounced: an inverter only switches to a new class after
+`debounce` consecutive readings predicted it, and each switch is reported
+once as a transition.
+
+Inverters not seen for idle_ttl seconds are evicted; when the budget is full
+the least recently seen inverter makes room. An evicted inverter that comes
+back starts again from a zero state.
+
+The states are held in process memory. Under the pre-fork server each worker
+has its own InverterStates, so one inverter's readings are only stepped
+through a single state if they all reach the same worker.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+NO_STATE = -1
+
+# Rough per-inverter bookkeeping outside the arrays (dict entry, id string)
+SLOT_OVERHEAD_BYTES = 200
+
+
+class InverterStates:
+
+    def __init__(self, state_sizes, n_features, window=12, debounce=3, idle_ttl=3600.0,
+                 max_bytes=256 * 1024 * 1024, initial_slots=1024):
+        self.state_sizes = list(state_sizes)
+        self.n_features = n_features
+        self.window = window
+        self.debounce = max(1, debounce)
+        self.idle_ttl = idle_ttl
+        self.bytes_per_inverter = (4 * (sum(self.state_sizes) + window * n_features) +
+                                   8 + 5 * 4 + SLOT_OVERHEAD_BYTES)
+        self.max_inverters = max(1, max_bytes // self.bytes_per_inverter)
+
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()   # inverter id -> slot, least recently seen first
+        self._free = []
+        self._capacity = 0
+        self.states = [np.zeros((0, size), dtype=np.float32) for size in self.state_sizes]
+        self._window = np.zeros((0, window, n_features), dtype=np.float32)
+        self._window_pos = np.zeros(0, dtype=np.int32)
+        self._window_len = np.zeros(0, dtype=np.int32)
+        self._state = np.zeros(0, dtype=np.int32)
+        self._candidate = np.zeros(0, dtype=np.int32)
+        self._streak = np.zeros(0, dtype=np.int32)
+        self._readings = np.zeros(0, dtype=np.int64)
+        self._last_seen = np.zeros(0, dtype=np.float64)
+        self._grow(min(initial_slots, self.max_inverters))
+
+        self.steps = 0
+        self.transitions = 0
+        self.idle_evictions = 0
+        self.capacity_evictions = 0
+
+    def _grow(self, capacity):
+        extra = capacity - self._capacity
+
+        def pad(array, fill=0):
+            return np.concatenate((array, np.full((extra,) + array.shape[1:], fill, array.dtype)))
+
+        self.states = [pad(state) for state in self.states]
+        self._window = pad(self._window)
+        self._window_pos = pad(self._window_pos)
+        self._window_len = pad(self._window_len)
+        self._state = pad(self._state, NO_STATE)
+        self._candidate = pad(self._candidate, NO_STATE)
+        self._streak = pad(self._streak)
+        self._readings = pad(self._readings)
+        self._last_seen = pad(self._last_seen)
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _reset_slot(self, slot):
+        for state in self.states:
+            state[slot] = 0
+        self._window[slot] = 0
+        self._window_pos[slot] = 0
+        self._window_len[slot] = 0
+        self._state[slot] = NO_STATE
+        self._candidate[slot] = NO_STATE
+        self._streak[slot] = 0
+        self._readings[slot] = 0
+
+    def _evict_idle(self, now):
+        # Least recently seen first, so stop at the first inverter still active
+        cutoff = now - self.idle_ttl
+        while self._slots:
+            inverter_id, slot = next(iter(self._slots.items()))
+            if self._last_seen[slot] >= cutoff:
+                break
+            del self._slots[inverter_id]
+            self._free.append(slot)
+            self.idle_evictions += 1
+
+    def _acquire(self, inverter_id, now):
+        slot = self._slots.get(inverter_id)
+        if slot is not None:
+            self._slots.move_to_end(inverter_id)
+        else:
+            if not self._free and self._capacity < self.max_inverters:
+                self._grow(min(self.max_inverters, max(1, self._capacity * 2)))
+            if not self._free:
+                _evicted_id, evicted = self._slots.popitem(last=False)
+                self._free.append(evicted)
+                self.capacity_evictions += 1
+            slot = self._free.pop()
+            self._reset_slot(slot)
+            self._slots[inverter_id] = slot
+        self._last_seen[slot] = now
+        return slot
+
+    def step(self, inverter_ids, X, advance, now=None):
+        """
+        Feed one reading per row of X (feature rows, in arrival order) to the
+        inverters in inverter_ids. advance(X, states) -> (probabilities,
+        new_states) runs one model step for a batch of inverters given their
+        gathered states. Returns a dict of per-row arrays: prediction,
+        probabilities, state (debounced, NO_STATE until settled), transition
+        (previous state where it switched, else None) and window_mean.
+        """
+        now = time.time() if now is None else now
+        n = len(inverter_ids)
+        X = np.asarray(X, dtype=np.float32).reshape(n, self.n_features)
+        predictions = np.zeros(n, dtype=np.int64)
+        probabilities = None
+        states_out = np.zeros(n, dtype=np.int32)
+        switched = np.zeros(n, dtype=bool)
+        previous = np.zeros(n, dtype=np.int32)
+        window_mean = np.zeros((n, self.n_features), dtype=np.float32)
+
+        with self._lock:
+            if len(set(inverter_ids)) > self.max_inverters:
+                raise ValueError(f'{len(set(inverter_ids))} inverters in one batch exceed '
+                                 f'the limit of {self.max_inverters}')
+            self._evict_idle(now)
+            # Readings of the same inverter must run in order: the k-th
+            # reading of every inverter goes into wave k
+            slots = np.empty(n, dtype=np.intp)
+            waves = np.empty(n, dtype=np.intp)
+            seen = {}
+            for i, inverter_id in enumerate(inverter_ids):
+                slots[i] = self._acquire(inverter_id, now)
+                waves[i] = seen.get(inverter_id, 0)
+                seen[inverter_id] = waves[i] + 1
+
+            for wave in range(int(waves.max()) + 1 if n else 0):
+                rows = np.flatnonzero(waves == wave)
+                s = slots[rows]
+                probs, new_states = advance(X[rows], [state[s] for state in self.states])
+                probs = np.asarray(probs)
+                if probabilities is None:
+                    probabilities = np.zeros((n, probs.shape[1]), dtype=np.float64)
+                probabilities[rows] = probs
+                for state, new in zip(self.states, new_states):
+                    state[s] = new
+
+                # Rolling window (zeros past window_len, so the sum is exact)
+                self._window[s, self._window_pos[s]] = X[rows]
+                self._window_pos[s] = (self._window_pos[s] + 1) % self.window
+                self._window_len[s] = np.minimum(self._window_len[s] + 1, self.window)
+                window_mean[rows] = self._window[s].sum(axis=1) / self._window_len[s][:, None]
+
+                # Debounce: a new class must win `debounce` readings in a row
+                pred = probs.argmax(axis=1).astype(np.int32)
+                state = self._state[s]
+                same = pred == state
+                streak = np.where(same, 0, np.where(pred == self._candidate[s],
+                                                    self._streak[s] + 1, 1))
+                switch = streak >= self.debounce
+                self._state[s] = np.where(switch, pred, state)
+                self._candidate[s] = np.where(same | switch, NO_STATE, pred)
+                self._streak[s] = np.where(switch, 0, streak)
+                self._readings[s] += 1
+
+                predictions[rows] = pred
+                states_out[rows] = self._state[s]
+                switched[rows] = switch
+                previous[rows] = state
+            self.steps += n
+            self.transitions += int(switched.sum())
+
+        return {
+            'prediction': predictions,
+            'probabilities': probabilities,
+            'state': states_out,
+            'transition': [int(p) if sw else None for p, sw in zip(previous, switched)],
+            'window_mean': window_mean
+        }
+
+    def snapshot(self, inverter_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            slot = self._slots.get(inverter_id)
+            if slot is None:
+                return None
+            window_len = int(self._window_len[slot])
+            return {
+                'state': int(self._state[slot]),
+                'candidate': int(self._candidate[slot]),
+                'streak': int(self._streak[slot]),
+                'readings': int(self._readings[slot]),
+                'idle_seconds': now - float(self._last_seen[slot]),
+                'window_len': window_len,
+                'window_mean': (self._window[slot].sum(axis=0) / max(1, window_len)).tolist()
+            }
+
+    def reset(self, inverter_id):
+        """Forget an inverter; its next reading starts from a zero state"""
+        with self._lock:
+            slot = self._slots.pop(inverter_id, None)
+            if slot is None:
+                return False
+            self._free.append(slot)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inverters': len(self._slots),
+                'capacity': self._capacity,
+                'max_inverters': self.max_inverters,
+                'bytes_per_inverter': self.bytes_per_inverter,
+                'resident_bytes': self._capacity * self.bytes_per_inverter,
+                'steps': self.steps,
+                'transitions': self.transitions,
+                'idle_evictions': self.idle_evictions,
+                'capacity_evictions': self.capacity_evictions
+            }
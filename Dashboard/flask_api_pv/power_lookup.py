@@ -0,0 +1,177 @@
+"""
+Precomputed Power_Theo lookup table
+
+Power_Theo depends only on irradiance, temperature and the fixed PV
+parameters, so it is tabulated once on a dense irradiance x temperature grid
+and queries are answered by bilinear interpolation. The table is built with
+the exact solver, its interpolation error is measured at every cell centre
+and the grid is refined until that error is within max_error (W). Readings
+outside the grid are computed exactly.
+
+Tables are cached as .npz files named by a hash of the PV parameters and
+grid settings, so a changed PV_PARAMS never reuses a stale table.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Bump when the solver changes in a way the cache key cannot see
+TABLE_VERSION = 1
+
+
+def cache_key(params, irradiance_range, temperature_range, max_error):
+    spec = {
+        'version': TABLE_VERSION,
+        'params': params,
+        'irradiance': list(irradiance_range),
+        'temperature': list(temperature_range),
+        'max_error': max_error
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _axis(start, stop, step):
+    count = int(round((stop - start) / step)) + 1
+    return np.linspace(start, stop, count)
+
+
+class PowerTheoTable:
+
+    def __init__(self, irradiance, temperature, values, max_error=None):
+        self.irradiance = irradiance
+        self.temperature = temperature
+        self.values = values
+        self.max_error = max_error  # measured at cell centres
+        # Python-float copies for lookup_one
+        self._g_bounds = (float(irradiance[0]), float(irradiance[-1]))
+        self._t_bounds = (float(temperature[0]), float(temperature[-1]))
+        self._rows = values.tolist()
+
+    @classmethod
+    def build(cls, solver, irradiance, temperature):
+        G, T = np.meshgrid(irradiance, temperature, indexing='ij')
+        values = solver(G.ravel(), T.ravel()).reshape(G.shape)
+        return cls(irradiance, temperature, values)
+
+    def measure_error(self, solver):
+        """Largest |interpolated - exact| over the cell centres (bilinear's worst spot)"""
+        g = (self.irradiance[:-1] + self.irradiance[1:]) / 2
+        t = (self.temperature[:-1] + self.temperature[1:]) / 2
+        G, T = np.meshgrid(g, t, indexing='ij')
+        exact = solver(G.ravel(), T.ravel())
+        self.max_error = float(np.abs(self.interpolate(G.ravel(), T.ravel()) - exact).max())
+        return self.max_error
+
+    def interpolate(self, irradiance, temperature):
+        """Bilinear interpolation; inputs must lie inside the grid"""
+        g_axis, t_axis = self.irradiance, self.temperature
+        # Uniform axes: the cell index is arithmetic, no search needed
+        gi = (irradiance - g_axis[0]) / (g_axis[-1] - g_axis[0]) * (len(g_axis) - 1)
+        ti = (temperature - t_axis[0]) / (t_axis[-1] - t_axis[0]) * (len(t_axis) - 1)
+        g0 = np.clip(gi.astype(np.intp), 0, len(g_axis) - 2)
+        t0 = np.clip(ti.astype(np.intp), 0, len(t_axis) - 2)
+        fg = gi - g0
+        ft = ti - t0
+        v = self.values
+        return ((v[g0, t0] * (1 - ft) + v[g0, t0 + 1] * ft) * (1 - fg) +
+                (v[g0 + 1, t0] * (1 - ft) + v[g0 + 1, t0 + 1] * ft) * fg)
+
+    def lookup(self, irradiance, temperature, fallback):
+        """Interpolated Power_Theo; readings outside the grid (or NaN) go to fallback"""
+        irradiance = np.asarray(irradiance, dtype=np.float64).ravel()
+        temperature = np.asarray(temperature, dtype=np.float64).ravel()
+        inside = ((irradiance >= self.irradiance[0]) & (irradiance <= self.irradiance[-1]) &
+                  (temperature >= self.temperature[0]) & (temperature <= self.temperature[-1]))
+        if inside.all():
+            return self.interpolate(irradiance, temperature)
+        out = np.empty(len(irradiance))
+        out[inside] = self.interpolate(irradiance[inside], temperature[inside])
+        outside = ~inside
+        if outside.any():
+            out[outside] = fallback(irradiance[outside], temperature[outside])
+        return out
+
+    def lookup_one(self, irradiance, temperature, fallback):
+        """lookup() for one reading in plain Python; numpy overhead dominates at this size"""
+        g_axis, t_axis = self.irradiance, self.temperature
+        g_lo, g_hi = self._g_bounds
+        t_lo, t_hi = self._t_bounds
+        if not (g_lo <= irradiance <= g_hi and t_lo <= temperature <= t_hi):
+            return float(fallback(irradiance, temperature))
+        gi = (irradiance - g_lo) / (g_hi - g_lo) * (len(g_axis) - 1)
+        ti = (temperature - t_lo) / (t_hi - t_lo) * (len(t_axis) - 1)
+        g0 = min(int(gi), len(g_axis) - 2)
+        t0 = min(int(ti), len(t_axis) - 2)
+        fg = gi - g0
+        ft = ti - t0
+        row0, row1 = self._rows[g0], self._rows[g0 + 1]
+        return ((row0[t0] * (1 - ft) + row0[t0 + 1] * ft) * (1 - fg) +
+                (row1[t0] * (1 - ft) + row1[t0 + 1] * ft) * fg)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, irradiance=self.irradiance, temperature=self.temperature,
+                     values=self.values, max_error=self.max_error)
+        # Atomic, so concurrent processes never read a partial file
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['irradiance'], data['temperature'], data['values'],
+                       float(data['max_error']))
+
+    def info(self):
+        return {
+            'irradiance': [float(self.irradiance[0]), float(self.irradiance[-1]), len(self.irradiance)],
+            'temperature': [float(self.temperature[0]), float(self.temperature[-1]), len(self.temperature)],
+            'max_error': self.max_error
+        }
+
+
+def load_or_build(solver, params, irradiance_range, temperature_range, max_error,
+                  cache_dir=None, max_refinements=3):
+    """
+    Load the table for these settings from cache_dir, or build it: start from
+    the configured (start, stop, step) ranges and halve both steps until the
+    measured error is within max_error or max_refinements is reached.
+    """
+    key = cache_key(params, irradiance_range, temperature_range, max_error)
+    path = Path(cache_dir) / f'power_theo_{key}.npz' if cache_dir else None
+    if path is not None and path.exists():
+        try:
+            table = PowerTheoTable.load(path)
+            print(f"✓ Power_Theo table loaded from {path} (max error {table.max_error:.4f} W)")
+            return table
+        except Exception as e:
+            print(f"! Ignoring unreadable Power_Theo table {path}: {e}")
+
+    g_start, g_stop, g_step = irradiance_range
+    t_start, t_stop, t_step = temperature_range
+    for refinement in range(max_refinements + 1):
+        table = PowerTheoTable.build(solver, _axis(g_start, g_stop, g_step),
+                                     _axis(t_start, t_stop, t_step))
+        error = table.measure_error(solver)
+        if error <= max_error:
+            break
+        if refinement < max_refinements:
+            g_step /= 2
+            t_step /= 2
+    else:
+        print(f"! Power_Theo table error {error:.4f} W exceeds the {max_error} W bound")
+    print(f"✓ Power_Theo table built: {table.values.shape[0]}x{table.values.shape[1]}, "
+          f"max error {error:.4f} W")
+
+    if path is not None:
+        try:
+            table.save(path)
+        except OSError as e:
+            print(f"! Could not cache Power_Theo table: {e}")
+    return table
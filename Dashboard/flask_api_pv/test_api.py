@@ -1,6 +1,8 @@
 """
-Test script for PV API
+Smoke test script for PV API (see benchmark.py for load tests and benchmarks,
+and test_equivalence.py for the pytest suite that runs without a server)
 """
+import sys
 import requests
 import json
 
@@ -46,6 +48,22 @@ def test_predict():
     else:
         print(f"Error: {response.text}\n")
 
+def test_cascade():
+    """Test the confidence-gated model cascade"""
+    print("Testing model cascade...")
+    reading = {
+        "Irradiance": 1000, "Temperature": 25, "Current(A)": 30, "Power(W)": 18000,
+        "Voltage(V)": 600, "LoadCurrent(A)": 28.5, "LoadPower(W)": 17100, "LoadVoltage(V)": 588
+    }
+    for threshold in (0.5, 0.99):
+        payload = {"model": "cascade", "data": reading, "threshold": threshold}
+        response = requests.post(f"{BASE_URL}/predict", json=payload)
+        result = response.json()
+        print(f"threshold {threshold}: {response.status_code} stage={result.get('stage')} "
+              f"prediction={result.get('prediction')}")
+    response = requests.get(f"{BASE_URL}/health")
+    print(f"Counters: {json.dumps(response.json().get('cascade'), indent=2)}\n")
+
 def test_theoretical():
     """Test theoretical power calculation"""
     print("Testing theoretical power calculation...")
@@ -62,6 +80,59 @@ def test_theoretical():
     else:
         print(f"Error: {response.text}\n")
 
+def test_bulk_upload():
+    """Test chunked CSV upload scoring (per-row and per-interval)"""
+    print("Testing bulk upload endpoint...")
+    header = "Irradiance,Temperature,Current(A),Power(W),Voltage(V),LoadCurrent(A),LoadPower(W),LoadVoltage(V)"
+    rows = [f"{irr},25,{irr * 0.03},{irr * 18},600,{irr * 0.0285},{irr * 17.1},588"
+            for irr in range(0, 1000, 10)]
+    body = "\n".join([header] + rows)
+    
+    for query in ("model=gbm&chunk_rows=32", "model=gbm&chunk_rows=32&interval=25"):
+        response = requests.post(f"{BASE_URL}/batch_predict/upload?{query}", data=body,
+                                 headers={"Content-Type": "text/csv"}, stream=True)
+        print(f"Status: {response.status_code}")
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        print(f"Header: {lines[0]}")
+        print(f"First: {lines[1] if len(lines) > 2 else None}")
+        print(f"Last: {lines[-1]}\n")
+
+def test_stream_readings():
+    """Test stateful per-inverter streaming (debounced fault states)"""
+    print("Testing inverter streaming endpoint...")
+    reading = {
+        "Irradiance": 1000, "Temperature": 25, "Current(A)": 30, "Power(W)": 18000,
+        "Voltage(V)": 600, "LoadCurrent(A)": 28.5, "LoadPower(W)": 17100, "LoadVoltage(V)": 588
+    }
+    for step in range(4):
+        payload = {
+            "model": "lstm",
+            "readings": [dict(reading, inverter_id="INV-0001"),
+                         dict(reading, inverter_id="INV-0002", **{"Power(W)": 0})]
+        }
+        response = requests.post(f"{BASE_URL}/stream/readings", json=payload)
+        print(f"Step {step}: {response.status_code} {response.json()}")
+    response = requests.get(f"{BASE_URL}/stream/inverters/INV-0001?model=lstm")
+    print(f"State: {json.dumps(response.json(), indent=2)}\n")
+
+def test_compact_batch():
+    """Test compact /batch_predict responses (matrix layout, top-k, gzip)"""
+    print("Testing compact batch responses...")
+    reading = {
+        "Irradiance": 1000, "Temperature": 25, "Current(A)": 30, "Power(W)": 18000,
+        "Voltage(V)": 600, "LoadCurrent(A)": 28.5, "LoadPower(W)": 17100, "LoadVoltage(V)": 588
+    }
+    data = [dict(reading, **{"Power(W)": p}) for p in range(0, 18000, 90)]
+    for options in ({}, {"format": "matrix"}, {"format": "matrix", "top_k": 2}, {"top_k": 1}):
+        payload = dict(options, model="gbm", data=data)
+        response = requests.post(f"{BASE_URL}/batch_predict", json=payload,
+                                 headers={"Accept-Encoding": "gzip"})
+        result = response.json()
+        print(f"{options}: {response.status_code} {response.headers.get('Content-Encoding')} "
+              f"{len(response.content)} bytes; fault_types={result.get('fault_types')} "
+              f"first={result['predictions'][0]} {result['probabilities'][0] if 'probabilities' in result else ''}")
+    print()
+
 if __name__ == "__main__":
     print("="*50)
     print("PV API Test Suite")
@@ -72,8 +143,14 @@ if __name__ == "__main__":
         test_models()
         test_theoretical()
         test_predict()
+        test_cascade()
+        test_compact_batch()
+        test_bulk_upload()
+        test_stream_readings()
         print("All tests completed!")
     except requests.exceptions.ConnectionError:
         print("Error: Cannot connect to PV API. Make sure it's running on port 5002")
+        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,60 @@
+"""
+Tests of the bulk_score.py CLI on a small CSV (no server, synthetic model)
+
+    python -m pytest -q test_bulk_score.py
+"""
+
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as pv
+import bulk_score
+from benchmark import make_readings
+
+
+@pytest.fixture
+def readings_csv(tmp_path, monkeypatch):
+    """A 50-reading CSV, with load_models registering a small gbm"""
+    sklearn = pytest.importorskip('sklearn.ensemble')
+    rng = np.random.default_rng(0)
+    readings = pd.DataFrame(make_readings(rng, 50))
+    path = tmp_path / 'readings.csv'
+    readings.to_csv(path, index=False)
+
+    X = pv.feature_engineering(pd.DataFrame(make_readings(rng, 200)))[pv.FEATURES].values
+    gbm = sklearn.GradientBoostingClassifier(n_estimators=10).fit(
+        X, rng.integers(0, len(pv.FAULT_TYPES), len(X)))
+
+    def load_models():
+        pv.models['gbm'] = gbm
+    monkeypatch.setattr(pv, 'load_models', load_models)
+    return path
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['bulk_score.py', *map(str, args)])
+    bulk_score.main()
+
+
+def test_default_model_writes_every_reading(readings_csv, tmp_path, monkeypatch):
+    out = tmp_path / 'out.csv'
+    run_main(monkeypatch, readings_csv, '--chunk-rows', 16, '--out', out)
+    result = pd.read_csv(out)
+    assert result['index'].tolist() == list(range(50))
+    assert set(result['prediction']) <= set(pv.FAULT_TYPES)
+
+
+def test_cascade_intervals_on_stdout(readings_csv, monkeypatch, capsys):
+    run_main(monkeypatch, readings_csv, '--model', 'cascade', '--interval', 20)
+    summaries = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [s['rows'] for s in summaries] == [20, 20, 10]
+    assert [sum(s['decided'].values()) for s in summaries] == [20, 20, 10]
+
+
+def test_unknown_model_is_rejected(readings_csv, monkeypatch):
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, readings_csv, '--model', 'random_forest')
@@ -0,0 +1,162 @@
+"""
+Equivalence tests for the PV fast paths and response transports, and checks
+of the synthetic fleet (no server, synthetic models)
+
+    python -m pytest -q test_equivalence.py
+"""
+
+import io
+import json
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as pv
+from benchmark import make_readings, setup_models
+from fleet_sim import FleetSimulator
+from tree_ensemble import NUMBA_AVAILABLE, compile_ensemble
+
+ENGINES = ['native', 'numpy'] if NUMBA_AVAILABLE else ['numpy']
+
+
+def tree_cases():
+    """(reference predict_proba, model, test inputs) per installed tree library"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 10))
+    y = rng.integers(0, 5, 500)
+    X_missing = X.copy()
+    X_missing[rng.random(X.shape) < 0.05] = np.nan
+    X_test = rng.normal(size=(2000, 10))
+    X_test_missing = X_test.copy()
+    X_test_missing[rng.random(X_test.shape) < 0.1] = np.nan
+
+    cases = {}
+    try:
+        from sklearn.ensemble import GradientBoostingClassifier
+        gbm = GradientBoostingClassifier(n_estimators=50).fit(X, y)
+        cases['gbm'] = (gbm.predict_proba, gbm, X_test)
+    except ImportError:
+        pass
+    try:
+        import lightgbm as lgb
+        lgbm = lgb.LGBMClassifier(n_estimators=50, verbose=-1).fit(X_missing, y)
+        cases['lightgbm'] = (lgbm.predict_proba, lgbm, X_test_missing)
+    except ImportError:
+        pass
+    try:
+        import xgboost as xgb
+        booster = xgb.train({'objective': 'multi:softprob', 'num_class': 5},
+                            xgb.DMatrix(X_missing, label=y), 50)
+        cases['xgboost'] = (lambda data: booster.predict(xgb.DMatrix(data)), booster,
+                            X_test_missing)
+    except ImportError:
+        pass
+    return cases
+
+
+TREE_CASES = tree_cases()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', ['gbm', 'lightgbm', 'xgboost'])
+def test_tree_backend(name, engine):
+    """Compiled tree ensembles match the original libraries (NaN inputs included)"""
+    if name not in TREE_CASES:
+        pytest.skip(f'{name} library not installed')
+    reference, model, data = TREE_CASES[name]
+    expected = reference(data)
+    ensemble = compile_ensemble(model, engine=engine)
+    for rows in (1, 64, len(data)):
+        np.testing.assert_allclose(ensemble.predict_proba(data[:rows]), expected[:rows], atol=1e-6)
+
+
+def fast_feature_readings():
+    rng = random.Random(0)
+    readings = []
+    for i in range(500):
+        current, voltage = rng.uniform(-2, 35), rng.uniform(0, 700)
+        reading = {
+            'Irradiance': rng.uniform(0, 1800), 'Temperature': rng.uniform(-60, 100),
+            'Current(A)': current, 'Power(W)': current * voltage, 'Voltage(V)': voltage,
+            'LoadCurrent(A)': current * 0.95, 'LoadPower(W)': current * voltage * 0.93,
+            'LoadVoltage(V)': int(voltage * 0.98)
+        }
+        if i % 5 == 0:
+            reading['Power_Theo'] = rng.uniform(0, 5000)
+        readings.append(reading)
+    return readings
+
+
+@pytest.mark.parametrize('lookup', [True, False])
+def test_fast_features(lookup, monkeypatch):
+    """The pandas-free feature path gives exactly feature_engineering's matrix"""
+    monkeypatch.setitem(pv.POWER_THEO, 'lookup', lookup)
+    readings = fast_feature_readings()
+    for reading in readings:
+        np.testing.assert_array_equal(pv.fast_features(reading),
+                                      pv.feature_engineering(reading)[pv.FEATURES].values)
+    batch = [r for r in readings if 'Power_Theo' not in r][:pv.FAST_FEATURES_MAX_ROWS]
+    np.testing.assert_array_equal(pv.fast_features(batch),
+                                  pv.feature_engineering(batch)[pv.FEATURES].values)
+
+
+def test_fleet_fault_signatures():
+    """Synthetic fleet readings carry the electrical signature of their label"""
+    sim = FleetSimulator(2000, fault_rates={name: 0.02 for name in pv.FAULT_TYPES[1:]},
+                         start_hour=11, seed=0)
+    for _ in range(5):
+        batch = sim.step()
+    frame = pv.feature_engineering(batch['readings'])
+    labels = np.array(pv.FAULT_TYPES)[batch['labels']]
+    for name in pv.FAULT_TYPES:
+        assert (labels == name).sum() > 0, name
+    assert frame['Power_Ratio'][labels == 'Healthy'].between(0.85, 1.05).all()
+    assert (frame['Power(W)'][labels == 'No production'] == 0).all()
+    assert (frame['Current(A)'][labels == 'Open Circuit'] == 0).all()
+    assert frame['Power_Ratio'][labels == 'Partial Shadowing'].between(0.25, 0.75).all()
+    assert (frame['Voltage(V)'][labels == 'Short Circuit'] <
+            0.25 * frame['Voltage(V)'][labels == 'Healthy'].median()).all()
+
+
+def ndjson_records(response):
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[-1].get('done'), lines[-1]
+    return lines[0], lines[1:-1]
+
+
+@pytest.mark.parametrize('threshold', [0.3, 0.99])
+def test_cascade_transports_agree(threshold):
+    """Streamed and uploaded cascade results match /batch_predict, stage included"""
+    setup_models(True, np.random.default_rng(0))
+    readings = make_readings(np.random.default_rng(1), 40)
+    client = pv.app.test_client()
+    body = {'model': 'cascade', 'data': readings, 'threshold': threshold}
+
+    expected = client.post('/batch_predict', json=body).get_json()
+    assert expected['cascade']['threshold'] == threshold
+    expected_stages = [(r['prediction'], r['stage']) for r in expected['predictions']]
+
+    header, streamed = ndjson_records(client.post('/batch_predict', json=dict(
+        body, stream=True, chunk_rows=16)))
+    assert header['cascade'] == {'stages': expected['cascade']['stages'], 'threshold': threshold}
+    assert [(r['prediction'], r['stage']) for r in streamed] == expected_stages
+
+    csv = io.BytesIO(pd.DataFrame(readings).to_csv(index=False).encode())
+    header, uploaded = ndjson_records(client.post(
+        '/batch_predict/upload', query_string={'model': 'cascade', 'threshold': threshold,
+                                               'chunk_rows': 16},
+        data=csv, content_type='text/csv'))
+    assert header['cascade']['threshold'] == threshold
+    assert [(r['prediction'], r['stage']) for r in uploaded] == expected_stages
+
+    _header, matrix = ndjson_records(client.post('/batch_predict', json=dict(
+        body, stream=True, format='matrix')))
+    stages = expected['cascade']['stages']
+    assert [stages[i] for i in matrix[0]['stage']] == [stage for _p, stage in expected_stages]
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
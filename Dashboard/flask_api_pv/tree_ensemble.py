@@ -0,0 +1,449 @@
+"""
+Unified tree-ensemble inference for the PV tree models
+
+compile_ensemble() turns a fitted scikit-learn GradientBoostingClassifier,
+a LightGBM LGBMClassifier / Booster or an XGBoost Booster / XGBClassifier
+into one TreeEnsemble: the nodes of every tree concatenated into flat
+arrays with one batch-first predict_proba(). There is no per-call DMatrix
+or Dataset construction and no per-row Python work.
+
+Two engines evaluate the arrays:
+- 'native': numba-compiled kernels (when numba is installed). A few rows
+  walk each tree to their leaves; larger batches advance blocks of rows one
+  tree level at a time, over n_threads threads. Single rows take
+  microseconds.
+- 'numpy': all trees advance one level per NumPy step for small batches;
+  large batches go tree by tree over all rows.
+
+Splits follow each library exactly: scikit-learn compares float32 inputs
+with x <= threshold, LightGBM compares doubles with x <= threshold (with
+its None / Zero / NaN missing types), XGBoost compares float32 with
+x < threshold (stored as <= the next float32 below), and NaN goes to each
+node's default child. Models using
+anything else (categorical splits, custom init estimators, other
+objectives, dart) raise NotCompilable and keep their library runtime.
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# LightGBM's kZeroThreshold: |x| below this counts as zero for missing_type Zero
+ZERO_THRESHOLD = 1e-35
+
+# Batches up to this size advance all trees together in the numpy engine
+LEVELWISE_MAX_ROWS = 512
+
+# The native engine walks batches smaller than this row by row, larger ones
+# in blocks of NATIVE_BLOCK_ROWS (split over threads from PARALLEL_MIN_ROWS)
+NATIVE_ROW_WALK_MAX = 4
+NATIVE_BLOCK_ROWS = 256
+PARALLEL_MIN_ROWS = 1024
+
+
+class NotCompilable(Exception):
+    """The model uses a feature the vectorized backend does not implement"""
+
+
+if NUMBA_AVAILABLE:
+
+    @numba.njit(cache=True, nogil=True, inline='always')
+    def _go_right(x, node, threshold, nan_left, default_left, zero_missing, check_missing):
+        if check_missing:
+            if np.isnan(x):
+                return not nan_left[node]
+            if zero_missing[node] and abs(x) <= ZERO_THRESHOLD:
+                return not default_left[node]
+        return x > threshold[node]
+
+    @numba.njit(cache=True, nogil=True)
+    def _score_rows(X, feature, threshold, children, value, nan_left, default_left,
+                    zero_missing, roots, tree_class, tree_depth, check_missing, raw):
+        # One row at a time, each walk stopping at its own leaf
+        for i in range(X.shape[0]):
+            for t in range(roots.shape[0]):
+                node = roots[t]
+                while children[2 * node] != node:
+                    right = _go_right(X[i, feature[node]], node, threshold, nan_left,
+                                      default_left, zero_missing, check_missing)
+                    node = children[2 * node + np.intp(right)]
+                raw[i, tree_class[t]] += value[node]
+
+    @numba.njit(cache=True, nogil=True)
+    def _score_block(X, start, stop, feature, threshold, children, value, nan_left,
+                     default_left, zero_missing, roots, tree_class, tree_depth,
+                     check_missing, raw):
+        # All rows of the block advance one level of a tree together; the walks
+        # are independent, so the CPU overlaps their memory accesses
+        node = np.empty(stop - start, dtype=np.intp)
+        for t in range(roots.shape[0]):
+            node[:] = roots[t]
+            for _ in range(tree_depth[t]):
+                for j in range(stop - start):
+                    current = node[j]
+                    right = _go_right(X[start + j, feature[current]], current, threshold,
+                                      nan_left, default_left, zero_missing, check_missing)
+                    node[j] = children[2 * current + np.intp(right)]
+            column = tree_class[t]
+            for j in range(stop - start):
+                raw[start + j, column] += value[node[j]]
+
+    @numba.njit(cache=True, nogil=True)
+    def _score_blocks(X, block, feature, threshold, children, value, nan_left, default_left,
+                      zero_missing, roots, tree_class, tree_depth, check_missing, raw):
+        n = X.shape[0]
+        for start in range(0, n, block):
+            _score_block(X, start, min(start + block, n), feature, threshold, children,
+                         value, nan_left, default_left, zero_missing, roots, tree_class,
+                         tree_depth, check_missing, raw)
+
+    @numba.njit(cache=True, nogil=True, parallel=True)
+    def _score_blocks_parallel(X, block, feature, threshold, children, value, nan_left,
+                               default_left, zero_missing, roots, tree_class, tree_depth,
+                               check_missing, raw):
+        n = X.shape[0]
+        for b in numba.prange((n + block - 1) // block):
+            start = b * block
+            _score_block(X, start, min(start + block, n), feature, threshold, children,
+                         value, nan_left, default_left, zero_missing, roots, tree_class,
+                         tree_depth, check_missing, raw)
+
+
+class TreeEnsemble:
+    """
+    Flattened ensemble. Node arrays are indexed by global node id, a row goes
+    right when x > threshold (or by the missing-value rules) and a leaf points
+    to itself, so a row walked far enough lands on its leaf in every tree.
+    Tree t adds value[leaf] to raw score column tree_class[t].
+    """
+
+    def __init__(self, feature, threshold, children, value, nan_left, default_left,
+                 zero_missing, roots, tree_class, tree_depth, base, link, classes,
+                 input_dtype=np.float64, allow_nan=True, source=None,
+                 engine=None, n_threads=1):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children          # (2 * nodes,): left at 2i, right at 2i + 1
+        self.value = value
+        self.nan_left = nan_left
+        self.default_left = default_left
+        self.zero_missing = zero_missing  # LightGBM missing_type Zero nodes
+        self.has_zero_missing = bool(zero_missing.any())
+        self.roots = roots
+        self.tree_class = tree_class
+        self.tree_depth = tree_depth
+        self.depth = int(tree_depth.max())
+        self.base = np.asarray(base, dtype=np.float64)
+        self.link = link
+        self.classes_ = np.asarray(classes)
+        self.allow_nan = allow_nan
+        self.input_dtype = input_dtype
+        self.source = source
+        self.engine = engine or ('native' if NUMBA_AVAILABLE else 'numpy')
+        self.n_threads = n_threads
+        # One-hot tree -> raw column map, so the level-wise sum is one matmul
+        self.class_matrix = np.zeros((len(roots), len(self.base)))
+        self.class_matrix[np.arange(len(roots)), tree_class] = 1.0
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _advance(self, x, node, check_nan):
+        go_right = x > self.threshold[node]
+        if check_nan:
+            go_right = np.where(np.isnan(x), ~self.nan_left[node], go_right)
+        if self.has_zero_missing:
+            zero = self.zero_missing[node] & (np.abs(x) <= ZERO_THRESHOLD)
+            go_right = np.where(zero, ~self.default_left[node], go_right)
+        return self.children[2 * node + go_right]
+
+    def _numpy_scores(self, X, check_nan):
+        n, n_features = X.shape
+        flat = X.ravel()
+        row_offset = np.arange(n) * n_features
+        if n <= LEVELWISE_MAX_ROWS:
+            # All trees at once: per-call overhead is paid once per level
+            row_offset = row_offset[:, None]
+            node = np.broadcast_to(self.roots, (n, self.n_trees))
+            for _ in range(self.depth):
+                node = self._advance(flat[row_offset + self.feature[node]], node, check_nan)
+            return self.value[node] @ self.class_matrix + self.base
+        # One tree at a time keeps its nodes in cache and stops at its own depth
+        raw = np.tile(self.base, (n, 1))
+        for root, depth, column in zip(self.roots, self.tree_depth, self.tree_class):
+            node = np.full(n, root)
+            for _ in range(depth):
+                node = self._advance(flat[row_offset + self.feature[node]], node, check_nan)
+            raw[:, column] += self.value[node]
+        return raw
+
+    def _native_scores(self, X, check_nan):
+        raw = np.tile(self.base, (len(X), 1))
+        arrays = (self.feature, self.threshold, self.children, self.value, self.nan_left,
+                  self.default_left, self.zero_missing, self.roots, self.tree_class,
+                  self.tree_depth, check_nan or self.has_zero_missing, raw)
+        if len(X) <= NATIVE_ROW_WALK_MAX:
+            _score_rows(X, *arrays)
+        elif self.n_threads > 1 and len(X) >= PARALLEL_MIN_ROWS:
+            numba.set_num_threads(min(self.n_threads, numba.config.NUMBA_NUM_THREADS))
+            _score_blocks_parallel(X, NATIVE_BLOCK_ROWS, *arrays)
+        else:
+            _score_blocks(X, NATIVE_BLOCK_ROWS, *arrays)
+        return raw
+
+    def decision_function(self, X):
+        """Raw scores (margins), one column per output"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        if X.ndim == 1:
+            X = X[None, :]
+        check_nan = bool(np.isnan(X).any())
+        if check_nan and not self.allow_nan:
+            raise ValueError(f'Input X contains NaN ({self.source} model)')
+        if self.engine == 'native':
+            return self._native_scores(X, check_nan)
+        return self._numpy_scores(X, check_nan)
+
+    def predict_proba(self, X):
+        raw = self.decision_function(X)
+        if self.link == 'sigmoid':
+            p = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        raw -= raw.max(axis=1, keepdims=True)
+        np.exp(raw, out=raw)
+        raw /= raw.sum(axis=1, keepdims=True)
+        return raw
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def info(self):
+        return {
+            'source': self.source,
+            'engine': self.engine,
+            'trees': self.n_trees,
+            'nodes': self.n_nodes,
+            'depth': self.depth,
+            'threads': self.n_threads
+        }
+
+
+class _Builder:
+    """Collects trees given as per-tree node arrays (children -1 at leaves)"""
+
+    def __init__(self):
+        self.parts = []
+        self.offset = 0
+        self.roots = []
+        self.tree_class = []
+        self.tree_depth = []
+
+    def add(self, tree_class, feature, threshold, left, right, value, nan_left,
+            default_left=None, zero_missing=None):
+        n = len(feature)
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        leaf = left < 0
+        own = np.arange(n)
+        left = np.where(leaf, own, left)
+        right = np.where(leaf, own, right)
+        children = np.empty(2 * n, dtype=np.intp)
+        children[0::2] = left + self.offset
+        children[1::2] = right + self.offset
+        if default_left is None:
+            default_left = nan_left
+        if zero_missing is None:
+            zero_missing = np.zeros(n, dtype=bool)
+        self.parts.append((
+            np.where(leaf, 0, feature).astype(np.intp),
+            np.where(leaf, np.inf, threshold).astype(np.float64),
+            children,
+            np.where(leaf, value, 0.0).astype(np.float64),
+            np.asarray(nan_left, dtype=bool),
+            np.asarray(default_left, dtype=bool),
+            np.asarray(zero_missing, dtype=bool)
+        ))
+        self.roots.append(self.offset)
+        self.tree_class.append(tree_class)
+        self.tree_depth.append(_tree_depth(left, right, leaf))
+        self.offset += n
+
+    def build(self, **kwargs):
+        if not self.parts:
+            raise NotCompilable('model has no trees')
+        columns = [np.concatenate(column) for column in zip(*self.parts)]
+        return TreeEnsemble(
+            *columns,
+            roots=np.array(self.roots, dtype=np.intp),
+            tree_class=np.array(self.tree_class, dtype=np.intp),
+            tree_depth=np.array(self.tree_depth, dtype=np.intp),
+            **kwargs)
+
+
+def _tree_depth(left, right, leaf):
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, d = stack.pop()
+        if leaf[node]:
+            depth = max(depth, d)
+        else:
+            stack.append((left[node], d + 1))
+            stack.append((right[node], d + 1))
+    return depth
+
+
+def _from_sklearn(model):
+    from sklearn.dummy import DummyClassifier
+
+    if getattr(model, 'loss', 'log_loss') not in ('log_loss', 'deviance'):
+        raise NotCompilable(f'loss {model.loss!r}')
+    if not (model.init_ == 'zero' or isinstance(model.init_, DummyClassifier)):
+        raise NotCompilable('custom init estimator')
+    # Constant for the prior / zero init, so one probe row gives the base score
+    probe = np.zeros((1, model.n_features_in_), dtype=np.float32)
+    base = model._raw_predict_init(probe)[0]
+
+    builder = _Builder()
+    n_iter, n_outputs = model.estimators_.shape
+    for i in range(n_iter):
+        for k in range(n_outputs):
+            tree = model.estimators_[i, k].tree_
+            builder.add(k, tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                        tree.value[:, 0, 0] * model.learning_rate,
+                        np.zeros(tree.node_count, dtype=bool))
+    # GradientBoostingClassifier rejects NaN inputs, so the compiled model does too
+    return builder.build(base=base, link='sigmoid' if n_outputs == 1 else 'softmax',
+                         classes=model.classes_, input_dtype=np.float32, allow_nan=False,
+                         source='sklearn')
+
+
+def _from_lightgbm(model):
+    booster = getattr(model, 'booster_', model)
+    dump = booster.dump_model()
+    objective = dump['objective'].split()
+    n_outputs = dump['num_tree_per_iteration']
+    if dump.get('average_output'):
+        raise NotCompilable('random forest mode')
+    scale = 1.0
+    if objective[0] == 'multiclass':
+        link = 'softmax'
+    elif objective[0] == 'binary':
+        link = 'sigmoid'
+        for option in objective[1:]:
+            if option.startswith('sigmoid:'):
+                scale = float(option.split(':', 1)[1])
+    else:
+        raise NotCompilable(f'objective {dump["objective"]!r}')
+
+    builder = _Builder()
+    for i, info in enumerate(dump['tree_info']):
+        nodes = []  # pre-order: [feature, threshold, left, right, value, nan_left, default_left, zero]
+        stack = [(info['tree_structure'], None, None)]
+        while stack:
+            node, parent, side = stack.pop()
+            index = len(nodes)
+            if parent is not None:
+                nodes[parent][side] = index
+            if 'leaf_value' in node:
+                nodes.append([0, 0.0, -1, -1, node['leaf_value'] * scale, False, False, False])
+                continue
+            if node['decision_type'] != '<=':
+                raise NotCompilable('categorical split')
+            missing_type = node.get('missing_type', 'None')
+            default_left = bool(node['default_left'])
+            threshold = float(node['threshold'])
+            # NaN is the default child for NaN/Zero types, and compared as 0.0 for None
+            nan_left = default_left if missing_type in ('NaN', 'Zero') else 0.0 <= threshold
+            nodes.append([node['split_feature'], threshold, -1, -1, 0.0, nan_left, default_left,
+                          missing_type == 'Zero'])
+            stack.append((node['right_child'], index, 3))
+            stack.append((node['left_child'], index, 2))
+        columns = list(zip(*nodes))
+        builder.add(i % n_outputs, columns[0], columns[1], columns[2], columns[3], columns[4],
+                    columns[5], default_left=columns[6], zero_missing=columns[7])
+
+    # The binary sigmoid scale applies to the raw score, folded into the leaves above
+    classes = getattr(model, 'classes_', np.arange(max(2, n_outputs)))
+    return builder.build(base=np.zeros(n_outputs), link=link, classes=classes,
+                         input_dtype=np.float64, source='lightgbm')
+
+
+def _from_xgboost(model):
+    import xgboost as xgb
+
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    objective = learner['objective']['name']
+    if objective == 'multi:softprob':
+        link = 'softmax'
+    elif objective == 'binary:logistic':
+        link = 'sigmoid'
+    else:
+        raise NotCompilable(f'objective {objective!r}')
+    gbm = learner['gradient_booster']
+    if gbm['name'] != 'gbtree':
+        raise NotCompilable(f'booster {gbm["name"]!r}')
+
+    builder = _Builder()
+    trees = gbm['model']['trees']
+    for tree, tree_class in zip(trees, gbm['model']['tree_info']):
+        if any(tree.get('split_type', [])):
+            raise NotCompilable('categorical split')
+        left = np.array(tree['left_children'])
+        # Leaves keep their value in split_conditions
+        conditions = np.array(tree['split_conditions'], dtype=np.float32)
+        # XGBoost goes left when x < t on float32; for float32 x that is
+        # x <= the next float32 below t, the x <= threshold rule used here
+        threshold = np.nextafter(conditions, np.float32(-np.inf)).astype(np.float64)
+        default_left = np.array(tree['default_left'], dtype=bool)
+        builder.add(tree_class, tree['split_indices'], threshold, left, tree['right_children'],
+                    np.where(left < 0, conditions.astype(np.float64), 0.0), default_left)
+
+    n_outputs = int(learner['learner_model_param']['num_class']) or 1
+    ensemble = builder.build(base=np.zeros(n_outputs), link=link,
+                             classes=getattr(model, 'classes_', np.arange(max(2, n_outputs))),
+                             input_dtype=np.float32, source='xgboost')
+    # base_score is stored differently across versions; measure it on one row instead
+    probe = np.zeros((1, booster.num_features()), dtype=np.float32)
+    dprobe = xgb.DMatrix(probe, feature_names=booster.feature_names,
+                         feature_types=booster.feature_types)
+    margin = booster.predict(dprobe, output_margin=True).reshape(1, -1)
+    ensemble.base = (margin - ensemble.decision_function(probe))[0].astype(np.float64)
+    return ensemble
+
+
+def compile_ensemble(model, engine=None, n_threads=1):
+    """
+    TreeEnsemble equivalent to model.predict_proba (Booster.predict for
+    XGBoost). engine is 'native' (default when numba is installed) or 'numpy'.
+    """
+    if engine not in (None, 'native', 'numpy'):
+        raise ValueError(f'unknown engine {engine!r}')
+    if engine == 'native' and not NUMBA_AVAILABLE:
+        raise NotCompilable("engine 'native' needs numba")
+    module = type(model).__module__
+    if module.startswith('sklearn'):
+        ensemble = _from_sklearn(model)
+    elif module.startswith('lightgbm'):
+        ensemble = _from_lightgbm(model)
+    elif module.startswith('xgboost'):
+        ensemble = _from_xgboost(model)
+    else:
+        raise NotCompilable(f'unsupported model type {type(model).__name__}')
+    if engine is not None:
+        ensemble.engine = engine
+    ensemble.n_threads = n_threads
+    # Compile (or load the cached) kernel now rather than on the first request
+    ensemble.decision_function(np.zeros((1, ensemble.feature.max() + 1)))
+    return ensemble